@@ -8,11 +8,16 @@ import xml.etree.ElementTree as ET
 from datetime import datetime, date, timedelta
 import tempfile
 import io
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import sys
 import logging
 
+# Adiciona o diretório pai ao path para importar os módulos compartilhados
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailer import SMTPPool, build_html_message
+from email_templates import DigestRenderer
+from ratelimit import get_inlabs_policy
+
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -146,14 +151,15 @@ def get_all_email_terms():
     return email_terms
 
 def is_valid_zip_content(content):
-    """Check if content is a valid ZIP file by checking its signature."""
+    """Check if content is a ZIP: signature and central directory (CRCs are checked on extraction)."""
+    from zipstore import verify_zip_bytes
     try:
-        if len(content) < 4:
-            return False
-        signature = content[:4]
-        return signature.startswith(b'PK')
+        valid, reason = verify_zip_bytes(content)
     except Exception:
         return False
+    if not valid:
+        logger.debug(f"Invalid ZIP content ({len(content)} bytes): {reason}")
+    return valid
 
 def create_inlabs_session():
     """Create and login to INLABS session."""
@@ -166,7 +172,7 @@ def create_inlabs_session():
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
         session = requests.Session()
-        response = session.post(URL_LOGIN, data=payload, headers=headers, timeout=30)
+        response = get_inlabs_policy().call(session.post, URL_LOGIN, data=payload, headers=headers, timeout=30)
         
         if session.cookies.get('inlabs_session_cookie'):
             logger.info("INLABS login successful")
@@ -187,7 +193,7 @@ def try_download_for_date(session, data_completa, sections):
         url_arquivo = f"{URL_DOWNLOAD}{data_completa}&dl={data_completa}-{dou_secao}.zip"
         
         try:
-            response = session.get(url_arquivo, timeout=60)
+            response = get_inlabs_policy().call(session.get, url_arquivo, timeout=60)
             
             if response.status_code == 200:
                 if is_valid_zip_content(response.content):
@@ -247,7 +253,7 @@ def download_dou_xml(sections=None, max_fallback_days=2):
         raise
 
 def extract_articles(zip_data):
-    """Extract articles from ZIP data."""
+    """Extract articles from ZIP data; a section whose ZIP has corrupt members is rejected."""
     articles = []
     
     try:
@@ -255,6 +261,8 @@ def extract_articles(zip_data):
         for section, zip_bytes in zip_data.items():
             logger.info(f"Processing section: {section}, ZIP size: {len(zip_bytes)} bytes")
             
+            section_start = len(articles)
+            corrupt = 0
             try:
                 with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zip_ref:
                     all_files = zip_ref.namelist()
@@ -292,8 +300,14 @@ def extract_articles(zip_data):
                                 logger.info(f"Successfully extracted text from {xml_filename}")
                         except ET.ParseError as e:
                             logger.error(f"XML parsing error in {xml_filename}: {e}")
+                        except zipfile.BadZipFile as e:
+                            corrupt += 1
+                            logger.error(f"Corrupt member {xml_filename}: {e}")
                         except Exception as e:
                             logger.error(f"Error processing {xml_filename}: {e}")
+                if corrupt:
+                    logger.error(f"{corrupt} corrupt member(s) in {section}; rejecting the section's ZIP")
+                    del articles[section_start:]
             except zipfile.BadZipFile as e:
                 logger.error(f"Bad ZIP file for section {section}: {e}")
             except Exception as e:
@@ -404,235 +418,38 @@ def find_matches(search_terms):
         logger.error(f"Error in find_matches: {e}")
         return [], stats
 
-def send_email_html(recipient, subject, html_body):
-    """Send HTML email."""
+def get_smtp_pool(size=1):
+    """Pool of authenticated SMTP connections, reused for a whole batch of sends."""
+    return SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS, size=size)
+
+def send_email_html(recipient, subject, html_body, pool=None):
+    """Send HTML email. Pass a pool from get_smtp_pool() when sending a batch."""
     if not (SMTP_SERVER and SMTP_PORT and SMTP_USER and SMTP_PASS):
         logger.error("SMTP environment variables not fully configured.")
         return False
     
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = SMTP_USER
-    msg['To'] = recipient
-    msg.attach(MIMEText(html_body, 'html'))
+    msg = build_html_message(SMTP_USER, recipient, subject, html_body)
     
     try:
-        if SMTP_PORT == 465:
-            server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT)
+        if pool is None:
+            with get_smtp_pool() as single_pool:
+                single_pool.send(SMTP_USER, recipient, msg.as_string())
         else:
-            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-            server.ehlo()
-            try:
-                server.starttls()
-                server.ehlo()
-            except Exception as e:
-                logger.warning(f"STARTTLS not available/failed: {e}")
-        
-        server.login(SMTP_USER, SMTP_PASS)
-        server.sendmail(SMTP_USER, recipient, msg.as_string())
-        server.quit()
+            pool.send(SMTP_USER, recipient, msg.as_string())
         logger.info(f"Email sent to {recipient}")
         return True
     except Exception as e:
         logger.error(f"Email send failed for {recipient}: {e}")
-        try:
-            server.quit()
-        except Exception:
-            pass
         return False
 
-def format_email_body_html(email, date_str, matches):
-    """Format email body as HTML."""
-    if not matches:
-        return f"""
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>DOU Notificações - {date_str}</title>
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }}
-                .container {{ max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; }}
-                .content {{ padding: 30px; }}
-                .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666; border-top: 1px solid #eee; }}
-                .no-results {{ text-align: center; padding: 40px; color: #666; }}
-                .icon {{ font-size: 48px; margin-bottom: 20px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1 style="margin: 0; font-size: 28px;">📋 DOU Notificações</h1>
-                    <p style="margin: 10px 0 0 0; opacity: 0.9; font-size: 16px;">{date_str}</p>
-                </div>
-                <div class="content">
-                    <p style="font-size: 18px; margin-bottom: 20px;">Olá <strong>{email}</strong>,</p>
-                    <div class="no-results">
-                        <div class="icon">🔍</div>
-                        <p style="font-size: 16px; margin: 0;">Nenhuma ocorrência encontrada hoje no DOU para os seus termos de monitoramento.</p>
-                        <p style="font-size: 14px; color: #888; margin-top: 10px;">Continue monitorando - notificaremos você assim que houver novidades!</p>
-                    </div>
-                </div>
-                <div class="footer">
-                    <p style="margin: 0;">🤖 Sistema Automático de Monitoramento DOU</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    
-    # Calculate statistics
-    total_terms_found = sum(len(m.get('terms_matched', [])) for m in matches)
-    sections = set(m.get('article', {}).get('section', 'N/A') for m in matches)
-    sections_list = ', '.join(sorted(sections))
-    
-    # Header with complete style
-    html_parts = [f"""
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>DOU Notificações - {date_str}</title>
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }}
-                .container {{ max-width: 900px; margin: 0 auto; background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; }}
-                .content {{ padding: 30px; }}
-                .stats {{ background: #f8f9fa; border-radius: 8px; padding: 20px; margin: 20px 0; display: flex; justify-content: space-around; text-align: center; }}
-                .stat-item {{ flex: 1; }}
-                .stat-number {{ font-size: 24px; font-weight: bold; color: #667eea; display: block; }}
-                .stat-label {{ font-size: 12px; color: #666; text-transform: uppercase; letter-spacing: 1px; }}
-                .match-item {{ border: 1px solid #e1e8ed; border-radius: 8px; padding: 20px; margin: 20px 0; background: #fafbfc; }}
-                .match-header {{ background: #667eea; color: white; padding: 15px; margin: -20px -20px 15px -20px; border-radius: 8px 8px 0 0; }}
-                .match-title {{ font-size: 18px; font-weight: bold; margin: 0; }}
-                .match-subtitle {{ font-size: 14px; opacity: 0.9; margin: 5px 0 0 0; }}
-                .terms-badge {{ display: inline-block; background: #28a745; color: white; padding: 4px 8px; border-radius: 4px; font-size: 12px; margin: 2px; }}
-                .snippet {{ background: #fff; border-left: 4px solid #667eea; padding: 15px; margin: 10px 0; border-radius: 0 4px 4px 0; font-style: italic; color: #555; }}
-                .metadata {{ display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin: 15px 0; }}
-                .metadata-item {{ background: white; padding: 10px; border-radius: 4px; border: 1px solid #eee; }}
-                .metadata-label {{ font-size: 12px; color: #666; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 5px; }}
-                .metadata-value {{ font-weight: 600; color: #333; }}
-                .summary-section {{ background: white; border-radius: 6px; padding: 15px; margin: 15px 0; border: 1px solid #e1e8ed; }}
-                .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666; border-top: 1px solid #eee; }}
-                .highlight {{ background-color: #fff3cd; padding: 2px 4px; border-radius: 2px; }}
-                @media (max-width: 600px) {{
-                    .stats {{ flex-direction: column; }}
-                    .metadata {{ grid-template-columns: 1fr; }}
-                    .container {{ margin: 10px; }}
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1 style="margin: 0; font-size: 28px;">📋 DOU Notificações</h1>
-                    <p style="margin: 10px 0 0 0; opacity: 0.9; font-size: 16px;">{date_str}</p>
-                </div>
-                <div class="content">
-                    <p style="font-size: 18px; margin-bottom: 20px;">Olá <strong>{email}</strong>,</p>
-
-                    <div class="stats">
-                        <div class="stat-item">
-                            <span class="stat-number">{len(matches)}</span>
-                            <span class="stat-label">Ocorrências</span>
-                        </div>
-                        <div class="stat-item">
-                            <span class="stat-number">{total_terms_found}</span>
-                            <span class="stat-label">Termos Encontrados</span>
-                        </div>
-                        <div class="stat-item">
-                            <span class="stat-number">{len(sections)}</span>
-                            <span class="stat-label">Seções DOU</span>
-                        </div>
-                    </div>
-
-                    <p style="color: #28a745; font-weight: 600; text-align: center; margin: 20px 0;">
-                        ✅ Foram encontradas <strong>{len(matches)} ocorrência(s)</strong> hoje nas seções: <em>{sections_list}</em>
-                    </p>
-    """]
-    
-    # Iterate through matches
-    for i, m in enumerate(matches, 1):
-        art = m.get('article', {})
-        terms = m.get('terms_matched', [])
-        summary = m.get('summary', 'Resumo não disponível')
-        snippets = m.get('snippets', [])
-        
-        # Article information
-        filename = art.get('filename', 'Arquivo não identificado')
-        section = art.get('section', 'Seção não especificada')
-        xml_path = art.get('xml_path', '')
-        
-        # Terms badges
-        terms_badges = ''.join([f'<span class="terms-badge">{term}</span>' for term in terms])
-        
-        # Structured metadata
-        metadata_html = f"""
-        <div class="metadata">
-            <div class="metadata-item">
-                <div class="metadata-label">Arquivo XML</div>
-                <div class="metadata-value">{filename}</div>
-            </div>
-            <div class="metadata-item">
-                <div class="metadata-label">Seção DOU</div>
-                <div class="metadata-value">{section}</div>
-            </div>
-        </div>
-        """
-        
-        # Highlighted snippets
-        snippets_html = ""
-        if snippets:
-            snippets_html = "<div style='margin: 15px 0;'><strong>📄 Trechos relevantes:</strong></div>"
-            for idx, snippet in enumerate(snippets[:3], 1):  # Maximum 3 snippets
-                # Highlight found terms in snippet
-                highlighted_snippet = snippet
-                for term in terms:
-                    highlighted_snippet = highlighted_snippet.replace(
-                        term, f'<span class="highlight"><strong>{term}</strong></span>'
-                    )
-                snippets_html += f'<div class="snippet"><strong>Trecho {idx}:</strong> {highlighted_snippet}</div>'
-        
-        # Match section
-        html_parts.append(f"""
-        <div class="match-item">
-            <div class="match-header">
-                <div class="match-title">📄 {i}. {filename}</div>
-                <div class="match-subtitle">{section}</div>
-            </div>
-
-            <div style="margin: 15px 0;">
-                <strong>🔍 Termos encontrados:</strong><br>
-                {terms_badges}
-            </div>
-
-            {metadata_html}
-
-            <div class="summary-section">
-                <strong>📝 Resumo:</strong><br>
-                <div style="margin-top: 10px; color: #555;">{summary}</div>
-            </div>
-
-            {snippets_html}
-
-            {f'<div style="margin-top: 15px; font-size: 12px; color: #666;"><strong>🔗 Arquivo:</strong> {xml_path}</div>' if xml_path else ''}
-        </div>
-        """)
-    
-    # Footer
-    html_parts.extend([
-        """
-                </div>
-                <div class="footer">
-                    <p style="margin: 0; font-size: 14px;">🤖 <strong>Sistema Automático de Monitoramento DOU</strong></p>
-                    <p style="margin: 5px 0 0 0; font-size: 12px;">Monitoramento ativo • Notificações em tempo real • Powered by FiscalDOU</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    ])
-    
-    return ''.join(html_parts)
+def format_email_body_html(email, date_str, matches, renderer=None):
+    """
+    Format email body as HTML.
+
+    Pass one email_templates.DigestRenderer for a whole batch so each
+    article block is rendered once and reused across recipients.
+    """
+    return (renderer or DigestRenderer()).render(email, date_str, matches)
 
 # Rotas da aplicação
 @app.route('/')
@@ -698,37 +515,42 @@ def cron_daily():
         per_email = []
         
         # If any email has terms, run search once per unique term set? We run per email to respect per-user terms
-        for email in emails:
-            terms = get_email_terms(email)
-            if not terms:
-                per_email.append({'email': email, 'status': 'no-terms', 'matches': 0})
-                continue
-            
-            matches, stats = find_matches(terms)
-            
-            # Summaries (use AI if key configured; summarize.py falls back gracefully)
-            try:
-                from summarize import summarize_matches
-                summarized = summarize_matches(matches)
-            except Exception as e:
-                logger.warning(f"Summarization failed, sending without summaries: {e}")
-                summarized = matches
-            
-            # Prepare and possibly send
-            html = format_email_body_html(email, date_str, summarized)
-            dry_run = request.args.get('dry') == '1'
-            
-            sent_ok = True if dry_run else send_email_html(email, f"DOU Notificações - {date_str}", html)
-            if sent_ok:
-                total_sent += 1 if not dry_run else 0
-                per_email.append({'email': email, 'status': 'sent' if not dry_run else 'dry', 'matches': len(summarized), 'stats': stats})
-            else:
-                per_email.append({'email': email, 'status': 'send-failed', 'matches': len(summarized)})
+        # All recipients share the same authenticated SMTP connection and rendered article blocks
+        renderer = DigestRenderer()
+        with get_smtp_pool() as smtp_pool:
+            for email in emails:
+                terms = get_email_terms(email)
+                if not terms:
+                    per_email.append({'email': email, 'status': 'no-terms', 'matches': 0})
+                    continue
+                
+                matches, stats = find_matches(terms)
+                
+                # Summaries (use AI if key configured; summarize.py falls back gracefully)
+                try:
+                    from summarize import summarize_matches
+                    summarized = summarize_matches(matches)
+                except Exception as e:
+                    logger.warning(f"Summarization failed, sending without summaries: {e}")
+                    summarized = matches
+                
+                # Prepare and possibly send
+                html = format_email_body_html(email, date_str, summarized, renderer=renderer)
+                dry_run = request.args.get('dry') == '1'
+                
+                sent_ok = True if dry_run else send_email_html(email, f"DOU Notificações - {date_str}", html, pool=smtp_pool)
+                if sent_ok:
+                    total_sent += 1 if not dry_run else 0
+                    per_email.append({'email': email, 'status': 'sent' if not dry_run else 'dry', 'matches': len(summarized), 'stats': stats})
+                else:
+                    per_email.append({'email': email, 'status': 'send-failed', 'matches': len(summarized)})
+            smtp_stats = smtp_pool.stats
         
         return ({
             'ok': True,
             'isCron': is_cron,
             'sent': total_sent,
+            'smtp': smtp_stats,
             'details': per_email
         }, 200)
     except Exception as e:
@@ -4,11 +4,15 @@ import os
 import json
 import re
 import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import sys
 from datetime import datetime, date, timedelta
 from pathlib import Path
+
+# Adiciona o diretório pai ao path para importar os módulos compartilhados
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailer import SMTPPool, build_html_message
+from ratelimit import get_inlabs_policy
 # import zipfile
 # import xml.etree.ElementTree as ET
 
@@ -164,7 +168,7 @@ def create_inlabs_session():
     }
     s = requests.Session()
     try:
-        response = s.post(URL_LOGIN, data=payload, headers=headers)
+        response = get_inlabs_policy().call(s.post, URL_LOGIN, data=payload, headers=headers, timeout=30)
         if s.cookies.get('inlabs_session_cookie'):
             return s
         else:
@@ -194,7 +198,7 @@ def download_dou_xml(target_date=None, sections=None):
                 'origem': '736372697074'
             }
 
-            response = s.request("GET", url_arquivo, headers=cabecalho_arquivo)
+            response = get_inlabs_policy().call(s.request, "GET", url_arquivo, headers=cabecalho_arquivo, timeout=60)
 
             if response.status_code == 200 and response.content.startswith(b'PK'):
                 downloaded_content.append({
@@ -294,8 +298,12 @@ def search_dou_real(search_terms=None, use_cache=True):
         print(f"Search error: {e}")
         return []
 
-def send_email_notification(email, matches):
-    """Send email notification for matches."""
+def get_smtp_pool(size=1):
+    """Pool of authenticated SMTP connections, reused for a whole batch of sends."""
+    return SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS, size=size)
+
+def send_email_notification(email, matches, pool=None):
+    """Send email notification for matches. Pass a pool when sending a batch."""
     if not SMTP_USER or not SMTP_PASS:
         return False
 
@@ -336,17 +344,13 @@ def send_email_notification(email, matches):
         </html>
         """
 
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = SMTP_USER
-        msg['To'] = email
-        msg.attach(MIMEText(body, 'html'))
+        msg = build_html_message(SMTP_USER, email, subject, body)
 
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASS)
-        server.send_message(msg)
-        server.quit()
+        if pool is None:
+            with get_smtp_pool() as single_pool:
+                single_pool.send_message(msg)
+        else:
+            pool.send_message(msg)
 
         return True
     except Exception as e:
@@ -455,9 +459,10 @@ class handler(BaseHTTPRequestHandler):
 
             # Send notifications to all registered emails
             if matches and emails:
-                for email in emails:
-                    if send_email_notification(email, matches):
-                        sent_count += 1
+                with get_smtp_pool() as smtp_pool:
+                    for email in emails:
+                        if send_email_notification(email, matches, pool=smtp_pool):
+                            sent_count += 1
 
             response = {
                 'ok': True,
@@ -652,9 +657,10 @@ class handler(BaseHTTPRequestHandler):
                 try:
                     matches = search_dou_real()
                     sent_count = 0
-                    for em in current_emails:
-                        if send_email_notification(em, matches):
-                            sent_count += 1
+                    with get_smtp_pool() as smtp_pool:
+                        for em in current_emails:
+                            if send_email_notification(em, matches, pool=smtp_pool):
+                                sent_count += 1
 
                     if matches:
                         message = f"📧 Emails enviados para {sent_count} endereços! {len(matches)} ocorrência(s) encontrada(s)"
@@ -1,4 +1,4 @@
-from flask import Flask, request, render_template_string, jsonify
+from flask import Flask, request, render_template_string, jsonify, g, has_request_context
 import os
 import re
 import requests
@@ -7,10 +7,23 @@ import zipfile
 import xml.etree.ElementTree as ET
 from datetime import datetime, date, timedelta
 import tempfile
-import io
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import sys
+import time
+
+# Adiciona o diretório pai ao path para importar os módulos compartilhados
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailer import SMTPPool, build_html_message
+from dispatcher import NotificationDispatcher
+from ledger import article_fingerprint, get_sent_ledger
+from email_templates import DigestRenderer
+from prefilter import TermPrefilter
+from zipreader import add_stats, iter_xml_members, new_stats
+import http_engine
+from http_engine import Deadline, DeadlineExceeded
+from ratelimit import CircuitOpenError, get_inlabs_policy
+import edition_cache
+from runlock import RunLease, clear_completed, get_run_store, load_progress, run_status, save_progress
 
 # Configuração simples para Vercel - storage inline temporário
 import os
@@ -136,6 +149,19 @@ except ImportError:
 app = Flask(__name__)
 
 
+@app.before_request
+def start_invocation_budget():
+    """Start the time budget INLABS requests of this invocation must fit in."""
+    g.deadline = Deadline()
+
+
+def current_deadline():
+    """Deadline of the current invocation (a fresh one outside a request)."""
+    if has_request_context() and 'deadline' in g:
+        return g.deadline
+    return Deadline()
+
+
 # INLABS credentials
 INLABS_EMAIL = os.getenv('INLABS_EMAIL', 'educmaia@gmail.com')
 INLABS_PASSWORD = os.getenv('INLABS_PASSWORD', 'maia2807')
@@ -169,7 +195,7 @@ def test_inlabs_connectivity():
     """Test basic connectivity to INLABS."""
     try:
         print("[DEBUG] Testing INLABS connectivity...")
-        response = requests.get("https://inlabs.in.gov.br/", timeout=10)
+        response = get_inlabs_policy().call(requests.get, "https://inlabs.in.gov.br/", timeout=10)
         print(f"[DEBUG] INLABS homepage status: {response.status_code}")
         return response.status_code == 200
     except Exception as e:
@@ -192,7 +218,7 @@ def create_inlabs_session():
     session = requests.Session()
     try:
         print(f"[DEBUG] Making POST request to: {URL_LOGIN}")
-        response = session.post(URL_LOGIN, data=payload, headers=headers, timeout=30)
+        response = get_inlabs_policy().call(session.post, URL_LOGIN, data=payload, headers=headers, timeout=30)
         print(f"[DEBUG] Login response status: {response.status_code}")
         print(f"[DEBUG] Response headers: {dict(response.headers)}")
         print(f"[DEBUG] Response cookies: {dict(session.cookies)}")
@@ -203,7 +229,7 @@ def create_inlabs_session():
             # Test access to main interface after login
             print("[DEBUG] Testing access to main INLABS interface...")
             test_url = "https://inlabs.in.gov.br/index.php"
-            test_response = session.get(test_url, timeout=30)
+            test_response = get_inlabs_policy().call(session.get, test_url, timeout=30)
             print(f"[DEBUG] Main interface status: {test_response.status_code}")
 
             if "logout" in test_response.text.lower() or "sair" in test_response.text.lower():
@@ -225,14 +251,15 @@ def create_inlabs_session():
         raise
 
 def is_valid_zip_content(content):
-    """Check if content is a valid ZIP file by checking its signature."""
+    """Check if content is a ZIP: signature and central directory (CRCs are checked on extraction)."""
+    from zipstore import verify_zip_bytes
     try:
-        if len(content) < 4:
-            return False
-        signature = content[:4]
-        return signature.startswith(b'PK')
+        valid, reason = verify_zip_bytes(content)
     except Exception:
         return False
+    if not valid:
+        print(f"[DEBUG] Invalid ZIP content ({len(content)} bytes): {reason}")
+    return valid
 
 def try_download_for_date_vercel(session, data_completa, sections):
     """
@@ -248,7 +275,7 @@ def try_download_for_date_vercel(session, data_completa, sections):
         url_arquivo = f"{URL_DOWNLOAD}{data_completa}&dl={data_completa}-{dou_secao}.zip"
 
         # Use session directly for better cookie handling
-        response = session.get(url_arquivo, timeout=60)
+        response = get_inlabs_policy().call(session.get, url_arquivo, timeout=60)
 
         if response.status_code == 200:
             # Check if content is actually a ZIP file
@@ -266,8 +293,104 @@ def try_download_for_date_vercel(session, data_completa, sections):
     print(f"[DEBUG] Download attempt for {data_completa} completed. Valid files: {len(downloaded_data)}")
     return downloaded_data
 
-def download_dou_xml_vercel(sections=None, max_fallback_days=2):
-    """Download DOU XML ZIPs with fallback to previous days - Vercel version."""
+async def _download_dou_xml_async(engine, cookies, dates, sections, deadline):
+    """
+    Download the first available edition among dates, overlapping requests.
+
+    The sections of the first date are downloaded concurrently while the
+    second date is probed (first bytes only). If the first date has nothing,
+    the sections the probes found are downloaded; further dates are probed
+    in turn. Probes still running once an edition is found are cancelled.
+
+    Returns:
+        tuple: (date, {section: ZIP content}), or (None, {}) if none found.
+    """
+    import asyncio
+    import httpx
+
+    policy = get_inlabs_policy()
+
+    def url_for(data_completa, dou_secao):
+        return f"{URL_DOWNLOAD}{data_completa}&dl={data_completa}-{dou_secao}.zip"
+
+    async def download(data_completa, dou_secao):
+        print(f"[DEBUG] Downloading {data_completa}-{dou_secao}.zip...")
+        try:
+            response = await policy.call_async(engine.fetch, 'GET', url_for(data_completa, dou_secao), deadline,
+                                               cap=60, cookies=cookies)
+        except (httpx.HTTPError, DeadlineExceeded, CircuitOpenError) as e:
+            # Only this section is lost; the ones already downloaded are kept
+            print(f"[DEBUG] Error downloading {dou_secao}: {e}")
+            return dou_secao, None
+        if response.status_code == 200:
+            # Parsing the central directory of a large DO3 takes a while: keep it off the event loop
+            if await asyncio.to_thread(is_valid_zip_content, response.content):
+                print(f"[DEBUG] Downloaded valid ZIP: {data_completa}-{dou_secao}.zip ({len(response.content)} bytes)")
+                return dou_secao, response.content
+            print(f"[DEBUG] Downloaded content for {dou_secao} is NOT a valid ZIP (got HTML page)")
+        elif response.status_code == 404:
+            print(f"[DEBUG] Not found: {data_completa}-{dou_secao}.zip")
+        else:
+            print(f"[DEBUG] Error downloading {dou_secao}: status {response.status_code}")
+        return dou_secao, None
+
+    async def probe(data_completa, dou_secao):
+        try:
+            response = await policy.call_async(engine.fetch, 'GET', url_for(data_completa, dou_secao), deadline,
+                                               cap=15, max_bytes=4, cookies=cookies)
+        except (httpx.HTTPError, DeadlineExceeded, CircuitOpenError):
+            return False
+        return response.status_code == 200 and response.content.startswith(b'PK')
+
+    async def download_all(data_completa, section_list):
+        results = await asyncio.gather(*(download(data_completa, s) for s in section_list))
+        return {s: content for s, content in results if content}
+
+    section_list = sections.split()
+    probes = {}
+
+    def start_probes(i):
+        # Only the next date is probed ahead: every request counts against the INLABS rate limit
+        if i < len(dates) and dates[i] not in probes:
+            probes[dates[i]] = [(s, asyncio.ensure_future(probe(dates[i], s))) for s in section_list]
+
+    # Downloads are created first, so they get the host's connection slots before the probes
+    first = asyncio.ensure_future(download_all(dates[0], section_list))
+    start_probes(1)
+    try:
+        downloaded_data = await first
+        if downloaded_data:
+            return dates[0], downloaded_data
+        for i, data_completa in enumerate(dates[1:], start=1):
+            print(f"[WARNING] Nenhum DOU válido encontrado; verificando {data_completa}...")
+            start_probes(i)
+            available = [s for s, task in probes[data_completa] if await task]
+            if available:
+                downloaded_data = await download_all(data_completa, available)
+                if downloaded_data:
+                    return data_completa, downloaded_data
+        return None, {}
+    finally:
+        for tasks in probes.values():
+            for _, task in tasks:
+                task.cancel()
+
+def download_dou_xml_vercel(sections=None, max_fallback_days=2, deadline=None, return_date=False,
+                            start_date=None):
+    """
+    Download DOU XML ZIPs with fallback to previous days - Vercel version.
+
+    The edition of start_date (YYYY-MM-DD, default today) is tried first,
+    then up to max_fallback_days earlier ones.
+
+    With the async engine (http_engine, needs httpx) sections are downloaded
+    concurrently and fallback dates probed meanwhile, within the invocation's
+    deadline; otherwise dates and sections are tried one at a time.
+
+    Returns:
+        dict: ZIP content by section; with return_date, (edition date, dict),
+            the date being None if nothing was found.
+    """
     if sections is None:
         sections = DEFAULT_SECTIONS
 
@@ -277,8 +400,23 @@ def download_dou_xml_vercel(sections=None, max_fallback_days=2):
         if not cookie:
             raise ValueError("No cookie after login.")
 
-        # Determine starting date (today)
-        target_date = date.today()
+        # Determine starting date (today, unless a run asks for its own date)
+        target_date = date.fromisoformat(start_date) if start_date else date.today()
+
+        if http_engine.available():
+            deadline = deadline or current_deadline()
+            engine = http_engine.get_engine()
+            dates = [(target_date - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(max_fallback_days + 1)]
+            print(f"[INFO] Verificando DOU de {dates[0]} (async, {deadline.remaining():.0f}s disponíveis)...")
+            cookies = requests.utils.dict_from_cookiejar(session.cookies)
+            session.close()
+            found_date, downloaded_data = engine.run(
+                _download_dou_xml_async(engine, cookies, dates, sections, deadline), deadline)
+            if downloaded_data:
+                print(f"[SUCCESS] DOU encontrado para {found_date}! {len(downloaded_data)} arquivo(s) baixado(s).")
+            else:
+                print(f"[ERROR] Nenhum DOU válido encontrado após verificar {max_fallback_days + 1} dias.")
+            return (found_date, downloaded_data) if return_date else downloaded_data
 
         # Try downloading for up to max_fallback_days
         for days_back in range(max_fallback_days + 1):
@@ -296,89 +434,90 @@ def download_dou_xml_vercel(sections=None, max_fallback_days=2):
             if downloaded_data:
                 print(f"[SUCCESS] DOU encontrado para {data_formatada}! {len(downloaded_data)} arquivo(s) baixado(s).")
                 session.close()
-                return downloaded_data
+                return (data_completa, downloaded_data) if return_date else downloaded_data
             else:
                 print(f"[WARNING] Nenhum DOU válido encontrado para {data_formatada}")
 
         print(f"[ERROR] Nenhum DOU válido encontrado após verificar {max_fallback_days + 1} dias.")
         session.close()
-        return {}
+        return (None, {}) if return_date else {}
     except Exception as e:
         print(f"[ERROR] Error in download_dou_xml_vercel: {e}")
         if 'session' in locals():
             session.close()
         raise
 
-def extract_articles_vercel(zip_data):
-    """Extract articles from ZIP data - Vercel version."""
+def extract_articles_vercel(zip_data, prefilter=None, zip_stats=None):
+    """
+    Extract articles from ZIP data - Vercel version.
+
+    With a prefilter (prefilter.TermPrefilter), XML files that cannot
+    contain any of its terms are skipped without being parsed. ZIPs are read
+    in one pass by zipreader (parallel inflate); pass zip_stats
+    (zipreader.new_stats()) to get member counts, sizes and timings. A
+    section whose ZIP has corrupt members (bad CRC) is rejected: none of its
+    articles are returned.
+    """
     articles = []
+    zip_stats = zip_stats if zip_stats is not None else new_stats()
 
     try:
         print(f"[DEBUG] Starting extraction from {len(zip_data)} zip files")
         for section, zip_bytes in zip_data.items():
             print(f"[DEBUG] Processing section: {section}, ZIP size: {len(zip_bytes)} bytes")
 
+            section_start = len(articles)
             try:
-                with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zip_ref:
-                    all_files = zip_ref.namelist()
-                    print(f"[DEBUG] All files in {section}: {all_files}")
-
-                    xml_files = [f for f in all_files if f.endswith('.xml')]
-                    print(f"[DEBUG] Found {len(xml_files)} XML files in {section}: {xml_files}")
-
-                    if not xml_files:
-                        # Check if ZIP is valid and what it contains
-                        print(f"[DEBUG] No XML files found. All files: {all_files}")
-                        # Try to read first few bytes to check content
-                        if all_files:
-                            first_file = all_files[0]
-                            try:
-                                content = zip_ref.read(first_file)[:200]
-                                print(f"[DEBUG] First file {first_file} content preview: {content}")
-                            except Exception as e:
-                                print(f"[DEBUG] Error reading first file: {e}")
+                section_stats = new_stats()
+                for xml_filename, xml_content in iter_xml_members(zip_bytes, stats=section_stats):
+                    try:
+                        if prefilter is not None and not prefilter.might_match(xml_content):
+                            continue
+                        print(f"[DEBUG] Processing XML file: {xml_filename}")
+                        print(f"[DEBUG] XML content size: {len(xml_content)} bytes")
+
+                        root = ET.fromstring(xml_content)
+                        print(f"[DEBUG] XML root tag: {root.tag}")
+
+                        # Extract artCategory
+                        art_category_elem = root.find('.//*[@artCategory]')
+                        art_category_text = art_category_elem.get('artCategory', 'N/A') if art_category_elem is not None else "N/A"
+
+                        # Extract text from article tags
+                        text_parts = []
+                        for article in root.findall('.//article'):
+                            article_text = ET.tostring(article, encoding='unicode', method='text').strip()
+                            if article_text:
+                                text_parts.append(article_text)
+
+                        print(f"[DEBUG] Found {len(text_parts)} articles in {xml_filename}")
+
+                        full_text = ' '.join(text_parts).strip()
+                        if full_text:
+                            articles.append({
+                                'section': section,
+                                'filename': xml_filename,
+                                'text': full_text,
+                                'xml_path': f"#xml-{section}-{xml_filename}",
+                                'artCategory': art_category_text
+                            })
+                            print(f"[DEBUG] Successfully extracted text from {xml_filename} ({len(text_parts)} articles, {len(full_text)} chars)")
+                        else:
+                            print(f"[DEBUG] No text extracted from {xml_filename}")
 
-                    for xml_filename in xml_files:
-                        try:
-                            print(f"[DEBUG] Processing XML file: {xml_filename}")
-                            xml_content = zip_ref.read(xml_filename)
-                            print(f"[DEBUG] XML content size: {len(xml_content)} bytes")
-
-                            root = ET.fromstring(xml_content)
-                            print(f"[DEBUG] XML root tag: {root.tag}")
-
-                            # Extract artCategory
-                            art_category_elem = root.find('.//*[@artCategory]')
-                            art_category_text = art_category_elem.get('artCategory', 'N/A') if art_category_elem is not None else "N/A"
-
-                            # Extract text from article tags
-                            text_parts = []
-                            for article in root.findall('.//article'):
-                                article_text = ET.tostring(article, encoding='unicode', method='text').strip()
-                                if article_text:
-                                    text_parts.append(article_text)
-
-                            print(f"[DEBUG] Found {len(text_parts)} articles in {xml_filename}")
-
-                            full_text = ' '.join(text_parts).strip()
-                            if full_text:
-                                articles.append({
-                                    'section': section,
-                                    'filename': xml_filename,
-                                    'text': full_text,
-                                    'xml_path': f"#xml-{section}-{xml_filename}",
-                                    'artCategory': art_category_text
-                                })
-                                print(f"[DEBUG] Successfully extracted text from {xml_filename} ({len(text_parts)} articles, {len(full_text)} chars)")
-                            else:
-                                print(f"[DEBUG] No text extracted from {xml_filename}")
+                    except ET.ParseError as e:
+                        print(f"[ERROR] XML parsing error in {xml_filename}: {e}")
+                    except Exception as e:
+                        print(f"[ERROR] Error processing {xml_filename}: {e}")
+                        import traceback
+                        print(f"[ERROR] Traceback: {traceback.format_exc()}")
 
-                        except ET.ParseError as e:
-                            print(f"[ERROR] XML parsing error in {xml_filename}: {e}")
-                        except Exception as e:
-                            print(f"[ERROR] Error processing {xml_filename}: {e}")
-                            import traceback
-                            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+                print(f"[DEBUG] Found {section_stats['xml_members']} XML files in {section} "
+                      f"({section_stats['skipped_members']} other members skipped, "
+                      f"{section_stats['inflate_seconds']:.2f}s inflating)")
+                if section_stats['bad_members']:
+                    print(f"[ERROR] {section_stats['bad_members']} corrupt member(s) in {section}; rejecting the section's ZIP")
+                    del articles[section_start:]
 
             except zipfile.BadZipFile as e:
                 print(f"[ERROR] Bad ZIP file for section {section}: {e}")
@@ -386,6 +525,7 @@ def extract_articles_vercel(zip_data):
                 print(f"[ERROR] Error opening ZIP for section {section}: {e}")
                 import traceback
                 print(f"[ERROR] Traceback: {traceback.format_exc()}")
+            add_stats(zip_stats, section_stats)
 
     except Exception as e:
         print(f"[ERROR] Error in extract_articles_vercel: {e}")
@@ -396,8 +536,74 @@ def extract_articles_vercel(zip_data):
     print(f"[DEBUG] Extraction completed. Total articles: {len(articles)}")
     return articles
 
-def find_matches_vercel(search_terms):
-    """Find matches in DOU - Vercel version with statistics."""
+def zip_inventory(zip_stats):
+    """Summary of zipreader stats for the search statistics."""
+    return {
+        'members': zip_stats['members'],
+        'non_xml_skipped': zip_stats['skipped_members'],
+        'compressed_bytes': zip_stats['compressed_bytes'],
+        'uncompressed_bytes': zip_stats['uncompressed_bytes'],
+        'inflate_seconds': round(zip_stats['inflate_seconds'], 3),
+        'slowest_member': zip_stats['slowest_member'],
+        'slowest_member_seconds': round(zip_stats['slowest_member_seconds'], 4),
+    }
+
+def build_edition_corpus(cache=None, deadline=None, start_date=None, max_fallback_days=2):
+    """
+    Download and parse the latest edition into a corpus for edition_cache.
+
+    start_date and max_fallback_days are passed to download_dou_xml_vercel.
+
+    Every XML file is parsed (no prefilter): the corpus serves all term sets.
+    If the ZIPs are identical to a corpus already in the cache, that corpus
+    is reused without parsing.
+
+    Returns:
+        dict: {'edition_date', 'hash', 'articles', 'stats'}, or None if no
+            edition was found.
+    """
+    edition_date, zip_data = download_dou_xml_vercel(deadline=deadline, return_date=True, start_date=start_date,
+                                                     max_fallback_days=max_fallback_days)
+    if not zip_data:
+        return None
+    digest = edition_cache.content_hash(zip_data)
+    if cache is not None:
+        stored = cache.load_corpus(edition_date, digest)
+        if stored is not None:
+            cache.stats['reused'] += 1
+            print(f"[INFO] Edição {edition_date} inalterada; reutilizando o corpus já publicado.")
+            return stored
+
+    zip_stats = new_stats()
+    articles = extract_articles_vercel(zip_data, zip_stats=zip_stats)
+    return {
+        'edition_date': edition_date,
+        'hash': digest,
+        'articles': articles,
+        'stats': {
+            'sections_downloaded': len(zip_data),
+            'zip_files_downloaded': len(zip_data),
+            'xml_files_processed': zip_stats['xml_members'],
+            'zip_inventory': zip_inventory(zip_stats),
+        },
+    }
+
+def find_matches_vercel(search_terms, match_filter=None, edition=None):
+    """
+    Find matches in DOU - Vercel version with statistics.
+
+    If match_filter is given, it is applied to the matches (e.g. a sent-ledger
+    filter, so already notified articles aren't summarized or sent again).
+
+    edition pins what is searched, for a cron run: {'run_date'} searches the
+    edition current on that date instead of today's; with 'edition_date' and
+    'hash' (the stats' edition_date and edition_hash of the run's first
+    search), exactly that edition, even when the run ends on a later day.
+
+    With the shared edition cache (edition_cache, on by default) the parsed
+    edition is loaded from Redis or the local stand-in; only one instance
+    downloads and parses it.
+    """
     if not search_terms:
         return [], {}
 
@@ -405,6 +611,7 @@ def find_matches_vercel(search_terms):
         'sections_downloaded': 0,
         'zip_files_downloaded': 0,
         'xml_files_processed': 0,
+        'xml_files_prefiltered': 0,
         'total_articles_extracted': 0,
         'articles_searched': 0,
         'matches_found': 0,
@@ -413,27 +620,73 @@ def find_matches_vercel(search_terms):
         'search_time': 0
     }
 
+    edition = edition or {}
+    pinned_date = edition.get('edition_date')
+    requested_date = pinned_date or edition.get('run_date') or date.today().strftime('%Y-%m-%d')
+    fallback_days = 0 if pinned_date else 2
+
     try:
         import time
 
-        # Download today's XML ZIPs
-        start_time = time.time()
-        print("Starting download for today's DOU XMLs.")
-        zip_data = download_dou_xml_vercel()
-        stats['download_time'] = round(time.time() - start_time, 2)
-
-        if not zip_data:
-            print("No files downloaded today.")
-            return [], stats
-
-        stats['sections_downloaded'] = len(zip_data)
-        stats['zip_files_downloaded'] = len(zip_data)
-
-        # Extract articles
-        start_time = time.time()
-        print("Starting extraction of articles.")
-        articles = extract_articles_vercel(zip_data)
-        stats['extraction_time'] = round(time.time() - start_time, 2)
+        try:
+            cache = edition_cache.get_edition_cache()
+        except Exception as e:
+            print(f"[WARN] Edition cache unavailable, downloading directly: {e}")
+            cache = None
+
+        if cache is not None:
+            # Shared edition: one download and parse across instances
+            start_time = time.time()
+            deadline = current_deadline()
+            corpus, source = None, 'pinned'
+            if edition.get('hash'):
+                corpus = cache.load_corpus(pinned_date, edition['hash'])
+                if corpus is None:
+                    print(f"[WARN] Edition {pinned_date} of the run is no longer cached; downloading it again.")
+            if corpus is None:
+                corpus, source = cache.get_or_build(
+                    requested_date,
+                    lambda c: build_edition_corpus(c, deadline, start_date=requested_date,
+                                                   max_fallback_days=fallback_days),
+                    max_wait=deadline.remaining() / 2)
+            stats['download_time'] = round(time.time() - start_time, 2)
+            stats['edition_source'] = source
+            if corpus is None:
+                print("No files downloaded today.")
+                return [], stats
+            print(f"Edition {corpus['edition_date']} from {source} ({len(corpus['articles'])} articles).")
+            stats['edition_date'] = corpus['edition_date']
+            stats['edition_hash'] = corpus['hash']
+            stats.update(corpus['stats'])
+            articles = corpus['articles']
+        else:
+            # Download the XML ZIPs of today (or of the run's date)
+            start_time = time.time()
+            print(f"Starting download for the DOU XMLs of {requested_date}.")
+            edition_date, zip_data = download_dou_xml_vercel(return_date=True, start_date=requested_date,
+                                                             max_fallback_days=fallback_days)
+            stats['download_time'] = round(time.time() - start_time, 2)
+
+            if not zip_data:
+                print("No files downloaded today.")
+                return [], stats
+
+            stats['edition_date'] = edition_date
+            stats['edition_hash'] = edition_cache.content_hash(zip_data)
+
+            stats['sections_downloaded'] = len(zip_data)
+            stats['zip_files_downloaded'] = len(zip_data)
+
+            # Extract articles
+            start_time = time.time()
+            print("Starting extraction of articles.")
+            prefilter = TermPrefilter(search_terms)
+            zip_stats = new_stats()
+            articles = extract_articles_vercel(zip_data, prefilter=prefilter, zip_stats=zip_stats)
+            stats['extraction_time'] = round(time.time() - start_time, 2)
+            stats['xml_files_prefiltered'] = prefilter.stats['skipped']
+            stats['xml_files_processed'] = zip_stats['xml_members']
+            stats['zip_inventory'] = zip_inventory(zip_stats)
 
         if not articles:
             print("No articles extracted.")
@@ -442,15 +695,6 @@ def find_matches_vercel(search_terms):
         stats['total_articles_extracted'] = len(articles)
         stats['articles_searched'] = len(articles)
 
-        # Count XML files processed
-        for section, zip_bytes in zip_data.items():
-            try:
-                with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zip_ref:
-                    xml_files = [f for f in zip_ref.namelist() if f.endswith('.xml')]
-                    stats['xml_files_processed'] += len(xml_files)
-            except:
-                pass
-
         # Search
         start_time = time.time()
         print(f"Searching {len(articles)} articles for terms.")
@@ -488,6 +732,12 @@ def find_matches_vercel(search_terms):
         stats['matches_found'] = len(matches)
 
         print(f"Search completed. Found {len(matches)} matching articles.")
+
+        if match_filter is not None and matches:
+            new_matches = match_filter(matches)
+            stats['already_sent'] = len(matches) - len(new_matches)
+            matches = new_matches
+
         return matches, stats
 
     except Exception as e:
@@ -502,247 +752,282 @@ SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
 SMTP_USER = os.getenv('SMTP_USER')
 SMTP_PASS = os.getenv('SMTP_PASS')
 
-def send_email_html(recipient, subject, html_body):
+def get_smtp_pool(size=1):
+    """Pool of authenticated SMTP connections, reused for a whole batch of sends."""
+    return SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS, size=size)
+
+def get_dispatcher():
+    """Parallel, rate-limited sender for fan-out to many recipients."""
+    return NotificationDispatcher(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS)
+
+def send_email_html(recipient, subject, html_body, pool=None):
+    """
+    Send an HTML email. Pass a pool from get_smtp_pool() when sending a batch
+    so all messages share the same authenticated connection(s).
+    """
     if not (SMTP_SERVER and SMTP_PORT and SMTP_USER and SMTP_PASS):
         print("[ERROR] SMTP environment variables not fully configured.")
         return False
 
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = SMTP_USER
-    msg['To'] = recipient
-    msg.attach(MIMEText(html_body, 'html'))
+    msg = build_html_message(SMTP_USER, recipient, subject, html_body)
 
     try:
-        if SMTP_PORT == 465:
-            server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT)
+        if pool is None:
+            with get_smtp_pool() as single_pool:
+                single_pool.send(SMTP_USER, recipient, msg.as_string())
         else:
-            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-            server.ehlo()
-            try:
-                server.starttls()
-                server.ehlo()
-            except Exception as e:
-                print(f"[WARN] STARTTLS not available/failed: {e}")
-
-        server.login(SMTP_USER, SMTP_PASS)
-        server.sendmail(SMTP_USER, recipient, msg.as_string())
-        server.quit()
+            pool.send(SMTP_USER, recipient, msg.as_string())
         print(f"[INFO] Email sent to {recipient}")
         return True
     except Exception as e:
         print(f"[ERROR] Email send failed for {recipient}: {e}")
-        try:
-            server.quit()
-        except Exception:
-            pass
         return False
 
-def format_email_body_html(email, date_str, matches):
-    if not matches:
-        return f"""
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>DOU Notificações - {date_str}</title>
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }}
-                .container {{ max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; }}
-                .content {{ padding: 30px; }}
-                .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666; border-top: 1px solid #eee; }}
-                .no-results {{ text-align: center; padding: 40px; color: #666; }}
-                .icon {{ font-size: 48px; margin-bottom: 20px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1 style="margin: 0; font-size: 28px;">📋 DOU Notificações</h1>
-                    <p style="margin: 10px 0 0 0; opacity: 0.9; font-size: 16px;">{date_str}</p>
-                </div>
-                <div class="content">
-                    <p style="font-size: 18px; margin-bottom: 20px;">Olá <strong>{email}</strong>,</p>
-                    <div class="no-results">
-                        <div class="icon">🔍</div>
-                        <p style="font-size: 16px; margin: 0;">Nenhuma ocorrência encontrada hoje no DOU para os seus termos de monitoramento.</p>
-                        <p style="font-size: 14px; color: #888; margin-top: 10px;">Continue monitorando - notificaremos você assim que houver novidades!</p>
-                    </div>
-                </div>
-                <div class="footer">
-                    <p style="margin: 0;">🤖 Sistema Automático de Monitoramento DOU</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-
-    # Calcular estatísticas
-    total_terms_found = sum(len(m.get('terms_matched', [])) for m in matches)
-    sections = set(m.get('article', {}).get('section', 'N/A') for m in matches)
-    sections_list = ', '.join(sorted(sections))
-
-    # Cabeçalho com estilo completo
-    html_parts = [f"""
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>DOU Notificações - {date_str}</title>
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }}
-                .container {{ max-width: 900px; margin: 0 auto; background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; }}
-                .content {{ padding: 30px; }}
-                .stats {{ background: #f8f9fa; border-radius: 8px; padding: 20px; margin: 20px 0; display: flex; justify-content: space-around; text-align: center; }}
-                .stat-item {{ flex: 1; }}
-                .stat-number {{ font-size: 24px; font-weight: bold; color: #667eea; display: block; }}
-                .stat-label {{ font-size: 12px; color: #666; text-transform: uppercase; letter-spacing: 1px; }}
-                .match-item {{ border: 1px solid #e1e8ed; border-radius: 8px; padding: 20px; margin: 20px 0; background: #fafbfc; }}
-                .match-header {{ background: #667eea; color: white; padding: 15px; margin: -20px -20px 15px -20px; border-radius: 8px 8px 0 0; }}
-                .match-title {{ font-size: 18px; font-weight: bold; margin: 0; }}
-                .match-subtitle {{ font-size: 14px; opacity: 0.9; margin: 5px 0 0 0; }}
-                .terms-badge {{ display: inline-block; background: #28a745; color: white; padding: 4px 8px; border-radius: 4px; font-size: 12px; margin: 2px; }}
-                .snippet {{ background: #fff; border-left: 4px solid #667eea; padding: 15px; margin: 10px 0; border-radius: 0 4px 4px 0; font-style: italic; color: #555; }}
-                .metadata {{ display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin: 15px 0; }}
-                .metadata-item {{ background: white; padding: 10px; border-radius: 4px; border: 1px solid #eee; }}
-                .metadata-label {{ font-size: 12px; color: #666; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 5px; }}
-                .metadata-value {{ font-weight: 600; color: #333; }}
-                .summary-section {{ background: white; border-radius: 6px; padding: 15px; margin: 15px 0; border: 1px solid #e1e8ed; }}
-                .footer {{ background: #f8f9fa; padding: 20px; text-align: center; color: #666; border-top: 1px solid #eee; }}
-                .highlight {{ background-color: #fff3cd; padding: 2px 4px; border-radius: 2px; }}
-                @media (max-width: 600px) {{
-                    .stats {{ flex-direction: column; }}
-                    .metadata {{ grid-template-columns: 1fr; }}
-                    .container {{ margin: 10px; }}
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1 style="margin: 0; font-size: 28px;">📋 DOU Notificações</h1>
-                    <p style="margin: 10px 0 0 0; opacity: 0.9; font-size: 16px;">{date_str}</p>
-                </div>
-                <div class="content">
-                    <p style="font-size: 18px; margin-bottom: 20px;">Olá <strong>{email}</strong>,</p>
-
-                    <div class="stats">
-                        <div class="stat-item">
-                            <span class="stat-number">{len(matches)}</span>
-                            <span class="stat-label">Ocorrências</span>
-                        </div>
-                        <div class="stat-item">
-                            <span class="stat-number">{total_terms_found}</span>
-                            <span class="stat-label">Termos Encontrados</span>
-                        </div>
-                        <div class="stat-item">
-                            <span class="stat-number">{len(sections)}</span>
-                            <span class="stat-label">Seções DOU</span>
-                        </div>
-                    </div>
-
-                    <p style="color: #28a745; font-weight: 600; text-align: center; margin: 20px 0;">
-                        ✅ Foram encontradas <strong>{len(matches)} ocorrência(s)</strong> hoje nas seções: <em>{sections_list}</em>
-                    </p>
-    """]
-
-    # Iterar através das ocorrências
-    for i, m in enumerate(matches, 1):
-        art = m.get('article', {})
-        terms = m.get('terms_matched', [])
-        summary = m.get('summary', 'Resumo não disponível')
-        snippets = m.get('snippets', [])
-
-        # Informações do artigo
-        filename = art.get('filename', 'Arquivo não identificado')
-        section = art.get('section', 'Seção não especificada')
-        xml_path = art.get('xml_path', '')
-
-        # Badges dos termos
-        terms_badges = ''.join([f'<span class="terms-badge">{term}</span>' for term in terms])
-
-        # Metadados estruturados
-        metadata_html = f"""
-        <div class="metadata">
-            <div class="metadata-item">
-                <div class="metadata-label">Arquivo XML</div>
-                <div class="metadata-value">{filename}</div>
-            </div>
-            <div class="metadata-item">
-                <div class="metadata-label">Seção DOU</div>
-                <div class="metadata-value">{section}</div>
-            </div>
-        </div>
-        """
-
-        # Snippets destacados
-        snippets_html = ""
-        if snippets:
-            snippets_html = "<div style='margin: 15px 0;'><strong>📄 Trechos relevantes:</strong></div>"
-            for idx, snippet in enumerate(snippets[:3], 1):  # Máximo 3 snippets
-                # Destacar termos encontrados no snippet
-                highlighted_snippet = snippet
-                for term in terms:
-                    highlighted_snippet = highlighted_snippet.replace(
-                        term, f'<span class="highlight"><strong>{term}</strong></span>'
-                    )
-                snippets_html += f'<div class="snippet"><strong>Trecho {idx}:</strong> {highlighted_snippet}</div>'
-
-        # Seção da ocorrência
-        html_parts.append(f"""
-        <div class="match-item">
-            <div class="match-header">
-                <div class="match-title">📄 {i}. {filename}</div>
-                <div class="match-subtitle">{section}</div>
-            </div>
-
-            <div style="margin: 15px 0;">
-                <strong>🔍 Termos encontrados:</strong><br>
-                {terms_badges}
-            </div>
-
-            {metadata_html}
-
-            <div class="summary-section">
-                <strong>📝 Resumo:</strong><br>
-                <div style="margin-top: 10px; color: #555;">{summary}</div>
-            </div>
-
-            {snippets_html}
-
-            {f'<div style="margin-top: 15px; font-size: 12px; color: #666;"><strong>🔗 Arquivo:</strong> {xml_path}</div>' if xml_path else ''}
-        </div>
-        """)
-
-    # Rodapé
-    html_parts.extend([
-        """
-                </div>
-                <div class="footer">
-                    <p style="margin: 0; font-size: 14px;">🤖 <strong>Sistema Automático de Monitoramento DOU</strong></p>
-                    <p style="margin: 5px 0 0 0; font-size: 12px;">Monitoramento ativo • Notificações em tempo real • Powered by FiscalDOU</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    ])
+def format_email_body_html(email, date_str, matches, renderer=None):
+    """
+    Format email body as HTML.
 
-    return ''.join(html_parts)
+    Pass one email_templates.DigestRenderer for a whole batch so each
+    article block is rendered once and reused across recipients.
+    """
+    return (renderer or DigestRenderer()).render(email, date_str, matches)
 
 # ----------------------
 # Cron route
 # ----------------------
+RUN_LOCK_DIR = os.path.join(tempfile.gettempdir(), 'dou_run_locks')
+# Recipients searched and emailed per step; progress is saved after each one
+CRON_BATCH_SIZE = int(os.getenv('CRON_BATCH_SIZE', 20))
+# A new step only starts with at least this much time left (or the slowest step's time, if longer)
+CRON_MIN_STEP_SECONDS = float(os.getenv('CRON_MIN_STEP_SECONDS', 10))
+# Where the continuation invocation is requested (default: /api/cron/daily on this deployment)
+CRON_CONTINUATION_URL = os.getenv('CRON_CONTINUATION_URL')
+CRON_HANDOFF_TIMEOUT = float(os.getenv('CRON_HANDOFF_TIMEOUT', 2))
+# Days back a daily call looks for a paused run (its continuation lost) to finish first
+CRON_RESUME_DAYS = int(os.getenv('CRON_RESUME_DAYS', 2))
+
+
+def merge_run_matches(run_matches, matches):
+    """Add one recipient's matches to a run's, one entry per article with terms and snippets merged."""
+    for match in matches:
+        merged = run_matches.setdefault(article_fingerprint(match), {
+            'article': match['article'], 'terms_matched': [], 'snippets': []})
+        merged['terms_matched'] += [t for t in match['terms_matched'] if t not in merged['terms_matched']]
+        for snippet in match['snippets']:
+            if snippet not in merged['snippets'] and len(merged['snippets']) < 3:
+                merged['snippets'].append(snippet)
+    return run_matches
+
+
+def summarize_cron_run(recipients, progress, find_for, deadline, can_pause=True):
+    """
+    AI summaries of a cron run: one per article, within one budget for the whole run.
+
+    The matches of every recipient are collected and deduplicated by article,
+    then summarized most relevant first, so the budget goes to the run's best
+    matches whichever recipient they belong to. The summaries and the
+    budget's consumption are kept in progress ('summaries',
+    'summary_budget'), so the continuations of the run share them instead of
+    starting a fresh budget.
+
+    Args:
+        recipients (list): Emails of the run not yet notified.
+        progress (dict): The run's progress; updated in place.
+        find_for (callable): find_for(email, terms) -> (matches, stats), the
+            run's search for one recipient.
+        deadline (Deadline): Invocation budget.
+        can_pause (bool): Stop when time runs short (at least one summary is
+            made first), leaving the rest to a continuation.
+
+    Returns:
+        bool: True once every article is summarized (or left to the snippet
+            fallback), False if it stopped for lack of time.
+    """
+    from summarize import SummaryBudget, generate_summary, relevance_score
+
+    summaries = progress.setdefault('summaries', {})
+    state = progress.get('summary_budget')
+    budget = SummaryBudget.from_dict(state) if state else SummaryBudget()
+
+    run_matches = {}
+    for email in recipients:
+        terms = get_email_terms(email)
+        if terms:
+            matches, _ = find_for(email, terms)
+            merge_run_matches(run_matches, matches)
+
+    queue = sorted((key for key in run_matches if key not in summaries),
+                   key=lambda key: relevance_score(run_matches[key]), reverse=True)
+    finished = True
+    for i, key in enumerate(queue):
+        if can_pause and i and deadline.remaining() < CRON_MIN_STEP_SECONDS:
+            finished = False
+            break
+        ai_summaries = budget.ai_summaries
+        summary = generate_summary(run_matches[key], budget=budget)
+        # Fallbacks aren't kept: each recipient gets one from their own terms and snippets
+        summaries[key] = summary if budget.ai_summaries > ai_summaries else None
+    print(f"[INFO] Summarized {len(queue) if finished else i} of {len(queue)} article(s) left in the run; "
+          f"budget: {budget.as_dict()}")
+    progress['summary_budget'] = budget.as_dict()
+    progress['summaries_done'] = finished
+    return finished
+
+
+def attach_run_summaries(matches, summaries):
+    """Give a recipient's matches the run's summaries (see summarize_cron_run), or a snippet summary."""
+    try:
+        from summarize import relevance_score, snippet_summary
+    except Exception as e:
+        print(f"[WARN] Summarization unavailable, sending without summaries: {e}")
+        return matches
+    for match in matches:
+        match['relevance'] = round(relevance_score(match), 2)
+        match['summary'] = summaries.get(article_fingerprint(match)) or snippet_summary(match)
+    return matches
+
+
+def get_cron_run_store():
+    """Run leases: Redis when REDIS_URL is set, else /tmp (one warm instance only)."""
+    return get_run_store(RUN_LOCK_DIR)
+
+
+def find_paused_cron_run(store, today=None):
+    """The oldest cron run of the last CRON_RESUME_DAYS days still paused between steps, or None."""
+    today = today or date.today()
+    for days_back in range(CRON_RESUME_DAYS, 0, -1):
+        name = f"cron:{(today - timedelta(days=days_back)).isoformat()}"
+        status = run_status(store, name)
+        if status and status['state'] == 'paused':
+            return name
+    return None
+
+
+def request_continuation(name):
+    """
+    Start the next step of a cron run in a new invocation, without waiting for it.
+
+    Returns:
+        bool: Whether the request went out. If not, the run stays paused and
+            the next call to /api/cron/daily resumes it, even on a later day.
+    """
+    url = CRON_CONTINUATION_URL or f"{request.host_url.rstrip('/')}/api/cron/daily"
+    try:
+        requests.get(url, params={'continue': name}, timeout=CRON_HANDOFF_TIMEOUT)
+    except requests.exceptions.ReadTimeout:
+        # Expected: the continuation keeps running after we stop waiting for its response
+        pass
+    except requests.RequestException as e:
+        print(f"[WARN] Could not start the continuation of {name}; the next cron call resumes it: {e}")
+        return False
+    print(f"[INFO] Continuation of {name} requested.")
+    return True
+
+
 @app.route('/api/cron/daily', methods=['GET'])
 def cron_daily():
     """
     Vercel Cron target. Fetch emails and terms from Edge Config,
     run search and summaries per email, and send notifications.
+
+    Only one invocation per day does the work: it holds the run lease
+    (runlock) while running. A retried or duplicated call that finds the
+    day running or completed answers right away with its status and the
+    /api/runs/<name> link. ?rerun=1 runs a completed day again; dry runs
+    (?dry=1) send nothing and skip the lease.
+
+    AI summaries are made first, once per article for the whole run and
+    within one budget (summarize_cron_run). The emails then go in steps of
+    CRON_BATCH_SIZE recipients, saving progress after each. When the invocation's time budget can't fit another step,
+    it answers 202 and requests a continuation (?continue=<name>), which
+    picks up the recipients not done yet. If that request is lost, the next
+    daily call finishes the paused run (of up to CRON_RESUME_DAYS days
+    before) first, then requests the day's own run. A run keeps the edition
+    of its own date (cron:<date>) across continuations, even past midnight.
+    """
+    if request.args.get('dry') == '1':
+        return _run_cron_daily()
+
+    today_name = f"cron:{date.today().isoformat()}"
+    name = request.args.get('continue')
+    if name and not name.startswith('cron:'):
+        return ({'ok': False, 'error': f'Not a cron run: {name}'}, 400)
+    try:
+        store = get_cron_run_store()
+        if not name:
+            name = find_paused_cron_run(store) or today_name
+            if name != today_name:
+                print(f"[INFO] Finishing the paused cron run {name} before {today_name}.")
+        status = run_status(store, name)
+        if status and status['state'] == 'completed' and request.args.get('rerun') == '1':
+            clear_completed(store, name)
+            status = None
+        if status and status['state'] == 'paused':
+            print(f"[INFO] Resuming cron run {name} after {status['done']} recipient(s).")
+            status = None
+        lease = None if status else RunLease(store, name)
+        if lease is not None and not lease.acquire():
+            status = run_status(store, name) or {'state': 'running'}
+    except Exception as e:
+        print(f"[WARN] Run lease unavailable, running without it: {e}")
+        return _run_cron_daily()
+
+    if status:
+        print(f"[INFO] Cron run {name} already {status['state']}; skipping.")
+        return ({
+            'ok': True,
+            'status': status['state'],
+            'run': name,
+            'record': status,
+            'stats_url': f"/api/runs/{name}"
+        }, 200 if status['state'] == 'completed' else 202)
+
+    try:
+        body, code = _run_cron_daily(lease, store, name)
+        if code == 200 and body.get('ok'):
+            lease.mark_completed({'sent': body['run_sent'], 'statuses': body['statuses'],
+                                  'steps': body['steps'], 'summary_budget': body.get('summary_budget')})
+    finally:
+        lease.release()
+    body.update({'run': name, 'stats_url': f"/api/runs/{name}"})
+    if code == 202:
+        # Released first, so the continuation can take the lease
+        body['continuation_requested'] = request_continuation(name)
+    elif code == 200 and name != today_name:
+        # An earlier day's run is done; today's hasn't started yet
+        body['next_run_requested'] = request_continuation(today_name)
+    return body, code
+
+
+@app.route('/api/runs/<name>', methods=['GET'])
+def run_stats(name):
+    """Status of a cron or pipeline run (running, paused between steps or completed, with its stats)."""
+    try:
+        status = run_status(get_cron_run_store(), name)
+    except Exception as e:
+        return ({'ok': False, 'error': str(e)}, 500)
+    if not status:
+        return ({'ok': False, 'error': f'No run named {name}'}, 404)
+    return ({'ok': True, 'run': name, **status}, 200)
+
+
+def _run_cron_daily(lease=None, store=None, name=None):
+    """
+    Body of cron_daily: the run's summaries, then steps of CRON_BATCH_SIZE recipients.
+
+    With a lease (and the store and run name it belongs to), summaries and
+    recipients done by earlier invocations are skipped and progress is saved
+    after the summaries and after each step. The run searches the edition of
+    its date (cron:<date>); the first search pins it in progress['edition'],
+    so every invocation of the run sends from the same edition. When the time left can't fit another step, it stops and answers
+    202 with status 'continuing' (dry runs just report what remains).
+    Every invocation does at least one step, so a run always advances.
     """
     try:
         # Optional basic guard for non-cron calls
         # Vercel adds header 'x-vercel-cron' on cron invocations
-        is_cron = request.headers.get('x-vercel-cron') is not None or request.args.get('force') == '1'
+        is_cron = (request.headers.get('x-vercel-cron') is not None or request.args.get('force') == '1'
+                   or 'continue' in request.args)
 
         emails = sorted(list(get_current_emails()))
         if not emails:
@@ -750,48 +1035,148 @@ def cron_daily():
                 'ok': True,
                 'message': 'No emails registered in Edge Config',
                 'sent': 0,
+                'run_sent': 0,
+                'statuses': {},
+                'steps': 0,
                 'isCron': is_cron
             }, 200)
 
         # Aggregate stats
-        date_str = date.today().strftime('%d/%m/%Y')
+        run_date = name.split(':', 1)[1] if name else date.today().isoformat()
+        date_str = date.fromisoformat(run_date).strftime('%d/%m/%Y')
         total_sent = 0
         per_email = []
-
-        # If any email has terms, run search once per unique term set? We run per email to respect per-user terms
-        for email in emails:
-            terms = get_email_terms(email)
-            if not terms:
-                per_email.append({'email': email, 'status': 'no-terms', 'matches': 0})
-                continue
-
-            matches, stats = find_matches_vercel(terms)
-
-            # Summaries (use AI if key configured; summarize.py falls back gracefully)
+        progress = (load_progress(store, name) if lease is not None else None) or {
+            'done': [], 'statuses': {}, 'sent': 0, 'steps': 0}
+        edition = progress.setdefault('edition', {'run_date': run_date})
+        done = set(progress['done'])
+        pending = [email for email in emails if email not in done]
+
+        # Sent ledger: articles already emailed to a recipient (cron rerun, fallback day) are skipped.
+        # Redis when REDIS_URL is set; otherwise SQLite in /tmp, shared only within a warm instance.
+        try:
+            sent_ledger = get_sent_ledger(os.path.join(tempfile.gettempdir(), 'emails.db'))
+        except Exception as e:
+            print(f"[WARN] Sent ledger unavailable, all matches will be sent: {e}")
+            sent_ledger = None
+
+        def find_for(email, terms):
+            match_filter = (lambda ms: sent_ledger.filter_unsent(email, ms)) if sent_ledger else None
+            matches, stats = find_matches_vercel(terms, match_filter=match_filter, edition=edition)
+            if 'hash' not in edition and stats.get('edition_hash'):
+                # The run's first search pins the edition for the rest of it
+                edition.update(edition_date=stats['edition_date'], hash=stats['edition_hash'])
+            return matches, stats
+
+        deadline = current_deadline()
+        if not progress.get('summaries_done'):
             try:
-                from summarize import summarize_matches
-                summarized = summarize_matches(matches)
+                summarized_all = summarize_cron_run(pending, progress, find_for, deadline,
+                                                    can_pause=lease is not None)
             except Exception as e:
-                print(f"[WARN] Summarization failed, sending without summaries: {e}")
-                summarized = matches
-
-            # Prepare and possibly send
-            html = format_email_body_html(email, date_str, summarized)
-            dry_run = request.args.get('dry') == '1'
+                print(f"[WARN] Summarization failed, sending snippet summaries: {e}")
+                progress['summaries_done'] = summarized_all = True
+            if lease is not None:
+                progress['updated_at'] = datetime.now().isoformat(timespec='seconds')
+                save_progress(store, name, progress)
+            if not summarized_all:
+                print("[INFO] Time budget low while summarizing; a continuation makes the rest of the run's summaries.")
+                return ({'ok': True, 'isCron': is_cron, 'status': 'continuing', 'sent': 0,
+                         'run_sent': progress['sent'], 'statuses': progress['statuses'],
+                         'steps': progress['steps'], 'remaining': len(pending),
+                         'summary_budget': progress.get('summary_budget'), 'details': []}, 202)
+        summaries = progress.get('summaries', {})
 
-            sent_ok = True if dry_run else send_email_html(email, f"DOU Notificações - {date_str}", html)
-            if sent_ok:
-                total_sent += 1 if not dry_run else 0
-                per_email.append({'email': email, 'status': 'sent' if not dry_run else 'dry', 'matches': len(summarized), 'stats': stats})
-            else:
-                per_email.append({'email': email, 'status': 'send-failed', 'matches': len(summarized)})
-
-        return ({
+        # If any email has terms, run search once per unique term set? We run per email to respect per-user terms
+        dry_run = request.args.get('dry') == '1'
+        renderer = DigestRenderer()
+        smtp_stats = {}
+        step_seconds = CRON_MIN_STEP_SECONDS
+        steps = 0
+        while pending:
+            if steps and deadline.remaining() < step_seconds:
+                break
+            step_started = time.monotonic()
+            batch, pending = pending[:CRON_BATCH_SIZE], pending[CRON_BATCH_SIZE:]
+            step_entries = []
+            jobs = []
+            for email in batch:
+                terms = get_email_terms(email)
+                if not terms:
+                    step_entries.append({'email': email, 'status': 'no-terms', 'matches': 0})
+                    continue
+
+                matches, stats = find_for(email, terms)
+                if not matches and stats.get('already_sent'):
+                    step_entries.append({'email': email, 'status': 'already-sent', 'matches': 0, 'stats': stats})
+                    continue
+                summarized = attach_run_summaries(matches, summaries)
+
+                # Prepare the personalized email; sending happens below in parallel
+                html = format_email_body_html(email, date_str, summarized, renderer=renderer)
+                if dry_run:
+                    step_entries.append({'email': email, 'status': 'dry', 'matches': len(summarized), 'stats': stats})
+                else:
+                    jobs.append({'recipient': email, 'subject': f"DOU Notificações - {date_str}", 'html': html,
+                                 'matches': len(summarized), 'stats': stats, 'sent_matches': summarized})
+
+            if jobs and lease is not None and lease.lost:
+                # The lease expired and another invocation may be sending the same emails
+                print("[ERROR] Run lease lost before sending; leaving the emails to the other invocation.")
+                return ({'ok': False, 'error': 'run lease lost', 'details': per_email + step_entries}, 409)
+            if jobs and not (SMTP_USER and SMTP_PASS):
+                print("[ERROR] SMTP environment variables not fully configured.")
+                for job in jobs:
+                    step_entries.append({'email': job['recipient'], 'status': 'send-failed', 'matches': job['matches']})
+            elif jobs:
+                dispatcher = get_dispatcher()
+                for job, result in zip(jobs, dispatcher.dispatch(jobs)):
+                    entry = {'email': job['recipient'], 'matches': job['matches'], 'elapsed': result['elapsed']}
+                    if result['status'] == 'sent':
+                        total_sent += 1
+                        entry.update({'status': 'sent', 'stats': job['stats']})
+                        if sent_ledger:
+                            try:
+                                sent_ledger.record(job['recipient'], job['sent_matches'])
+                            except Exception as e:
+                                print(f"[WARN] Could not record sent matches for {job['recipient']}: {e}")
+                    else:
+                        entry.update({'status': 'send-failed', 'error': result.get('error')})
+                    step_entries.append(entry)
+                for key, value in dispatcher.smtp_stats.items():
+                    smtp_stats[key] = smtp_stats.get(key, 0) + value
+
+            per_email.extend(step_entries)
+            steps += 1
+            progress['done'].extend(batch)
+            progress['steps'] += 1
+            for entry in step_entries:
+                progress['statuses'][entry['status']] = progress['statuses'].get(entry['status'], 0) + 1
+            progress['sent'] += sum(1 for entry in step_entries if entry['status'] == 'sent')
+            if lease is not None:
+                progress['updated_at'] = datetime.now().isoformat(timespec='seconds')
+                save_progress(store, name, progress)
+            step_seconds = max(step_seconds, time.monotonic() - step_started)
+
+        body = {
             'ok': True,
             'isCron': is_cron,
             'sent': total_sent,
+            'run_sent': progress['sent'],
+            'statuses': progress['statuses'],
+            'steps': progress['steps'],
+            'remaining': len(pending),
+            'edition': edition,
+            'summary_budget': progress.get('summary_budget'),
+            'smtp': smtp_stats,
+            'render': renderer.blocks.stats,
             'details': per_email
-        }, 200)
+        }
+        if pending and lease is not None:
+            print(f"[INFO] Time budget low after {steps} step(s); {len(pending)} recipient(s) left for a continuation.")
+            body['status'] = 'continuing'
+            return body, 202
+        return body, 200
     except Exception as e:
         print(f"[ERROR] Cron execution failed: {e}")
         return ({'ok': False, 'error': str(e)}, 500)
@@ -904,6 +1289,7 @@ def home():
                         'sections_downloaded': 0,
                         'zip_files_downloaded': 0,
                         'xml_files_processed': 0,
+                        'xml_files_prefiltered': 0,
                         'total_articles_extracted': 0,
                         'articles_searched': 0,
                         'matches_found': 0,
@@ -1055,6 +1441,9 @@ def home():
                     sent = 0
                     skipped = 0
                     processed = 0
+                    date_str = date.today().strftime('%d/%m/%Y')
+                    renderer = DigestRenderer()
+                    jobs = []
                     for email in current_emails:
                         processed += 1
                         # Get terms for this email using Redis priority
@@ -1064,15 +1453,16 @@ def home():
                             skipped += 1
                             continue
 
-                        # Search and send
+                        # Search and prepare; emails are sent in parallel below
                         matches, _ = find_matches_vercel(terms)
                         if matches:
                             summarized = matches[:5]  # Limit to 5 results
-                            smtp_user = os.getenv('SMTP_USER', '')
-                            smtp_pass = os.getenv('SMTP_PASS', '')
+                            html = format_email_body_html(email, date_str, summarized, renderer=renderer)
+                            jobs.append({'recipient': email, 'subject': f"DOU Notificações - {date_str}", 'html': html})
 
-                            if send_email_notification(email, summarized, smtp_user, smtp_pass):
-                                sent += 1
+                    if jobs and SMTP_USER and SMTP_PASS:
+                        results = get_dispatcher().dispatch(jobs)
+                        sent = sum(1 for r in results if r['status'] == 'sent')
 
                     message = f"Envio concluído: {sent}/{processed} emails enviados. {skipped} sem termos."
                 except Exception as e:
@@ -1170,12 +1560,14 @@ def home():
                     except Exception:
                         summarized = matches
 
-                    # Enviar para todos os emails cadastrados
-                    for em in current_emails:
-                        html = format_email_body_html(em, date.today().strftime('%d/%m/%Y'), summarized)
-                        ok = send_email_html(em, f"DOU Mestrando Exterior - {date.today().strftime('%d/%m/%Y')}", html)
-                        sent += 1 if ok else 0
-                        processed += 1
+                    # Enviar para todos os emails cadastrados, reutilizando a conexão SMTP
+                    renderer = DigestRenderer()
+                    with get_smtp_pool() as smtp_pool:
+                        for em in current_emails:
+                            html = format_email_body_html(em, date.today().strftime('%d/%m/%Y'), summarized, renderer=renderer)
+                            ok = send_email_html(em, f"DOU Mestrando Exterior - {date.today().strftime('%d/%m/%Y')}", html, pool=smtp_pool)
+                            sent += 1 if ok else 0
+                            processed += 1
 
                     message = f"Envio concluído: {sent}/{processed} emails enviados com resultados da busca Mestrando Exterior."
                 except Exception as e:
@@ -52,6 +52,14 @@ def init_db():
     if 'created_at' not in cols:
         cursor.execute("ALTER TABLE search_terms ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
 
+    # Migration: optional scope columns (NULL = all sections / all organs)
+    cursor.execute("PRAGMA table_info('search_terms')")
+    cols = {row[1] for row in cursor.fetchall()}
+    if 'sections' not in cols:
+        cursor.execute("ALTER TABLE search_terms ADD COLUMN sections TEXT")
+    if 'category' not in cols:
+        cursor.execute("ALTER TABLE search_terms ADD COLUMN category TEXT")
+
     # Ensure unique constraint on (email, term) via index (works even if table pre-existed)
     cursor.execute('''
         CREATE UNIQUE INDEX IF NOT EXISTS idx_search_terms_email_term
@@ -113,6 +121,8 @@ def home():
             action = request.form.get('action')
             email = request.form.get('email', '').strip().lower()
             term = request.form.get('term', '').strip()
+            term_sections = request.form.get('term_sections', '').strip()
+            term_category = request.form.get('term_category', '').strip()
 
             if action == 'add_email' and email:
                 try:
@@ -142,7 +152,7 @@ def home():
                     message = f'Erro ao remover email: {str(e)}'
 
             elif action == 'add_term' and email and term:
-                if add_search_term(email, term):
+                if add_search_term(email, term, term_sections, term_category):
                     message = f'Termo "{term}" adicionado para {email}!'
                 else:
                     message = f'Erro ao adicionar termo ou termo já existe.'
@@ -224,22 +234,41 @@ def get_search_terms(email):
     conn.close()
     return terms
 
-def add_search_term(email, term):
-    """Add a search term for an email."""
+def add_search_term(email, term, sections=None, category=None):
+    """
+    Add a search term for an email and queue a retro-search of past editions for it.
+
+    Returns False if the email already has the term (nothing is searched then).
+
+    sections (e.g. "DO1 DO2") and category (organ, matched against the
+    article's artCategory) optionally restrict where the term is searched.
+    """
+    from scopes import parse_sections
+    sections = parse_sections(sections)
     try:
         conn = sqlite3.connect('emails.db')
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO search_terms (email, term)
-            VALUES (?, ?)
-        ''', (email.lower(), term.strip()))
+            INSERT OR IGNORE INTO search_terms (email, term, sections, category)
+            VALUES (?, ?, ?, ?)
+        ''', (email.lower(), term.strip(), ' '.join(sections) if sections else None, (category or '').strip() or None))
+        added = cursor.rowcount > 0
         conn.commit()
         conn.close()
-        return True
     except sqlite3.IntegrityError:
         return False
     except Exception:
         return False
+    if not added:
+        return False
+
+    # The term is saved; the retro-search is best effort
+    try:
+        from retrosearch import submit_retro_search
+        submit_retro_search(email, term.strip())
+    except Exception:
+        pass
+    return True
 
 def remove_search_term(email, term):
     """Remove a search term for an email."""
@@ -613,6 +642,8 @@ HTML_TEMPLATE = '''
                         <form method="post" style="display: flex; gap: 5px;">
                             <input type="hidden" name="email" value="{{ email }}">
                             <input type="text" name="term" placeholder="Novo termo" style="flex: 1; padding: 8px; font-size: 0.9rem;" required>
+                            <input type="text" name="term_sections" placeholder="Seções (ex.: DO1)" title="Opcional: vazio = todas as seções" style="width: 90px; padding: 8px; font-size: 0.9rem;">
+                            <input type="text" name="term_category" placeholder="Órgão (opcional)" title="Opcional: ex. Ministério da Educação" style="width: 120px; padding: 8px; font-size: 0.9rem;">
                             <button type="submit" name="action" value="add_term" style="background: var(--success-color); width: auto; padding: 8px 12px; font-size: 0.9rem; margin: 0;">+</button>
                         </form>
                     </div>
@@ -0,0 +1,176 @@
+"""
+Local full-text index of DOU articles (SQLite FTS5).
+
+Filled by the daily pipeline and by backfill.py, so past editions can be
+searched without downloading anything from INLABS. Candidates come from
+an FTS phrase query per term; search.match_article then confirms each hit
+with the same substring matching the daily search uses, and builds the
+snippets.
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from logging_config import setup_logger
+
+logger = setup_logger('article_index')
+
+INDEX_DB_PATH = Path(os.getenv('INDEX_DB_PATH', 'dou_index.db'))
+
+
+def get_connection(db_path=None):
+    """Open the index, creating the schema on first use."""
+    conn = sqlite3.connect(db_path or INDEX_DB_PATH, timeout=30)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS articles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pub_date TEXT NOT NULL,
+            section TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            xml_path TEXT,
+            art_category TEXT,
+            fingerprint TEXT,
+            text TEXT NOT NULL,
+            UNIQUE (pub_date, section, filename)
+        );
+        CREATE INDEX IF NOT EXISTS idx_articles_date ON articles(pub_date);
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+            text, content='articles', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+            INSERT INTO articles_fts(rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+            INSERT INTO articles_fts(articles_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END;
+    ''')
+    return conn
+
+
+def index_articles(pub_date: str, articles: Iterable[Dict], db_path=None) -> int:
+    """
+    Add (or replace) the articles of one edition date.
+
+    Args:
+        pub_date (str): Edition date, YYYY-MM-DD.
+        articles (list): Article dicts as returned by extract.extract_articles.
+
+    Returns:
+        int: Number of articles indexed.
+    """
+    conn = get_connection(db_path)
+    count = 0
+    try:
+        with conn:
+            for article in articles:
+                conn.execute('DELETE FROM articles WHERE pub_date = ? AND section = ? AND filename = ?',
+                             (pub_date, article['section'], article['filename']))
+                fingerprint = article.get('fingerprint')
+                conn.execute('''
+                    INSERT INTO articles (pub_date, section, filename, xml_path, art_category, fingerprint, text)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (pub_date, article['section'], article['filename'], article.get('xml_path'),
+                      article.get('artCategory'), f"{fingerprint:016x}" if fingerprint is not None else None,
+                      article['text']))
+                count += 1
+    finally:
+        conn.close()
+    logger.info(f"Indexed {count} articles for {pub_date}.")
+    return count
+
+
+def _phrase_query(term):
+    """FTS5 phrase query for a term (quotes escaped)."""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_index(search_terms: List[str], since: str = None, until: str = None,
+                 sections: List[str] = None, db_path=None) -> List[Dict]:
+    """
+    Search indexed editions.
+
+    Args:
+        search_terms (list): Terms to search for.
+        since (str): First edition date (YYYY-MM-DD), inclusive.
+        until (str): Last edition date (YYYY-MM-DD), inclusive.
+        sections (list): Restrict to these sections.
+
+    Returns:
+        list: Matches shaped like search.match_article results, newest edition
+            first; each article also has 'pub_date'.
+    """
+    from search import match_article
+
+    filters, params = [], []
+    if since:
+        filters.append('a.pub_date >= ?')
+        params.append(since)
+    if until:
+        filters.append('a.pub_date <= ?')
+        params.append(until)
+    if sections:
+        filters.append(f"a.section IN ({','.join('?' * len(sections))})")
+        params.extend(sections)
+    where = ''.join(f' AND {f}' for f in filters)
+
+    conn = get_connection(db_path)
+    rows = {}
+    try:
+        for term in search_terms:
+            try:
+                cursor = conn.execute(f'''
+                    SELECT a.id, a.pub_date, a.section, a.filename, a.xml_path, a.art_category, a.fingerprint, a.text
+                    FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid
+                    WHERE articles_fts MATCH ?{where}
+                ''', [_phrase_query(term)] + params)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Skipping term {term!r} in index search: {e}")
+                continue
+            for row in cursor:
+                rows[row[0]] = row
+    finally:
+        conn.close()
+
+    matches = []
+    for _, pub_date, section, filename, xml_path, art_category, fingerprint, text in rows.values():
+        article = {
+            'section': section,
+            'filename': filename,
+            'text': text,
+            'xml_path': xml_path,
+            'artCategory': art_category,
+            'pub_date': pub_date,
+        }
+        if fingerprint:
+            article['fingerprint'] = int(fingerprint, 16)
+        match = match_article(article, search_terms)
+        if match:
+            matches.append(match)
+    matches.sort(key=lambda m: (m['article']['pub_date'], m['article']['section'], m['article']['filename']),
+                 reverse=True)
+    logger.info(f"Index search for {len(search_terms)} term(s): {len(matches)} match(es).")
+    return matches
+
+
+def indexed_dates(db_path=None) -> List[str]:
+    """Edition dates present in the index, oldest first."""
+    conn = get_connection(db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT DISTINCT pub_date FROM articles ORDER BY pub_date')]
+    finally:
+        conn.close()
+
+
+def get_stats(db_path=None) -> Dict:
+    conn = get_connection(db_path)
+    try:
+        articles, dates, first, last = conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT pub_date), MIN(pub_date), MAX(pub_date) FROM articles').fetchone()
+    finally:
+        conn.close()
+    path = Path(db_path or INDEX_DB_PATH)
+    return {'articles': articles, 'dates': dates, 'first_date': first, 'last_date': last,
+            'bytes': path.stat().st_size if path.exists() else 0}
@@ -0,0 +1,171 @@
+"""
+Historical backfill: download, extract and index past DOU editions.
+
+Dates are processed by a bounded pool of workers sharing one INLABS
+session, with every INLABS request going through a token bucket
+(BACKFILL_MAX_PER_SECOND). Progress is kept in a manifest, so an
+interrupted backfill resumes where it stopped: dates already indexed or
+known to have no edition (every section answered 404) are skipped; failed
+dates, and partial ones with the sections that failed, are retried.
+
+Usage:
+    python backfill.py START END [--sections "DO1 DO2"] [--workers N]
+    python backfill.py --status
+"""
+
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict
+
+from article_index import get_stats, index_articles
+from download import DEFAULT_SECTIONS, create_session, is_valid_zip, try_download_for_date
+from extract import extract_articles
+from logging_config import setup_logger
+from ratelimit import TokenBucket
+
+logger = setup_logger('backfill')
+
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 3))
+BACKFILL_MAX_PER_SECOND = float(os.getenv('BACKFILL_MAX_PER_SECOND', 1))
+MANIFEST_PATH = Path('downloads') / 'backfill_manifest.json'
+
+
+class BackfillManifest:
+    """Per-date backfill status, saved after every change."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            self.entries = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_finished(self, date_str):
+        return self.entries.get(date_str, {}).get('status') in ('done', 'empty')
+
+    def update(self, date_str, **info):
+        with self._lock:
+            entry = self.entries.setdefault(date_str, {'attempts': 0})
+            entry.pop('error', None)
+            entry.pop('missing', None)
+            entry.update(info)
+            entry['attempts'] += 1
+            entry['updated_at'] = datetime.now().isoformat()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.entries, indent=1, sort_keys=True), encoding='utf-8')
+            tmp_path.replace(self.path)
+
+
+def backfill(start: str, end: str, sections=DEFAULT_SECTIONS, workers=BACKFILL_WORKERS,
+             max_per_second=BACKFILL_MAX_PER_SECOND, download_dir="downloads",
+             extract_dir="extracted", manifest_path=MANIFEST_PATH, db_path=None) -> Dict:
+    """
+    Download, extract and index every edition between start and end (inclusive).
+
+    Args:
+        start (str): First date, YYYY-MM-DD.
+        end (str): Last date, YYYY-MM-DD.
+        sections (str): Space-separated sections.
+        workers (int): Dates processed concurrently.
+        max_per_second (float): INLABS requests per second across all workers.
+
+    Returns:
+        dict: {'done': int, 'partial': int, 'empty': int, 'failed': int, 'skipped': int, 'articles': int}
+    """
+    start_date = datetime.strptime(start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end, "%Y-%m-%d").date()
+    manifest = BackfillManifest(manifest_path)
+    dates = [(start_date + timedelta(days=n)).strftime("%Y-%m-%d")
+             for n in range((end_date - start_date).days + 1)]
+    pending = [d for d in dates if not manifest.is_finished(d)]
+    summary = {'done': 0, 'partial': 0, 'empty': 0, 'failed': 0, 'skipped': len(dates) - len(pending), 'articles': 0}
+    if not pending:
+        logger.info("Nothing to backfill, all dates already processed.")
+        return summary
+
+    logger.info(f"Backfilling {len(pending)} date(s) ({summary['skipped']} already done) "
+                f"with {workers} worker(s), {max_per_second} req/s.")
+    session = create_session()
+    cookie = session.cookies.get('inlabs_session_cookie')
+    limiter = TokenBucket(max_per_second, burst=1)
+    today_str = date.today().strftime("%Y-%m-%d")
+
+    def process(date_str):
+        download_path = Path(download_dir) / date_str
+        download_path.mkdir(parents=True, exist_ok=True)
+        zip_files = []
+        outcomes = {}
+        for section in sections.split():
+            zip_path = download_path / f"{date_str}-{section}.zip"
+            if not (zip_path.exists() and is_valid_zip(zip_path)):
+                limiter.acquire()
+            # Past editions don't change: no revalidation round trip for ZIPs already on disk
+            zip_files.extend(try_download_for_date(session, cookie, date_str, section, download_path,
+                                                   revalidate=False, outcomes=outcomes))
+        # Throttled, 5xx or interrupted sections: retried on the next run, never taken for "no edition"
+        missing = [section for section, outcome in outcomes.items() if outcome == 'failed']
+
+        if not zip_files:
+            if missing:
+                raise RuntimeError(f"download failed for {' '.join(missing)}")
+            # Today's edition may still be published; don't record it as empty
+            if date_str < today_str:
+                manifest.update(date_str, status='empty')
+            return 'empty', 0
+
+        articles = extract_articles(zip_files, extract_dir=extract_dir)
+        count = index_articles(date_str, articles, db_path=db_path)
+        status = 'partial' if missing else 'done'
+        manifest.update(date_str, status=status, articles=count,
+                        sections=[Path(p).stem.split('-')[-1] for p in zip_files],
+                        **({'missing': missing} if missing else {}))
+        return status, count
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(process, d): d for d in pending}
+            for future in as_completed(futures):
+                date_str = futures[future]
+                try:
+                    status, count = future.result()
+                    summary[status] += 1
+                    summary['articles'] += count
+                    logger.info(f"{date_str}: {status} ({count} articles)")
+                except Exception as e:
+                    summary['failed'] += 1
+                    manifest.update(date_str, status='failed', error=str(e))
+                    logger.error(f"{date_str}: failed: {e}")
+    finally:
+        session.close()
+
+    logger.info(f"Backfill finished: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    try:
+        if '--status' in sys.argv:
+            entries = BackfillManifest().entries
+            counts = {}
+            for entry in entries.values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+            print(f"Manifest: {counts}")
+            print(f"Index: {get_stats()}")
+        elif len(sys.argv) >= 3:
+            args = sys.argv[1:]
+            sections = args[args.index('--sections') + 1] if '--sections' in args else DEFAULT_SECTIONS
+            workers = int(args[args.index('--workers') + 1]) if '--workers' in args else BACKFILL_WORKERS
+            print(backfill(args[0], args[1], sections=sections, workers=workers))
+        else:
+            print(__doc__)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.")
+    except Exception as e:
+        logger.error(f"Main execution error: {e}")
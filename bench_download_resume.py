@@ -0,0 +1,135 @@
+"""
+Benchmark: ZIP downloads over a flaky connection, against a local mock
+INLABS server that supports Range, If-Range and conditional requests.
+
+The server cuts the connection partway through the body a few times.
+download.try_download_for_date resumes from the .part file instead of
+starting over; then a second run revalidates the ZIP on disk and gets a
+304. Prints the bytes the server sent in each case. Usage:
+
+    python bench_download_resume.py [zip_mb] [drops]
+"""
+
+import io
+import os
+import sys
+import tempfile
+import threading
+import zipfile
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+import download
+from zipstore import get_store
+
+
+def build_zip(size_mb):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for i in range(size_mb):
+            zf.writestr(f'DO3_{i:05d}.xml', os.urandom(1024 * 1024))
+    return buffer.getvalue()
+
+
+class MockInlabs(BaseHTTPRequestHandler):
+    body = b''
+    etag = '"dou-1"'
+    last_modified = formatdate(usegmt=True)
+    drops_left = 0
+    sent = 0
+    log = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        if self.headers.get('If-None-Match') == cls.etag:
+            cls.log.append('304')
+            self.send_response(304)
+            self.send_header('ETag', cls.etag)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range', '')
+        if_range = self.headers.get('If-Range')
+        if range_header.startswith('bytes=') and if_range in (None, cls.etag, cls.last_modified):
+            start = int(range_header[6:].split('-')[0])
+            if start >= len(cls.body):
+                self.send_response(416)
+                self.end_headers()
+                return
+        chunk = cls.body[start:]
+
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header('Content-Range', f'bytes {start}-{len(cls.body) - 1}/{len(cls.body)}')
+        self.send_header('Content-Length', str(len(chunk)))
+        self.send_header('ETag', cls.etag)
+        self.send_header('Last-Modified', cls.last_modified)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        if cls.drops_left:
+            # Drop the connection after a third of the remaining body
+            cls.drops_left -= 1
+            chunk = chunk[:len(chunk) // 3]
+            cls.log.append(f'{self.command} from {start}, dropped after {len(chunk)}')
+            self.wfile.write(chunk)
+            cls.sent += len(chunk)
+            self.close_connection = True
+            return
+        cls.log.append(f'{self.command} from {start}, complete')
+        self.wfile.write(chunk)
+        cls.sent += len(chunk)
+
+
+def run(server_url, download_dir, revalidate=True):
+    download.URL_DOWNLOAD = f"{server_url}/index.php?p="
+    MockInlabs.sent, MockInlabs.log = 0, []
+    download_path = Path(download_dir) / '2025-01-02'
+    download_path.mkdir(parents=True, exist_ok=True)
+    files = download.try_download_for_date(requests.Session(), 'cookie', '2025-01-02', 'DO3',
+                                           download_path, revalidate=revalidate)
+    return files, MockInlabs.sent, list(MockInlabs.log)
+
+
+def main():
+    zip_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    drops = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    MockInlabs.body = build_zip(zip_mb)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockInlabs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server_url = f"http://127.0.0.1:{server.server_address[1]}"
+    size = len(MockInlabs.body)
+
+    with tempfile.TemporaryDirectory() as download_dir:
+        MockInlabs.drops_left = drops
+        files, sent, log = run(server_url, download_dir)
+        assert files and Path(files[0]).read_bytes() == MockInlabs.body, "resumed download differs"
+        assert not list(Path(download_dir).glob('*/*.part*'))
+        print(f"ZIP: {size / 1e6:.1f} MB, connection dropped {drops} time(s)")
+        print(f"  resumed:      {sent / 1e6:.1f} MB sent ({' | '.join(log)})")
+        # Restarting from zero after each drop would send every partial body plus the full one
+        restart = size + sum(size // 3 for _ in range(drops))
+        print(f"  from scratch: {restart / 1e6:.1f} MB would be sent")
+
+        files, sent, log = run(server_url, download_dir)
+        assert files and log == ['304']
+        print(f"  revalidation: {sent} bytes of body sent ({' | '.join(log)})")
+
+        MockInlabs.etag = '"dou-2"'
+        MockInlabs.body = build_zip(zip_mb)
+        files, sent, log = run(server_url, download_dir)
+        assert Path(files[0]).read_bytes() == MockInlabs.body
+        print(f"  republished:  {sent / 1e6:.1f} MB sent ({' | '.join(log)}), "
+              f"{get_store(download_dir).prune()} old copy pruned")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: rendering the daily digest for many recipients, with and without
+the per-run article block cache (email_templates.DigestRenderer).
+
+Recipients draw their matches from a shared pool of articles, as in a real
+run where most people monitor overlapping terms. Usage:
+
+    python bench_email_render.py [recipients] [articles] [matches_per_recipient]
+"""
+
+import random
+import sys
+import time
+
+from email_templates import DigestRenderer
+
+TERMS = ['Resolução CNE/CES', 'reconhecimento de diplomas', 'pós-graduação', 'Abrafi', '589/2025']
+
+
+def build_matches(count):
+    rng = random.Random(42)
+    words = ('ministério educação portaria conselho nacional processo parecer '
+             'diploma exterior universidade homologação despacho').split()
+    matches = []
+    for i in range(count):
+        text = ' '.join(rng.choice(words) for _ in range(400))
+        terms = rng.sample(TERMS, 2)
+        matches.append({
+            'article': {'section': rng.choice(['DO1', 'DO2', 'DO3']), 'filename': f'{i:05d}.xml',
+                        'xml_path': f'#xml-DO1-{i:05d}.xml', 'text': text, 'fingerprint': i},
+            'terms_matched': terms,
+            'summary': text[:300],
+            'snippets': [f'... {text[j:j + 200]} {terms[0]} {text[j + 200:j + 400]} ...' for j in (0, 400, 800)],
+        })
+    return matches
+
+
+def main():
+    recipients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    articles = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    per_recipient = int(sys.argv[3]) if len(sys.argv) > 3 else 15
+
+    pool = build_matches(articles)
+    rng = random.Random(7)
+    batches = [(f'user{i}@example.com', rng.sample(pool, per_recipient)) for i in range(recipients)]
+    date_str = '18/10/2026'
+
+    start = time.perf_counter()
+    uncached = [DigestRenderer().render(email, date_str, matches) for email, matches in batches]
+    uncached_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    renderer = DigestRenderer()
+    cached = [renderer.render(email, date_str, matches) for email, matches in batches]
+    cached_time = time.perf_counter() - start
+
+    assert cached == uncached, "cached rendering must produce identical emails"
+
+    print(f"Recipients: {recipients}, article pool: {articles}, matches per email: {per_recipient}")
+    print(f"Render every block per recipient: {uncached_time * 1000:.0f} ms")
+    print(f"Render once, assemble per recipient: {cached_time * 1000:.0f} ms "
+          f"(blocks rendered {renderer.blocks.stats['rendered']}, reused {renderer.blocks.stats['reused']})")
+    print(f"Speedup: {uncached_time / cached_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
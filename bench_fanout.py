@@ -0,0 +1,96 @@
+"""
+Benchmark: distributed notification fan-out (fanout.py) with 1 to N workers.
+
+Runs the coordinator and worker threads against an in-memory Redis
+(fakeredis, pip install fakeredis), with SMTP replaced by a fixed delay per
+recipient. Prints the time to notify every shard for each worker count,
+then shows a worker dying mid-task: its task is reclaimed by another
+worker and the stage still completes. Usage:
+
+    python bench_fanout.py [recipients] [ms_per_recipient] [max_workers]
+"""
+
+import sys
+import threading
+import time
+
+import fakeredis
+
+import fanout
+
+
+def make_notify(ms_per_recipient):
+    def notify(client, task):
+        # Stand-in for rendering and sending to a shard of recipients
+        time.sleep(len(task['emails']) * ms_per_recipient / 1000)
+        return {'queued': len(task['emails']), 'sent': len(task['emails']), 'retrying': 0, 'dead': 0}
+    return notify
+
+
+def start_workers(server, count, handlers, stop, claim_idle=fanout.FANOUT_CLAIM_IDLE_SECONDS):
+    workers = []
+    for i in range(count):
+        worker = fanout.FanoutWorker(fakeredis.FakeRedis(server=server, decode_responses=True), name=f'worker-{i}',
+                                     handlers=handlers, claim_idle=claim_idle)
+        workers.append(worker)
+
+        def loop(worker=worker):
+            while not stop.is_set():
+                worker.step(block_ms=100)
+        threading.Thread(target=loop, daemon=True).start()
+    return workers
+
+
+def notify_tasks(emails):
+    size = fanout.FANOUT_SHARD_SIZE
+    return [{'id': f"shard-{n}", 'emails': emails[i:i + size]} for n, i in enumerate(range(0, len(emails), size))]
+
+
+def main():
+    recipients = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    ms_per_recipient = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    emails = [f"user{i:05d}@example.com" for i in range(recipients)]
+    tasks = notify_tasks(emails)
+    handlers = {'notify': make_notify(ms_per_recipient)}
+    print(f"{recipients} recipients in {len(tasks)} shards of {fanout.FANOUT_SHARD_SIZE}, "
+          f"{ms_per_recipient:g} ms each")
+
+    baseline = None
+    workers = 1
+    while workers <= max_workers:
+        server = fakeredis.FakeServer()
+        stop = threading.Event()
+        start_workers(server, workers, handlers, stop)
+        start = time.perf_counter()
+        results = fanout.run_stage(fakeredis.FakeRedis(server=server, decode_responses=True),
+                                   f'bench-{workers}', 'notify', tasks, wait=600, work=False)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        assert sum(r['sent'] for r in results.values()) == recipients
+        baseline = baseline or elapsed
+        print(f"  {workers} worker(s): {elapsed:6.2f}s  speedup {baseline / elapsed:4.1f}x")
+        workers *= 2
+
+    # A consumer takes a task and dies without acknowledging it
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    fanout.ensure_groups(client)
+    stop = threading.Event()
+    few_tasks = notify_tasks(emails[:4 * fanout.FANOUT_SHARD_SIZE])
+    publisher = threading.Thread(target=lambda: fanout.run_stage(client, 'bench-crash', 'notify', few_tasks,
+                                                                 wait=60, work=False))
+    publisher.start()
+    while client.xlen(fanout.STREAMS['notify']) < len(few_tasks):
+        time.sleep(0.01)
+    client.xreadgroup(fanout.FANOUT_GROUP, 'dead-worker', {fanout.STREAMS['notify']: '>'}, count=1)
+    start = time.perf_counter()
+    survivors = start_workers(server, 2, handlers, stop, claim_idle=1.0)
+    publisher.join()
+    stop.set()
+    print(f"  crashed consumer: stage completed in {time.perf_counter() - start:.2f}s, "
+          f"{sum(w.stats['reclaimed'] for w in survivors)} task(s) reclaimed after 1s idle")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: ad-hoc search extraction (api/index.extract_articles_vercel)
+with and without the byte-level prefilter (prefilter.TermPrefilter).
+
+Builds synthetic DOU ZIPs in memory, with INLABS-like XML (HTML body in a
+CDATA section, accented text), where about 1% of the files contain a term.
+Checks that both runs find the same matches. Usage:
+
+    python bench_prefilter.py [xml_per_section]
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+from index import extract_articles_vercel  # noqa: E402
+from prefilter import TermPrefilter  # noqa: E402
+from search import match_article  # noqa: E402
+
+SECTIONS = ['DO1', 'DO2', 'DO3']
+TERMS = ['Resolução CNE/CES nº 2/2024', 'reconhecimento de diplomas', '23001.000069/2025-95', 'Parecer 589/2025']
+WORDS = ('ministério educação portaria conselho nacional processo universidade servidora '
+         'homologação despacho servidor nomeação exoneração diploma órgão união').split()
+CATEGORIES = ['Ministério da Educação/Gabinete do Ministro', 'Ministério da Saúde', 'Ministério da Fazenda']
+
+
+def build_zips(xml_per_section):
+    rng = random.Random(7)
+    zip_data = {}
+    for section in SECTIONS:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for i in range(xml_per_section):
+                paragraphs = [' '.join(rng.choice(WORDS) for _ in range(80)) for _ in range(6)]
+                if rng.random() < 0.01:
+                    paragraphs[rng.randrange(6)] += ' ' + rng.choice(TERMS)
+                body = ''.join(f'<p class="dou-paragraph">{p}</p>' for p in paragraphs)
+                xml = (f'<xml><article id="{i}" pubName="{section}" artCategory="{rng.choice(CATEGORIES)}">'
+                       f'<body><Identifica><![CDATA[PORTARIA Nº {i}]]></Identifica>'
+                       f'<Texto><![CDATA[{body}]]></Texto></body></article></xml>')
+                zf.writestr(f'{section}_{i:05d}.xml', xml.encode('utf-8'))
+        zip_data[section] = buffer.getvalue()
+    return zip_data
+
+
+def search(zip_data, prefilter):
+    start = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        articles = extract_articles_vercel(zip_data, prefilter=prefilter)
+    found = sorted(m['article']['filename'] for m in (match_article(a, TERMS) for a in articles) if m)
+    return found, len(articles), time.process_time() - start
+
+
+def inflate_only(zip_data):
+    """CPU spent just decompressing every member: the floor for both runs."""
+    start = time.process_time()
+    for zip_bytes in zip_data.values():
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+            for name in zf.namelist():
+                zf.read(name)
+    return time.process_time() - start
+
+
+def main():
+    xml_per_section = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    zip_data = build_zips(xml_per_section)
+
+    inflate_cpu = inflate_only(zip_data)
+    full, full_parsed, full_cpu = search(zip_data, None)
+    prefilter = TermPrefilter(TERMS)
+    fast, fast_parsed, fast_cpu = search(zip_data, prefilter)
+
+    assert full == fast, "prefilter changed the results"
+    print(f"Sections: {len(SECTIONS)} x {xml_per_section} XML, {len(full)} matching files")
+    print(f"Full parse: {full_parsed} parsed, {full_cpu:.2f}s CPU")
+    print(f"Prefilter:  {fast_parsed} parsed, {fast_cpu:.2f}s CPU "
+          f"({prefilter.stats['skipped']} skipped, {full_cpu / fast_cpu:.1f}x faster)")
+    print(f"Excluding ZIP inflate ({inflate_cpu:.2f}s): {full_cpu - inflate_cpu:.2f}s vs "
+          f"{fast_cpu - inflate_cpu:.2f}s ({(full_cpu - inflate_cpu) / max(fast_cpu - inflate_cpu, 1e-3):.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: EmailSearchManager listings, one GET per member (N+1) vs. pipelined MGET.
+
+Runs against REDIS_URL when set, otherwise against an in-memory fakeredis
+(pip install fakeredis). It writes keys under the names the manager uses,
+so point REDIS_URL at an empty database. Counts the round trips and time
+of get_all_emails and get_search_terms with both approaches. Usage:
+
+    python bench_redis_listing.py [emails] [terms]
+"""
+
+import json
+import os
+import sys
+import time
+
+import redis
+
+if not os.getenv('REDIS_URL'):
+    import fakeredis
+    os.environ['REDIS_URL'] = 'redis://fakeredis'
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server, decode_responses=True)
+
+from email_search_manager import email_search_manager  # noqa: E402
+
+ROUND_TRIPS = 0
+
+
+def count_round_trips(client):
+    """Count one round trip per command, and one per executed pipeline."""
+    execute_command = client.execute_command
+
+    def counted(*args, **kwargs):
+        global ROUND_TRIPS
+        ROUND_TRIPS += 1
+        return execute_command(*args, **kwargs)
+    client.execute_command = counted
+
+    pipeline_execute = redis.client.Pipeline.execute
+
+    def counted_execute(self, *args, **kwargs):
+        global ROUND_TRIPS
+        ROUND_TRIPS += 1
+        return pipeline_execute(self, *args, **kwargs)
+    redis.client.Pipeline.execute = counted_execute
+
+
+def populate(client, emails, terms):
+    with client.pipeline(transaction=False) as pipe:
+        for i in range(emails):
+            email = f"user{i:05d}@example.com"
+            pipe.set(f"email:{email}", json.dumps({"email": email, "name": f"User {i}", "active": True}))
+            pipe.sadd("emails:all", email)
+        for i in range(terms):
+            term_id = f"termo_{i:05d}"
+            pipe.set(f"search_term:{term_id}", json.dumps({"term": f"termo {i:05d}", "term_id": term_id,
+                                                           "category": "geral", "active": True}))
+            pipe.sadd("search_terms:all", term_id)
+        pipe.execute()
+
+
+def n_plus_one_emails(manager):
+    return [data for data in (manager.get_email(e) for e in manager.redis.client.smembers("emails:all")) if data]
+
+
+def n_plus_one_terms(manager):
+    return [data for data in (manager.get_search_term(t) for t in manager.redis.client.smembers("search_terms:all"))
+            if data]
+
+
+def measure(fn):
+    global ROUND_TRIPS
+    ROUND_TRIPS = 0
+    start = time.perf_counter()
+    result = fn()
+    return result, ROUND_TRIPS, time.perf_counter() - start
+
+
+def main():
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    terms = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    client = email_search_manager.redis.client
+    populate(client, emails, terms)
+    count_round_trips(client)
+
+    for label, old, new, expected in (
+            ('get_all_emails', lambda: n_plus_one_emails(email_search_manager),
+             email_search_manager.get_all_emails, emails),
+            ('get_search_terms', lambda: n_plus_one_terms(email_search_manager),
+             email_search_manager.get_search_terms, terms)):
+        old_result, old_trips, old_seconds = measure(old)
+        new_result, new_trips, new_seconds = measure(new)
+        assert len(old_result) == len(new_result) == expected
+        assert sorted(map(json.dumps, old_result)) == sorted(map(json.dumps, new_result))
+        print(f"{label} ({expected} items):")
+        print(f"  GET per member: {old_trips:>6} round trips {old_seconds:7.3f}s")
+        print(f"  pipelined MGET: {new_trips:>6} round trips {new_seconds:7.3f}s")
+
+
+if __name__ == '__main__':
+    main()
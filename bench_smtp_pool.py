@@ -0,0 +1,82 @@
+"""
+Benchmark: one SMTP connection per recipient vs. the pooled sender (mailer.SMTPPool).
+
+Uses a local aiosmtpd server (no TLS, hence allow_plaintext) as a stand-in for
+the real relay, so it needs `pip install aiosmtpd`. Usage:
+
+    python bench_smtp_pool.py [recipients] [pool_size]
+"""
+
+import sys
+import time
+
+from aiosmtpd.controller import Controller
+
+from mailer import SMTPPool, build_html_message
+
+HOST = '127.0.0.1'
+PORT = 8025
+SENDER = 'monitoradouniao@example.com'
+
+
+class CountingHandler:
+    """Accept every message and just count it."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def build_messages(count):
+    html = '<html><body><p>Notificação de teste</p></body></html>' * 20
+    return [
+        build_html_message(SENDER, f'user{i}@example.com', 'DOU Notificações - benchmark', html)
+        for i in range(count)
+    ]
+
+
+def send_one_connection_per_message(messages):
+    """Old behaviour: connect (EHLO, LOGIN...) and QUIT for every recipient."""
+    for msg in messages:
+        with SMTPPool(HOST, PORT, allow_plaintext=True) as pool:
+            pool.send_message(msg)
+
+
+def send_pooled(messages, size):
+    with SMTPPool(HOST, PORT, size=size, allow_plaintext=True) as pool:
+        for msg in messages:
+            pool.send_message(msg)
+    return pool.stats
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    messages = build_messages(count)
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        start = time.perf_counter()
+        send_one_connection_per_message(messages)
+        per_message = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats = send_pooled(messages, size)
+        pooled = time.perf_counter() - start
+    finally:
+        controller.stop()
+
+    print(f"Recipients: {count}  (server received {handler.received} messages)")
+    print(f"One connection per message: {per_message:.2f}s ({count / per_message:.0f} msg/s, {count} connections)")
+    print(f"Pooled (size={size}):          {pooled:.2f}s ({count / pooled:.0f} msg/s, "
+          f"{stats['connections_opened']} connections)")
+    print(f"Speedup: {per_message / pooled:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
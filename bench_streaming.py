@@ -0,0 +1,87 @@
+"""
+Benchmark: staged pipeline (download all -> extract all -> match all) vs.
+streaming mode (streaming.stream_matches).
+
+Builds synthetic DOU ZIPs for six sections and simulates the download of
+each section with a fixed delay, so no INLABS access is needed. Usage:
+
+    python bench_streaming.py [xml_per_section] [download_seconds_per_section]
+"""
+
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from extract import extract_articles
+from search import match_articles
+from streaming import stream_matches
+
+SECTIONS = ['DO1', 'DO1E', 'DO2', 'DO3', 'DO2E', 'DO3E']
+TERMS = ['reconhecimento de diplomas', 'Resolução CNE/CES', '23001.000069/2025-95']
+WORDS = ('ministério educação portaria conselho nacional processo parecer '
+         'universidade homologação despacho servidor nomeação exoneração').split()
+
+
+def build_zips(base_dir, xml_per_section):
+    rng = random.Random(1)
+    date_dir = Path(base_dir) / 'downloads' / '2026-10-16'
+    date_dir.mkdir(parents=True)
+    paths = []
+    for section in SECTIONS:
+        zip_path = date_dir / f'2026-10-16-{section}.zip'
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for i in range(xml_per_section):
+                text = ' '.join(rng.choice(WORDS) for _ in range(600))
+                if rng.random() < 0.02:
+                    text += ' ' + rng.choice(TERMS)
+                zf.writestr(f'{section}_{i:05d}.xml',
+                            f'<xml><article artCategory="Portaria"><Texto>{text}</Texto></article></xml>')
+        paths.append(str(zip_path))
+    return paths
+
+
+def slow_source(paths, delay):
+    """Yield ZIP paths as if each section took `delay` seconds to download."""
+    for path in paths:
+        time.sleep(delay)
+        yield path
+
+
+def run_staged(paths, delay, extract_dir):
+    start = time.perf_counter()
+    downloaded = list(slow_source(paths, delay))
+    articles = extract_articles(downloaded, extract_dir=extract_dir)
+    extracted_at = time.perf_counter() - start
+    matches = match_articles(articles, TERMS)
+    total = time.perf_counter() - start
+    # In the staged mode nothing is matched before everything is extracted
+    return matches, {'first_match': round(extracted_at, 3) if matches else None, 'total': round(total, 3)}
+
+
+def main():
+    xml_per_section = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_zips(tmp, xml_per_section)
+
+        staged_matches, staged = run_staged(paths, delay, str(Path(tmp) / 'extracted-staged'))
+
+        stream_stats = {}
+        stream_matches_found = stream_matches(TERMS, zip_source=slow_source(paths, delay),
+                                              extract_dir=str(Path(tmp) / 'extracted-stream'),
+                                              stats=stream_stats)
+
+    assert len(staged_matches) == len(stream_matches_found)
+    print(f"Sections: {len(SECTIONS)} x {xml_per_section} XML, simulated download {delay}s/section")
+    print(f"Staged:    first match {staged['first_match']}s, total {staged['total']}s")
+    print(f"Streaming: first match {stream_stats['first_match']}s, total {stream_stats['total']}s "
+          f"(download done {stream_stats['download_done']}s, extract done {stream_stats['extract_done']}s)")
+    print(f"Matches: {len(stream_matches_found)}")
+
+
+if __name__ == '__main__':
+    main()
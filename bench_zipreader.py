@@ -0,0 +1,72 @@
+"""
+Benchmark: reading the XML members of a DOU ZIP with zipfile, one member
+at a time, vs. zipreader.iter_xml_members (one central-directory pass,
+images skipped unread, parallel inflate).
+
+Builds a synthetic ZIP with XML members and a few large JPEG-like members,
+and checks that both readers return the same XML. Usage:
+
+    python bench_zipreader.py [xml_members] [workers]
+"""
+
+import io
+import os
+import random
+import sys
+import time
+import zipfile
+
+from zipreader import iter_xml_members, new_stats
+
+WORDS = ('ministério educação portaria conselho nacional processo parecer universidade '
+         'homologação despacho servidor nomeação exoneração diploma').split()
+
+
+def build_zip(xml_members):
+    rng = random.Random(3)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(xml_members):
+            body = ''.join(f'<p>{" ".join(rng.choice(WORDS) for _ in range(120))}</p>' for _ in range(40))
+            zf.writestr(f'DO1_{i:05d}.xml', f'<xml><article><Texto><![CDATA[{body}]]></Texto></article></xml>')
+            if i % 50 == 0:
+                zf.writestr(f'img_{i:05d}.jpg', os.urandom(200_000), compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+def read_zipfile(zip_bytes):
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        names = [n for n in zf.namelist() if n.endswith('.xml')]
+        return [(n, zf.read(n)) for n in names]
+
+
+def main():
+    xml_members = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    zip_bytes = build_zip(xml_members)
+
+    start = time.perf_counter()
+    baseline = read_zipfile(zip_bytes)
+    baseline_seconds = time.perf_counter() - start
+
+    results = {}
+    for n in (1, workers):
+        stats = new_stats()
+        start = time.perf_counter()
+        members = list(iter_xml_members(zip_bytes, workers=n, stats=stats))
+        results[n] = (time.perf_counter() - start, stats)
+        assert members == baseline
+
+    stats = results[workers][1]
+    print(f"ZIP: {len(zip_bytes) / 1e6:.1f} MB, {stats['members']} members, {stats['xml_members']} XML, "
+          f"{stats['skipped_members']} others skipped ({stats['skipped_bytes'] / 1e6:.1f} MB unread)")
+    print(f"XML: {stats['compressed_bytes'] / 1e6:.1f} MB -> {stats['uncompressed_bytes'] / 1e6:.1f} MB, "
+          f"slowest member {stats['slowest_member']} ({stats['slowest_member_seconds'] * 1000:.2f} ms)")
+    print(f"zipfile, sequential:        {baseline_seconds:.3f}s")
+    for n, (seconds, _) in results.items():
+        print(f"zipreader, {n} worker(s):{' ' * (6 - len(str(n)))}{seconds:.3f}s "
+              f"({baseline_seconds / seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
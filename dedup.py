@@ -0,0 +1,144 @@
+"""
+Near-duplicate detection for DOU articles.
+
+The DOU often republishes almost identical acts (retificações, the same
+portaria in an extra edition). A 64-bit SimHash fingerprint is computed for
+every article at extraction time, and matches for the same terms whose
+fingerprints differ in only a few bits (and whose texts confirm it) are
+grouped so each cluster is summarized and notified once.
+"""
+
+import hashlib
+import re
+from typing import Dict, List
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+# Fingerprints within this Hamming distance are candidate near-duplicates
+DEFAULT_MAX_DISTANCE = 3
+# Share of shingles two candidate texts must have in common (Jaccard) to be grouped
+MIN_SIMILARITY = 0.9
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_TOKEN_RE = re.compile(r'\w+')
+
+# Each fingerprint bit gets its own 32-bit counter inside one big integer, so
+# the per-bit votes of all shingles are summed with plain integer additions.
+_FIELD_BITS = 32
+_FIELD_MASK = (1 << _FIELD_BITS) - 1
+_SPREAD = [
+    [
+        sum(1 << ((byte_index * 8 + bit) * _FIELD_BITS) for bit in range(8) if value >> bit & 1)
+        for value in range(256)
+    ]
+    for byte_index in range(FINGERPRINT_BITS // 8)
+]
+
+
+def _shingles(text):
+    """Lowercased word n-grams of the article text, ignoring embedded HTML."""
+    tokens = _TOKEN_RE.findall(_TAG_RE.sub(' ', text).lower())
+    if len(tokens) < SHINGLE_SIZE:
+        return set(tokens)
+    return {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def simhash(text: str) -> int:
+    """
+    Compute the 64-bit SimHash fingerprint of an article text.
+
+    Args:
+        text (str): Article text (may contain HTML markup).
+
+    Returns:
+        int: Fingerprint; 0 for texts without words.
+    """
+    shingles = _shingles(text)
+    if not shingles:
+        return 0
+
+    totals = 0
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        for byte_index, value in enumerate(digest):
+            totals += _SPREAD[byte_index][value]
+
+    fingerprint = 0
+    half = len(shingles) / 2
+    for bit in range(FINGERPRINT_BITS):
+        if (totals >> (bit * _FIELD_BITS)) & _FIELD_MASK > half:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two fingerprints."""
+    return bin(a ^ b).count('1')
+
+
+def _same_text(a: Dict, b: Dict, cache: Dict) -> bool:
+    """Confirm a fingerprint candidate: same text, or nearly all shingles in common."""
+    if a['text'] == b['text']:
+        return True
+    for article in (a, b):
+        if id(article) not in cache:
+            cache[id(article)] = _shingles(article['text'])
+    shingles_a, shingles_b = cache[id(a)], cache[id(b)]
+    union = len(shingles_a | shingles_b)
+    return bool(union) and len(shingles_a & shingles_b) / union >= MIN_SIMILARITY
+
+
+def group_near_duplicates(matches: List[Dict], max_distance: int = DEFAULT_MAX_DISTANCE) -> List[Dict]:
+    """
+    Collapse near-duplicate matches into one representative per cluster.
+
+    Only matches with the same matched terms are grouped, so no subscriber
+    loses the act that matched their term. Each match is compared with the
+    representative (first published member) of the existing clusters, never
+    with other members, so clusters don't chain. Candidates are found by
+    splitting fingerprints into max_distance + 1 bands (two fingerprints
+    within max_distance bits must agree on at least one band), then confirmed
+    with the exact Hamming distance and the article texts (see _same_text).
+
+    Args:
+        matches (list): Match dicts whose article has a 'fingerprint'.
+        max_distance (int): Maximum Hamming distance from the representative.
+
+    Returns:
+        list: Representative matches, in original order, each with
+            'duplicate_count' and 'duplicates' (article refs of the others).
+    """
+    bands = max_distance + 1
+    band_bits = FINGERPRINT_BITS // bands
+    band_mask = (1 << band_bits) - 1
+    buckets = {}
+    representatives = []
+    shingles = {}
+
+    for match in matches:
+        match['duplicate_count'] = 0
+        match['duplicates'] = []
+        article = match['article']
+        fingerprint = article.get('fingerprint')
+        if not fingerprint:
+            representatives.append(match)
+            continue
+        terms = frozenset(match['terms_matched'])
+        keys = [(terms, band, (fingerprint >> (band * band_bits)) & band_mask) for band in range(bands)]
+        representative = next(
+            (rep for key in keys for rep in buckets.get(key, [])
+             if hamming_distance(fingerprint, rep['article']['fingerprint']) <= max_distance
+             and _same_text(rep['article'], article, shingles)),
+            None)
+        if representative is None:
+            representatives.append(match)
+            for key in keys:
+                buckets.setdefault(key, []).append(match)
+            continue
+        representative['duplicate_count'] += 1
+        representative['duplicates'].append({
+            'filename': article['filename'],
+            'section': article['section'],
+            'xml_path': article.get('xml_path', ''),
+        })
+    return representatives
@@ -0,0 +1,84 @@
+"""
+Parallel, rate-limited dispatch of personalized notification emails.
+
+Messages are sent by N concurrent workers, each with its own pooled SMTP
+connection, so one slow recipient only holds up its own worker. A shared
+token bucket keeps the overall send rate under the relay limit (Gmail and
+most relays throttle or block bursts).
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from mailer import SMTPPool, build_html_message
+from ratelimit import TokenBucket
+
+logger = logging.getLogger('dispatcher')
+
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', 4))
+DISPATCH_MAX_PER_SECOND = float(os.getenv('DISPATCH_MAX_PER_SECOND', 5))
+
+
+class NotificationDispatcher:
+    """
+    Send many personalized emails concurrently under a messages-per-second cap.
+
+    Usage:
+        dispatcher = NotificationDispatcher(host, port, user, password)
+        results = dispatcher.dispatch([
+            {'recipient': 'a@x.com', 'subject': '...', 'html': '...'},
+        ])
+    """
+
+    def __init__(self, host, port, user, password, sender=None,
+                 workers=DISPATCH_WORKERS, max_per_second=DISPATCH_MAX_PER_SECOND):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender or user
+        self.workers = max(1, workers)
+        self.limiter = TokenBucket(max_per_second)
+        self.smtp_stats = {}
+
+    def _send_one(self, pool, job):
+        started = time.monotonic()
+        result = {'recipient': job['recipient'], 'status': 'sent'}
+        try:
+            self.limiter.acquire()
+            msg = build_html_message(self.sender, job['recipient'], job['subject'], job['html'])
+            pool.send(self.sender, job['recipient'], msg.as_string())
+            logger.info(f"Email sent to {job['recipient']}")
+        except Exception as e:
+            logger.error(f"Email send failed for {job['recipient']}: {e}")
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        return result
+
+    def dispatch(self, jobs: List[Dict]) -> List[Dict]:
+        """
+        Send all jobs and report the outcome per recipient.
+
+        Args:
+            jobs (list): Dicts with 'recipient', 'subject' and 'html'.
+
+        Returns:
+            list: [{'recipient': str, 'status': 'sent'|'failed', 'error': str, 'elapsed': float}, ...]
+                in the same order as jobs.
+        """
+        if not jobs:
+            return []
+
+        workers = min(self.workers, len(jobs))
+        with SMTPPool(self.host, self.port, self.user, self.password, size=workers) as pool:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(lambda job: self._send_one(pool, job), jobs))
+            self.smtp_stats = dict(pool.stats)
+
+        sent = sum(1 for r in results if r['status'] == 'sent')
+        logger.info(f"Dispatched {len(results)} emails: {sent} sent, {len(results) - sent} failed.")
+        return results
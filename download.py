@@ -1,8 +1,13 @@
 from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import time
 import requests
 import os
 from pathlib import Path
 from logging_config import setup_logger
+from ratelimit import get_inlabs_policy
+from zipstore import get_store
 
 logger = setup_logger('download')
 
@@ -16,19 +21,46 @@ DEFAULT_SECTIONS = "DO1 DO1E DO2 DO3 DO2E DO3E"
 URL_LOGIN = "https://inlabs.in.gov.br/logar.php"
 URL_DOWNLOAD = "https://inlabs.in.gov.br/index.php?p="
 
+# Concurrent availability probes when choosing which date to download
+PROBE_WORKERS = int(os.getenv('PROBE_WORKERS', 6))
+AVAILABILITY_CACHE = "availability.json"
+# Today's edition may still be published, so "not available" for today is only trusted briefly
+TODAY_NEGATIVE_TTL = 600
+AVAILABILITY_CACHE_DAYS = 10
+
+# ZIP downloads stream into a .part file; a dropped connection is resumed with Range
+DOWNLOAD_TIMEOUT = int(os.getenv('DOWNLOAD_TIMEOUT', 60))
+DOWNLOAD_RESUME_ATTEMPTS = int(os.getenv('DOWNLOAD_RESUME_ATTEMPTS', 3))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Ask the server whether ZIPs already on disk changed (ETag / Last-Modified)
+DOWNLOAD_REVALIDATE = os.getenv('DOWNLOAD_REVALIDATE', '1') == '1'
+RESUME_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                 requests.exceptions.Timeout)
+
 
 def is_valid_zip(file_path):
-    """Check if a file is a valid ZIP file by checking its signature."""
+    """
+    Check if a file is a complete ZIP (signature and central directory; member
+    CRCs are checked on extraction, see zipstore).
+
+    Files already verified are trusted through the download store's manifest
+    while unchanged; corrupt files are deleted so they get downloaded again.
+    """
     try:
-        with open(file_path, 'rb') as f:
-            signature = f.read(4)
-            return signature.startswith(b'PK')
-    except Exception:
+        return get_store(Path(file_path).parent.parent).is_valid(file_path)
+    except Exception as e:
+        logger.warning(f"Could not verify {file_path}: {e}")
         return False
 
 
 def create_session():
-    """Create and login to INLABS session."""
+    """
+    Create and login to INLABS session.
+
+    Like every INLABS request, the login goes through the INLABS request
+    policy (ratelimit.get_inlabs_policy): connection errors are retried a
+    bounded number of times with backoff, then raised.
+    """
     payload = {"email": email, "password": senha}
     headers = {
         "Content-Type": "application/x-www-form-urlencoded",
@@ -38,7 +70,7 @@ def create_session():
     s = requests.Session()
     try:
         logger.debug(f"Attempting login with email: {email}")
-        response = s.post(URL_LOGIN, data=payload, headers=headers)
+        response = get_inlabs_policy().call(s.post, URL_LOGIN, data=payload, headers=headers, timeout=30)
         logger.debug(f"Login response status: {response.status_code}")
         logger.debug(f"Response headers: {dict(response.headers)}")
         logger.debug(f"Response cookies: {dict(response.cookies)}")
@@ -47,7 +79,7 @@ def create_session():
             logger.debug("INLABS login successful.")
             # Test access to main interface
             logger.debug("Testing access to main INLABS interface...")
-            test_response = s.get("https://inlabs.in.gov.br/index.php")
+            test_response = get_inlabs_policy().call(s.get, "https://inlabs.in.gov.br/index.php", timeout=30)
             logger.debug(f"Main interface status: {test_response.status_code}")
             if test_response.status_code == 200:
                 logger.debug("Successfully logged into INLABS interface")
@@ -56,14 +88,15 @@ def create_session():
             raise ValueError(
                 "Login failed: No session cookie obtained. Check credentials.")
     except requests.exceptions.ConnectionError as e:
-        logger.error(f"Connection error during login: {e}. Retrying...")
-        return create_session()
+        logger.error(f"Connection error during login, giving up after retries: {e}")
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during login: {e}")
         raise
 
 
-def download_dou_xml(sections=None, download_dir="downloads", test_date=None, max_fallback_days=2):
+def download_dou_xml(sections=None, download_dir="downloads", test_date=None, max_fallback_days=2,
+                     skip_sections=None, stats=None):
     """
     Download DOU XML ZIPs for today or specified date with fallback to previous days.
 
@@ -72,6 +105,10 @@ def download_dou_xml(sections=None, download_dir="downloads", test_date=None, ma
         download_dir (str): Directory to save downloads.
         test_date (str): Date in YYYY-MM-DD format for testing. If None, uses today.
         max_fallback_days (int): Maximum number of days to go back if no valid DOU found.
+        skip_sections (str): Sections not needed by any term. They are only
+            probed (a few bytes each), to report what skipping them saved.
+        stats (dict): If given, filled with 'sections_skipped' (published on
+            the chosen date but not downloaded) and 'bytes_avoided'.
 
     Returns:
         list: Paths to downloaded ZIP files.
@@ -91,27 +128,36 @@ def download_dou_xml(sections=None, download_dir="downloads", test_date=None, ma
         else:
             target_date = date.today()
 
-        # Try downloading for up to max_fallback_days
-        for days_back in range(max_fallback_days + 1):
-            current_date = target_date - timedelta(days=days_back)
-            data_completa = current_date.strftime("%Y-%m-%d")
-            data_formatada = current_date.strftime("%d/%m/%Y")
+        # Probe all candidate dates at once and take the newest one that is available
+        date_strs = [(target_date - timedelta(days=n)).strftime("%Y-%m-%d")
+                     for n in range(max_fallback_days + 1)]
+        print(f"Verificando disponibilidade do DOU ({len(date_strs)} dia(s))...")
+        wanted, skipped, sizes = sections.split(), (skip_sections or '').split(), {}
+        availability = probe_dates(s, cookie, date_strs, wanted + skipped, download_dir, sizes=sizes)
+
+        for days_back, data_completa in enumerate(date_strs):
+            available = [sec for sec in availability[data_completa] if sec in wanted]
+            data_formatada = datetime.strptime(data_completa, "%Y-%m-%d").strftime("%d/%m/%Y")
+            if not available:
+                logger.info(f"No DOU available for {data_completa}")
+                continue
 
             if days_back == 0:
-                print(f"Verificando DOU de hoje ({data_formatada})...")
-                logger.info(f"Attempting download for today: {data_completa}")
+                print(f"DOU de hoje ({data_formatada}) disponível: {' '.join(available)}")
+                logger.info(f"Downloading today's edition: {data_completa}")
             else:
-                print(f"DOU de hoje não disponível. Verificando {days_back} dia(s) atrás ({data_formatada})...")
-                logger.info(f"Fallback: Attempting download for {days_back} day(s) ago: {data_completa}")
+                print(f"DOU de hoje não disponível. Usando DOU de {days_back} dia(s) atrás ({data_formatada}): {' '.join(available)}")
+                logger.info(f"Fallback: downloading edition from {days_back} day(s) ago: {data_completa}")
 
             # Setup download directory for current date
             download_path = Path(download_dir) / data_completa
             download_path.mkdir(parents=True, exist_ok=True)
             logger.debug(f"Download directory set up: {download_path}")
 
-            downloaded_files = try_download_for_date(s, cookie, data_completa, sections, download_path)
+            downloaded_files = try_download_for_date(s, cookie, data_completa, ' '.join(available), download_path)
 
             if downloaded_files:
+                _skipped_stats(stats, data_completa, availability[data_completa], skipped, sizes)
                 print(f"SUCCESS: DOU encontrado para {data_formatada}! {len(downloaded_files)} arquivo(s) baixado(s).")
                 logger.info(f"Successfully downloaded {len(downloaded_files)} files for date {data_completa}")
                 return downloaded_files
@@ -130,58 +176,388 @@ def download_dou_xml(sections=None, download_dir="downloads", test_date=None, ma
         raise
 
 
-def try_download_for_date(session, cookie, data_completa, sections, download_path):
+def iter_dou_xml(sections=None, download_dir="downloads", test_date=None, max_fallback_days=2,
+                 skip_sections=None, stats=None):
+    """
+    Download DOU XML ZIPs one section at a time, yielding each path as soon as it is saved.
+
+    Same date selection as download_dou_xml: the newest date with any
+    available section, found by probing all candidate dates at once. Used by the streaming pipeline so
+    extraction of DO1 can start while later sections are still downloading.
+    skip_sections and stats work as in download_dou_xml.
+
+    Yields:
+        str: Path of each downloaded (or already present) ZIP file.
+    """
+    if sections is None:
+        sections = DEFAULT_SECTIONS
+
+    s = create_session()
+    try:
+        cookie = s.cookies.get('inlabs_session_cookie')
+        if not cookie:
+            raise ValueError("No cookie after login.")
+
+        target_date = datetime.strptime(test_date, "%Y-%m-%d").date() if test_date else date.today()
+        date_strs = [(target_date - timedelta(days=n)).strftime("%Y-%m-%d")
+                     for n in range(max_fallback_days + 1)]
+        wanted, skipped, sizes = sections.split(), (skip_sections or '').split(), {}
+        availability = probe_dates(s, cookie, date_strs, wanted + skipped, download_dir, sizes=sizes)
+        for data_completa in date_strs:
+            available = [sec for sec in availability[data_completa] if sec in wanted]
+            if not available:
+                continue
+            logger.info(f"Streaming download for {data_completa}")
+            _skipped_stats(stats, data_completa, availability[data_completa], skipped, sizes)
+
+            download_path = Path(download_dir) / data_completa
+            download_path.mkdir(parents=True, exist_ok=True)
+
+            found = 0
+            for dou_secao in available:
+                for zip_path in try_download_for_date(s, cookie, data_completa, dou_secao, download_path):
+                    found += 1
+                    yield zip_path
+            if found:
+                logger.info(f"Streamed {found} files for date {data_completa}")
+                return
+            logger.warning(f"No valid DOU files found for date {data_completa}")
+
+        logger.error(f"No valid DOU files found after trying {max_fallback_days + 1} days")
+    finally:
+        s.close()
+
+
+def _skipped_stats(stats, data_completa, available, skipped, sizes):
+    """Record the chosen date, and its published sections that were not downloaded."""
+    if stats is None:
+        return
+    stats['edition_date'] = data_completa
+    not_downloaded = [sec for sec in available if sec in skipped]
+    stats['sections_skipped'] = not_downloaded
+    stats['bytes_avoided'] = sum(sizes.get((data_completa, sec)) or 0 for sec in not_downloaded)
+    if not_downloaded:
+        logger.info(f"Skipped {' '.join(not_downloaded)} for {data_completa} "
+                    f"({stats['bytes_avoided']} bytes), no term needs them.")
+
+
+def _expected_length(response):
+    """Total size of the file a 200/206 response carries, if the server says."""
+    content_range = response.headers.get('Content-Range', '')  # e.g. "bytes 100-999/1000"
+    if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+        return int(content_range.rsplit('/', 1)[1])
+    if response.status_code == 200 and response.headers.get('Content-Length', '').isdigit():
+        return int(response.headers['Content-Length'])
+    return None
+
+
+def _download_to_part(session, url, headers, part_path, timeout=DOWNLOAD_TIMEOUT,
+                      attempts=DOWNLOAD_RESUME_ATTEMPTS):
+    """
+    Stream a file into part_path, resuming with HTTP Range when the connection drops.
+
+    A .part left by an earlier run is resumed as well. The validator of the
+    response the .part started from is kept next to it (.part.json) and sent
+    as If-Range, so the server sends the whole file again if it changed in
+    the meantime. Servers that ignore Range answer 200 and the file is
+    rewritten from the start.
+
+    Returns:
+        tuple: (status, validators). status is the HTTP status of the last
+            response (None if every attempt was interrupted); on 200/206 the
+            complete body is in part_path. validators holds the 'etag' and
+            'last_modified' response headers.
+    """
+    meta_path = part_path.with_name(part_path.name + '.json')
+    try:
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        meta = {}
+
+    for attempt in range(attempts + 1):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        request_headers = dict(headers)
+        if offset and meta.get('if_range'):
+            request_headers['Range'] = f'bytes={offset}-'
+            request_headers['If-Range'] = meta['if_range']
+            logger.debug(f"Resuming {part_path.name} from byte {offset}")
+        try:
+            with get_inlabs_policy().call(session.get, url, headers=request_headers, stream=True,
+                                          timeout=timeout) as response:
+                status = response.status_code
+                if status == 416:
+                    # The .part doesn't fit the file on the server any more: start over
+                    part_path.unlink(missing_ok=True)
+                    meta = {}
+                    continue
+                if status not in (200, 206):
+                    return status, {}
+                if status == 206 and not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                    logger.warning(f"Unexpected Content-Range for {part_path.name}; downloading it again.")
+                    part_path.unlink(missing_ok=True)
+                    meta = {}
+                    continue
+
+                validators = {'etag': response.headers.get('ETag'),
+                              'last_modified': response.headers.get('Last-Modified')}
+                if status == 200:
+                    # Fresh body (no .part, Range ignored, or file changed): remember what to resume against
+                    etag = validators['etag']
+                    meta = {'if_range': etag if etag and not etag.startswith('W/') else validators['last_modified']}
+                    meta_path.write_text(json.dumps(meta), encoding='utf-8')
+                expected = _expected_length(response)
+
+                with open(part_path, 'ab' if status == 206 else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                size = part_path.stat().st_size
+                if expected is not None and size < expected:
+                    raise requests.exceptions.ChunkedEncodingError(f"got {size} of {expected} bytes")
+
+                meta_path.unlink(missing_ok=True)
+                return status, validators
+
+        except RESUME_ERRORS as e:
+            size = part_path.stat().st_size if part_path.exists() else 0
+            logger.warning(f"Download of {part_path.name} interrupted at {size} bytes "
+                           f"(attempt {attempt + 1}/{attempts + 1}): {e}")
+            if not meta.get('if_range'):
+                # Nothing to check a resumed body against: it has to start over
+                part_path.unlink(missing_ok=True)
+
+    return None, {}
+
+
+def try_download_for_date(session, cookie, data_completa, sections, download_path,
+                          revalidate=DOWNLOAD_REVALIDATE, outcomes=None):
     """
     Try to download DOU files for a specific date.
 
+    Downloads go through a .part file and resume after a dropped connection
+    (see _download_to_part). ZIPs already on disk are kept without a request,
+    or, with revalidate, checked with If-None-Match / If-Modified-Since
+    against the validators stored when they were downloaded: an unchanged
+    edition costs one 304 response.
+
+    Args:
+        outcomes (dict): If given, each section's outcome is stored in it:
+            'ok', 'not published' (404) or 'failed' (any other status, a
+            body that isn't a ZIP, or a download given up after interruptions),
+            so callers can tell a missing edition from one worth retrying.
+
     Returns:
         list: Paths to successfully downloaded ZIP files, empty if none found.
     """
     downloaded_files = []
+    store = get_store(download_path.parent)
+    outcomes = {} if outcomes is None else outcomes
 
     for dou_secao in sections.split():
         zip_path = download_path / f"{data_completa}-{dou_secao}.zip"
+        conditional = {}
 
         if zip_path.exists():
             # Check if existing file is a valid ZIP
             if is_valid_zip(zip_path):
-                logger.debug(f"Valid ZIP file already exists: {zip_path}. Skipping download.")
-                downloaded_files.append(str(zip_path))
-                continue
+                validators = store.validators(zip_path) if revalidate else {}
+                if validators.get('etag'):
+                    conditional['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    conditional['If-Modified-Since'] = validators['last_modified']
+                if not conditional:
+                    logger.debug(f"Valid ZIP file already exists: {zip_path}. Skipping download.")
+                    downloaded_files.append(str(zip_path))
+                    outcomes[dou_secao] = 'ok'
+                    continue
             else:
                 logger.debug(f"Invalid ZIP file found: {zip_path}. Re-downloading...")
-                zip_path.unlink()  # Delete invalid file
+                zip_path.unlink(missing_ok=True)  # Delete invalid file
 
-        logger.debug(f"Downloading {data_completa}-{dou_secao}.zip...")
+        logger.debug(f"{'Revalidating' if conditional else 'Downloading'} {data_completa}-{dou_secao}.zip...")
         url_arquivo = f"{URL_DOWNLOAD}{data_completa}&dl={data_completa}-{dou_secao}.zip"
 
         cabecalho_arquivo = {
             'Cookie': f'inlabs_session_cookie={cookie}',
-            'origem': '736372697074'
+            'origem': '736372697074',
+            **conditional
         }
 
-        response = session.request("GET", url_arquivo, headers=cabecalho_arquivo)
+        part_path = zip_path.with_name(zip_path.name + '.part')
+        status, validators = _download_to_part(session, url_arquivo, cabecalho_arquivo, part_path)
+        outcomes[dou_secao] = 'failed'
 
-        if response.status_code == 200:
-            # Check if content is actually a ZIP file
-            if response.content.startswith(b'PK'):
-                with open(zip_path, "wb") as f:
-                    f.write(response.content)
+        if status == 304:
+            logger.debug(f"Unchanged since last download: {zip_path}")
+            downloaded_files.append(str(zip_path))
+            outcomes[dou_secao] = 'ok'
+
+        elif status in (200, 206):
+            # Check the content is a complete ZIP (not an HTML page or a truncated body)
+            stored, reason = store.put(zip_path, part_path.read_bytes(), validators)
+            part_path.unlink(missing_ok=True)
+            if stored:
                 logger.debug(f"Downloaded valid ZIP: {zip_path}")
                 downloaded_files.append(str(zip_path))
+                outcomes[dou_secao] = 'ok'
             else:
-                logger.debug(f"Downloaded content for {dou_secao} is NOT a valid ZIP (got HTML page)")
-                # Don't save invalid files for this date
-
-        elif response.status_code == 404:
+                logger.debug(f"Downloaded content for {dou_secao} is NOT a valid ZIP ({reason})")
+                # Don't save invalid files for this date; a ZIP we already had stays
+                if conditional:
+                    downloaded_files.append(str(zip_path))
+                    outcomes[dou_secao] = 'ok'
+
+        elif status is None:
+            logger.warning(f"Gave up on {data_completa}-{dou_secao}.zip after repeated interruptions; "
+                           f"the partial download is resumed on the next run.")
+            if conditional:
+                downloaded_files.append(str(zip_path))
+                outcomes[dou_secao] = 'ok'
+        elif status == 404:
             logger.debug(f"Not found: {data_completa}-{dou_secao}.zip")
+            outcomes[dou_secao] = 'not published'
         else:
-            logger.debug(f"Error downloading {dou_secao}: status {response.status_code}")
+            logger.debug(f"Error downloading {dou_secao}: status {status}")
 
     logger.debug(f"Download attempt for {data_completa} completed. Valid files: {len(downloaded_files)}")
     return downloaded_files
 
 
+def probe_section(session, cookie, data_completa, dou_secao, timeout=15):
+    """
+    Cheaply check whether a section's ZIP is published, without downloading it.
+
+    Requests only the first bytes (Range) and streams the response, so at
+    most a few bytes are read even if the server ignores the Range header.
+
+    Returns:
+        dict: {'available': bool, 'size': int or None, 'status': int}
+    """
+    url_arquivo = f"{URL_DOWNLOAD}{data_completa}&dl={data_completa}-{dou_secao}.zip"
+    cabecalho_arquivo = {
+        'Cookie': f'inlabs_session_cookie={cookie}',
+        'origem': '736372697074',
+        'Range': 'bytes=0-3'
+    }
+    policy = get_inlabs_policy()
+    response = policy.call(session.get, url_arquivo, headers=cabecalho_arquivo, stream=True, timeout=timeout)
+    if response.status_code == 416:
+        # Range not accepted: ask again without it, still reading only the first bytes
+        response.close()
+        del cabecalho_arquivo['Range']
+        response = policy.call(session.get, url_arquivo, headers=cabecalho_arquivo, stream=True, timeout=timeout)
+    with response:
+        head = b''
+        if response.status_code in (200, 206):
+            head = next(response.iter_content(chunk_size=4), b'')
+
+        # Total size, used to notice a ZIP that was republished with more content
+        size = None
+        content_range = response.headers.get('Content-Range', '')  # e.g. "bytes 0-3/1234567"
+        if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+            size = int(content_range.rsplit('/', 1)[1])
+        elif response.status_code == 200 and response.headers.get('Content-Length', '').isdigit():
+            size = int(response.headers['Content-Length'])
+
+    available = head.startswith(b'PK')
+    logger.debug(f"Probe {data_completa}-{dou_secao}: status {response.status_code}, "
+                 f"available={available}, size={size}")
+    return {'available': available, 'size': size if available else None, 'status': response.status_code}
+
+
+def _load_availability_cache(download_dir):
+    cache_path = Path(download_dir) / AVAILABILITY_CACHE
+    try:
+        return json.loads(cache_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_availability_cache(download_dir, cache):
+    cutoff = (date.today() - timedelta(days=AVAILABILITY_CACHE_DAYS)).strftime("%Y-%m-%d")
+    cache = {d: entries for d, entries in cache.items() if d >= cutoff}
+    cache_path = Path(download_dir) / AVAILABILITY_CACHE
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(cache, indent=1), encoding='utf-8')
+    except OSError as e:
+        logger.warning(f"Could not save availability cache: {e}")
+
+
+def _cached_availability(entry, data_completa, today_str, now):
+    """Cached availability of a section, or None if the entry can't be trusted anymore."""
+    if not entry:
+        return None
+    if entry['available']:
+        return True  # a published edition doesn't disappear
+    if data_completa == today_str:
+        return False if now - entry['checked_at'] < TODAY_NEGATIVE_TTL else None
+    # Past dates (holidays, weekends): trust "not available" for the rest of the day
+    return False if entry.get('checked_on') == today_str else None
+
+
+def probe_dates(session, cookie, date_strs, sections, download_dir="downloads", sizes=None):
+    """
+    Check which sections are published for several dates, concurrently.
+
+    ZIPs already on disk and recent results in downloads/availability.json
+    are used without probing, so later runs on the same day don't probe again.
+
+    Args:
+        date_strs (list): Dates in YYYY-MM-DD format.
+        sections (list): Section names, e.g. ['DO1', 'DO2'].
+        sizes (dict): If given, filled with {(date_str, section): ZIP size in
+            bytes} for available sections whose size is known.
+
+    Returns:
+        dict: {date_str: [available sections, in the given order]}
+    """
+    cache = _load_availability_cache(download_dir)
+    today_str = date.today().strftime("%Y-%m-%d")
+    now = time.time()
+    available = {d: set() for d in date_strs}
+    found_sizes = {}
+    pending = []
+
+    for data_completa in date_strs:
+        for dou_secao in sections:
+            zip_path = Path(download_dir) / data_completa / f"{data_completa}-{dou_secao}.zip"
+            if zip_path.exists() and is_valid_zip(zip_path):
+                available[data_completa].add(dou_secao)
+                found_sizes[(data_completa, dou_secao)] = zip_path.stat().st_size
+                continue
+            entry = cache.get(data_completa, {}).get(dou_secao)
+            cached = _cached_availability(entry, data_completa, today_str, now)
+            if cached is None:
+                pending.append((data_completa, dou_secao))
+            elif cached:
+                available[data_completa].add(dou_secao)
+                found_sizes[(data_completa, dou_secao)] = entry.get('size')
+
+    if pending:
+        logger.info(f"Probing {len(pending)} section/date pairs ({len(date_strs) * len(sections) - len(pending)} known).")
+        with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(pending))) as executor:
+            futures = {executor.submit(probe_section, session, cookie, d, sec): (d, sec) for d, sec in pending}
+            for future in as_completed(futures):
+                data_completa, dou_secao = futures[future]
+                try:
+                    probe = future.result()
+                except Exception as e:
+                    logger.warning(f"Probe failed for {data_completa}-{dou_secao}: {e}")
+                    continue
+                cache.setdefault(data_completa, {})[dou_secao] = {
+                    'available': probe['available'], 'size': probe['size'],
+                    'checked_at': now, 'checked_on': today_str}
+                if probe['available']:
+                    available[data_completa].add(dou_secao)
+                    found_sizes[(data_completa, dou_secao)] = probe['size']
+        _save_availability_cache(download_dir, cache)
+
+    if sizes is not None:
+        sizes.update({key: size for key, size in found_sizes.items() if size is not None})
+
+    return {d: [sec for sec in sections if sec in available[d]] for d in date_strs}
+
+
 if __name__ == "__main__":
     # Example usage - test fallback functionality
     try:
@@ -0,0 +1,170 @@
+"""
+Shared cache of the parsed DOU edition for serverless instances.
+
+The first instance that needs an edition downloads and parses it, then
+publishes the whole article corpus, zlib-compressed JSON, as one object
+keyed by edition date and content hash:
+
+    dou:edition:<edition date>:<sha256 of the ZIPs>   the corpus
+    dou:edition:<requested date>                      pointer to it (JSON)
+    dou:edition:<requested date>:lock                 single-flight lock
+
+Other instances read the pointer and load the corpus in one GET instead of
+hitting INLABS. Only the instance holding the lock builds; the others wait
+for the pointer (bounded by their deadline) and only build themselves if it
+doesn't show up. Pointers expire (EDITION_CACHE_TTL, or the shorter
+EDITION_CACHE_FALLBACK_TTL when the requested date fell back to an earlier
+edition), so extra editions published later in the day are picked up. A
+rebuild that finds the same ZIP content reuses the stored corpus without
+parsing or uploading it again.
+
+Objects live in Redis when REDIS_URL is set, otherwise in a local
+directory stand-in (shared by the processes of one machine or warm
+instance).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from objectstore import open_store
+
+# Plain logging: used by the serverless api/ handlers
+logger = logging.getLogger('edition_cache')
+
+EDITION_CACHE = os.getenv('EDITION_CACHE', '1') == '1'
+EDITION_CACHE_TTL = int(os.getenv('EDITION_CACHE_TTL', 1800))
+EDITION_CACHE_FALLBACK_TTL = int(os.getenv('EDITION_CACHE_FALLBACK_TTL', 600))
+# Stored corpora outlive their pointers, so a rebuild with unchanged content reuses them
+EDITION_CORPUS_TTL = int(os.getenv('EDITION_CORPUS_TTL', 3 * 86400))
+EDITION_LOCK_TTL = int(os.getenv('EDITION_LOCK_TTL', 120))
+EDITION_CACHE_WAIT = float(os.getenv('EDITION_CACHE_WAIT', 45))
+EDITION_CACHE_DIR = os.getenv('EDITION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dou_edition_cache'))
+
+def content_hash(zip_data: Dict[str, bytes]) -> str:
+    """SHA-256 of an edition's ZIPs ({section: bytes}), independent of dict order."""
+    digest = hashlib.sha256()
+    for section in sorted(zip_data):
+        digest.update(section.encode('ascii') + b'\0')
+        digest.update(hashlib.sha256(zip_data[section]).digest())
+    return digest.hexdigest()
+
+
+class EditionCache:
+    """
+    Published article corpora (see module docstring).
+
+    A corpus is a dict: {'edition_date', 'hash', 'articles', 'stats'}.
+    stats counts 'hits', 'waits' (served after waiting for another
+    instance's build), 'builds' and 'reused' (builds that found content
+    already stored).
+    """
+
+    def __init__(self, store, ttl=EDITION_CACHE_TTL, fallback_ttl=EDITION_CACHE_FALLBACK_TTL,
+                 corpus_ttl=EDITION_CORPUS_TTL, lock_ttl=EDITION_LOCK_TTL, wait=EDITION_CACHE_WAIT):
+        self.store = store
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.corpus_ttl = corpus_ttl
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+        self.stats = {'hits': 0, 'waits': 0, 'builds': 0, 'reused': 0}
+
+    @staticmethod
+    def _corpus_key(edition_date, digest):
+        return f"dou:edition:{edition_date}:{digest}"
+
+    def load_corpus(self, edition_date, digest) -> Optional[Dict]:
+        """The stored corpus for an edition's content, or None."""
+        blob = self.store.get(self._corpus_key(edition_date, digest))
+        return json.loads(zlib.decompress(blob)) if blob else None
+
+    def load(self, requested_date) -> Optional[Dict]:
+        """The corpus currently published for requested_date, or None."""
+        pointer = self.store.get(f"dou:edition:{requested_date}")
+        if not pointer:
+            return None
+        pointer = json.loads(pointer)
+        return self.load_corpus(pointer['edition_date'], pointer['hash'])
+
+    def publish(self, requested_date, corpus: Dict):
+        """Store the corpus (unless this content is already stored) and point requested_date to it."""
+        key = self._corpus_key(corpus['edition_date'], corpus['hash'])
+        if not self.store.exists(key):
+            blob = zlib.compress(json.dumps(corpus, ensure_ascii=False).encode('utf-8'), 6)
+            self.store.put(key, blob, self.corpus_ttl)
+            logger.info(f"Published edition {corpus['edition_date']} ({len(corpus['articles'])} articles, "
+                        f"{len(blob)} bytes compressed)")
+        ttl = self.ttl if corpus['edition_date'] == requested_date else self.fallback_ttl
+        pointer = {'edition_date': corpus['edition_date'], 'hash': corpus['hash'],
+                   'published_at': datetime.now().isoformat(timespec='seconds')}
+        self.store.put(f"dou:edition:{requested_date}", json.dumps(pointer).encode('utf-8'), ttl)
+
+    def get_or_build(self, requested_date, build: Callable[['EditionCache'], Optional[Dict]],
+                     max_wait: float = None) -> Tuple[Optional[Dict], str]:
+        """
+        The edition for requested_date: from the cache, or built once across instances.
+
+        Args:
+            requested_date (str): Date asked for (YYYY-MM-DD), usually today.
+            build (callable): build(cache) downloads and parses the edition and
+                returns a corpus, or None if no edition is available. It may use
+                cache.load_corpus to skip parsing content already stored.
+            max_wait (float): Longest wait for another instance's build
+                (default: EDITION_CACHE_WAIT).
+
+        Returns:
+            tuple: (corpus or None, source), source being 'cache', 'waited'
+                or 'built'.
+        """
+        corpus = self.load(requested_date)
+        if corpus is not None:
+            self.stats['hits'] += 1
+            return corpus, 'cache'
+
+        lock_key = f"dou:edition:{requested_date}:lock"
+        token = uuid.uuid4().hex.encode('ascii')
+        if not self.store.put_if_absent(lock_key, token, self.lock_ttl):
+            # Another instance is building: wait for its pointer
+            wait_until = time.monotonic() + (self.wait if max_wait is None else min(self.wait, max_wait))
+            while time.monotonic() < wait_until:
+                time.sleep(0.5)
+                corpus = self.load(requested_date)
+                if corpus is not None:
+                    self.stats['waits'] += 1
+                    return corpus, 'waited'
+            logger.warning(f"Edition {requested_date} not published by another instance in time; building it here.")
+            token = None
+
+        try:
+            self.stats['builds'] += 1
+            corpus = build(self)
+            if corpus is not None:
+                self.publish(requested_date, corpus)
+            return corpus, 'built'
+        finally:
+            if token is not None:
+                self.store.delete_if(lock_key, token)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_edition_cache() -> Optional[EditionCache]:
+    """Process-wide EditionCache on Redis (REDIS_URL) or the local stand-in; None if disabled."""
+    global _cache
+    if not EDITION_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EditionCache(open_store(EDITION_CACHE_DIR))
+        return _cache
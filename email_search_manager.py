@@ -5,12 +5,39 @@ from typing import List, Dict, Optional, Set
 from datetime import datetime
 from redis_client import redis_client
 
+# Chaves por MGET nas listagens; cada round trip leva até LISTING_KEYS_PER_ROUND_TRIP chaves
+LISTING_MGET_CHUNK = int(os.getenv('REDIS_LISTING_MGET_CHUNK', 1000))
+LISTING_KEYS_PER_ROUND_TRIP = int(os.getenv('REDIS_LISTING_KEYS_PER_ROUND_TRIP', 10000))
+
 class EmailSearchManager:
     """Gerenciador de emails e termos de busca usando Redis"""
 
     def __init__(self):
         self.redis = redis_client
 
+    def _get_many(self, prefix: str, ids) -> List[Dict]:
+        """
+        Recupera os dados JSON de vários ids (chaves prefix + id) em lote
+        Args:
+            prefix: Prefixo das chaves, ex.: "email:"
+            ids: Ids a buscar
+
+        Os ids são buscados com MGET em blocos de LISTING_MGET_CHUNK chaves,
+        enviados num pipeline: uma listagem de N ids custa cerca de um round
+        trip (um a cada LISTING_KEYS_PER_ROUND_TRIP chaves) em vez de N.
+        Ids sem dados (removidos entre a leitura do set e o MGET) são ignorados.
+        """
+        ids = list(ids)
+        items = []
+        for start in range(0, len(ids), LISTING_KEYS_PER_ROUND_TRIP):
+            batch = ids[start:start + LISTING_KEYS_PER_ROUND_TRIP]
+            with self.redis.client.pipeline(transaction=False) as pipe:
+                for chunk_start in range(0, len(batch), LISTING_MGET_CHUNK):
+                    pipe.mget([f"{prefix}{item_id}" for item_id in batch[chunk_start:chunk_start + LISTING_MGET_CHUNK]])
+                for values in pipe.execute():
+                    items.extend(json.loads(value) for value in values if value)
+        return items
+
     # ===================== EMAILS =====================
 
     def add_email(self, email: str, name: str = "", active: bool = True) -> bool:
@@ -70,14 +97,7 @@ class EmailSearchManager:
                 emails_set = "emails:all"
 
             email_addresses = self.redis.client.smembers(emails_set)
-            emails = []
-
-            for email in email_addresses:
-                email_data = self.get_email(email)
-                if email_data:
-                    emails.append(email_data)
-
-            return emails
+            return self._get_many("email:", email_addresses)
 
         except Exception as e:
             print(f"Erro ao recuperar emails: {e}")
@@ -203,13 +223,7 @@ class EmailSearchManager:
                 else:
                     term_ids = self.redis.client.smembers("search_terms:all")
 
-            terms = []
-            for term_id in term_ids:
-                term_data = self.get_search_term(term_id)
-                if term_data:
-                    terms.append(term_data)
-
-            return terms
+            return self._get_many("search_term:", term_ids)
 
         except Exception as e:
             print(f"Erro ao recuperar termos: {e}")
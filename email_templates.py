@@ -0,0 +1,254 @@
+"""
+HTML templates for notification emails.
+
+An article block depends only on the match, not on who receives it, so
+blocks are rendered once per run and cached by match id; each recipient's
+email is then assembled from the cached blocks plus a small personalized
+header. Keep one renderer per run (cron, send-to-all) and pass it to every
+call that builds an email.
+"""
+
+from typing import Callable, Dict, List
+
+from ledger import article_fingerprint
+
+# Placeholder for the position of a block in an email (1., 2., ...)
+INDEX_SLOT = '\x00'
+
+
+def match_key(match: Dict):
+    """Cache key of a match: its article plus everything shown in its block."""
+    return (
+        article_fingerprint(match),
+        tuple(match.get('terms_matched', [])),
+        match.get('summary'),
+        tuple(match.get('snippets', [])[:3]),
+    )
+
+
+class BlockCache:
+    """
+    Render-once cache of per-match HTML blocks.
+
+    render_block(match) must return the block with INDEX_SLOT where the
+    block's position in the email goes.
+    """
+
+    def __init__(self, render_block: Callable[[Dict], str]):
+        self._render_block = render_block
+        self._blocks = {}
+        self.stats = {'rendered': 0, 'reused': 0}
+
+    def render(self, match: Dict, index: int) -> str:
+        key = match_key(match)
+        parts = self._blocks.get(key)
+        if parts is None:
+            parts = self._render_block(match).split(INDEX_SLOT)
+            self._blocks[key] = parts
+            self.stats['rendered'] += 1
+        else:
+            self.stats['reused'] += 1
+        return str(index).join(parts)
+
+
+def render_article_block_html(m: Dict) -> str:
+    """HTML block of one match for the daily digest."""
+    art = m.get('article', {})
+    terms = m.get('terms_matched', [])
+    summary = m.get('summary', 'Resumo não disponível')
+    snippets = m.get('snippets', [])
+
+    # Informações do artigo
+    filename = art.get('filename', 'Arquivo não identificado')
+    section = art.get('section', 'Seção não especificada')
+    xml_path = art.get('xml_path', '')
+
+    # Badges dos termos
+    terms_badges = ''.join([f'<span class="terms-badge">{term}</span>' for term in terms])
+
+    # Metadados estruturados
+    metadata_html = f"""
+        <div class="metadata">
+            <div class="metadata-item">
+                <div class="metadata-label">Arquivo XML</div>
+                <div class="metadata-value">{filename}</div>
+            </div>
+            <div class="metadata-item">
+                <div class="metadata-label">Seção DOU</div>
+                <div class="metadata-value">{section}</div>
+            </div>
+        </div>
+        """
+
+    # Snippets destacados
+    snippets_html = ""
+    if snippets:
+        snippets_html = "<div style='margin: 15px 0;'><strong>📄 Trechos relevantes:</strong></div>"
+        for idx, snippet in enumerate(snippets[:3], 1):  # Máximo 3 snippets
+            # Destacar termos encontrados no snippet
+            highlighted_snippet = snippet
+            for term in terms:
+                highlighted_snippet = highlighted_snippet.replace(
+                    term, f'<span class="highlight"><strong>{term}</strong></span>'
+                )
+            snippets_html += f'<div class="snippet"><strong>Trecho {idx}:</strong> {highlighted_snippet}</div>'
+
+    xml_link = f'<div style="margin-top: 15px; font-size: 12px; color: #666;"><strong>🔗 Arquivo:</strong> {xml_path}</div>' if xml_path else ''
+
+    return f"""
+        <div class="match-item">
+            <div class="match-header">
+                <div class="match-title">📄 {INDEX_SLOT}. {filename}</div>
+                <div class="match-subtitle">{section}</div>
+            </div>
+
+            <div style="margin: 15px 0;">
+                <strong>🔍 Termos encontrados:</strong><br>
+                {terms_badges}
+            </div>
+
+            {metadata_html}
+
+            <div class="summary-section">
+                <strong>📝 Resumo:</strong><br>
+                <div style="margin-top: 10px; color: #555;">{summary}</div>
+            </div>
+
+            {snippets_html}
+
+            {xml_link}
+        </div>
+        """
+
+
+DIGEST_STYLE = """
+            <style>
+                body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }
+                .container { max-width: 900px; margin: 0 auto; background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }
+                .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; }
+                .content { padding: 30px; }
+                .stats { background: #f8f9fa; border-radius: 8px; padding: 20px; margin: 20px 0; display: flex; justify-content: space-around; text-align: center; }
+                .stat-item { flex: 1; }
+                .stat-number { font-size: 24px; font-weight: bold; color: #667eea; display: block; }
+                .stat-label { font-size: 12px; color: #666; text-transform: uppercase; letter-spacing: 1px; }
+                .match-item { border: 1px solid #e1e8ed; border-radius: 8px; padding: 20px; margin: 20px 0; background: #fafbfc; }
+                .match-header { background: #667eea; color: white; padding: 15px; margin: -20px -20px 15px -20px; border-radius: 8px 8px 0 0; }
+                .match-title { font-size: 18px; font-weight: bold; margin: 0; }
+                .match-subtitle { font-size: 14px; opacity: 0.9; margin: 5px 0 0 0; }
+                .terms-badge { display: inline-block; background: #28a745; color: white; padding: 4px 8px; border-radius: 4px; font-size: 12px; margin: 2px; }
+                .snippet { background: #fff; border-left: 4px solid #667eea; padding: 15px; margin: 10px 0; border-radius: 0 4px 4px 0; font-style: italic; color: #555; }
+                .metadata { display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin: 15px 0; }
+                .metadata-item { background: white; padding: 10px; border-radius: 4px; border: 1px solid #eee; }
+                .metadata-label { font-size: 12px; color: #666; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 5px; }
+                .metadata-value { font-weight: 600; color: #333; }
+                .summary-section { background: white; border-radius: 6px; padding: 15px; margin: 15px 0; border: 1px solid #e1e8ed; }
+                .footer { background: #f8f9fa; padding: 20px; text-align: center; color: #666; border-top: 1px solid #eee; }
+                .highlight { background-color: #fff3cd; padding: 2px 4px; border-radius: 2px; }
+                @media (max-width: 600px) {
+                    .stats { flex-direction: column; }
+                    .metadata { grid-template-columns: 1fr; }
+                    .container { margin: 10px; }
+                }
+            </style>"""
+
+EMPTY_STYLE = """
+            <style>
+                body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }
+                .container { max-width: 800px; margin: 0 auto; background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); overflow: hidden; }
+                .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; }
+                .content { padding: 30px; }
+                .footer { background: #f8f9fa; padding: 20px; text-align: center; color: #666; border-top: 1px solid #eee; }
+                .no-results { text-align: center; padding: 40px; color: #666; }
+                .icon { font-size: 48px; margin-bottom: 20px; }
+            </style>"""
+
+DIGEST_FOOTER = """
+                </div>
+                <div class="footer">
+                    <p style="margin: 0; font-size: 14px;">🤖 <strong>Sistema Automático de Monitoramento DOU</strong></p>
+                    <p style="margin: 5px 0 0 0; font-size: 12px;">Monitoramento ativo • Notificações em tempo real • Powered by FiscalDOU</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+
+class DigestRenderer:
+    """Daily digest emails (api/index, api/app) assembled from cached article blocks."""
+
+    def __init__(self):
+        self.blocks = BlockCache(render_article_block_html)
+
+    def render(self, email: str, date_str: str, matches: List[Dict]) -> str:
+        if not matches:
+            return f"""
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>DOU Notificações - {date_str}</title>{EMPTY_STYLE}
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1 style="margin: 0; font-size: 28px;">📋 DOU Notificações</h1>
+                    <p style="margin: 10px 0 0 0; opacity: 0.9; font-size: 16px;">{date_str}</p>
+                </div>
+                <div class="content">
+                    <p style="font-size: 18px; margin-bottom: 20px;">Olá <strong>{email}</strong>,</p>
+                    <div class="no-results">
+                        <div class="icon">🔍</div>
+                        <p style="font-size: 16px; margin: 0;">Nenhuma ocorrência encontrada hoje no DOU para os seus termos de monitoramento.</p>
+                        <p style="font-size: 14px; color: #888; margin-top: 10px;">Continue monitorando - notificaremos você assim que houver novidades!</p>
+                    </div>
+                </div>
+                <div class="footer">
+                    <p style="margin: 0;">🤖 Sistema Automático de Monitoramento DOU</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+        # Calcular estatísticas
+        total_terms_found = sum(len(m.get('terms_matched', [])) for m in matches)
+        sections = set(m.get('article', {}).get('section', 'N/A') for m in matches)
+        sections_list = ', '.join(sorted(sections))
+
+        html_parts = [f"""
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>DOU Notificações - {date_str}</title>{DIGEST_STYLE}
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1 style="margin: 0; font-size: 28px;">📋 DOU Notificações</h1>
+                    <p style="margin: 10px 0 0 0; opacity: 0.9; font-size: 16px;">{date_str}</p>
+                </div>
+                <div class="content">
+                    <p style="font-size: 18px; margin-bottom: 20px;">Olá <strong>{email}</strong>,</p>
+
+                    <div class="stats">
+                        <div class="stat-item">
+                            <span class="stat-number">{len(matches)}</span>
+                            <span class="stat-label">Ocorrências</span>
+                        </div>
+                        <div class="stat-item">
+                            <span class="stat-number">{total_terms_found}</span>
+                            <span class="stat-label">Termos Encontrados</span>
+                        </div>
+                        <div class="stat-item">
+                            <span class="stat-number">{len(sections)}</span>
+                            <span class="stat-label">Seções DOU</span>
+                        </div>
+                    </div>
+
+                    <p style="color: #28a745; font-weight: 600; text-align: center; margin: 20px 0;">
+                        ✅ Foram encontradas <strong>{len(matches)} ocorrência(s)</strong> hoje nas seções: <em>{sections_list}</em>
+                    </p>
+    """]
+        html_parts.extend(self.blocks.render(m, i) for i, m in enumerate(matches, 1))
+        html_parts.append(DIGEST_FOOTER)
+        return ''.join(html_parts)
@@ -1,22 +1,123 @@
 import zipfile
 import xml.etree.ElementTree as ET
 from pathlib import Path
-import os
 from logging_config import setup_logger
+from dedup import simhash
+from zipreader import add_stats, iter_xml_members, new_stats
+from zipstore import get_store
 
 logger = setup_logger('extract')
 
 
-def extract_articles(zip_paths, extract_dir="extracted"):
+def parse_article_xml(xml_path, section, xml_filename, extract_dir="extracted"):
+    """
+    Parse one extracted DOU XML file.
+
+    Returns:
+        dict: Article dict (see extract_articles), or None if it has no text.
+    """
+    tree = ET.parse(xml_path)
+    root = tree.getroot()
+
+    # Extract artCategory if available (it's an attribute)
+    art_category_elem = root.find('.//*[@artCategory]')
+    art_category_text = art_category_elem.get(
+        'artCategory', 'N/A') if art_category_elem is not None else "N/A"
+
+    # Extract text from article tags (actual structure)
+    text_parts = []
+    for article in root.findall('.//article'):
+        article_text = ET.tostring(
+            article, encoding='unicode', method='text').strip()
+        if article_text:
+            text_parts.append(article_text)
+
+    full_text = ' '.join(text_parts).strip()
+    if not full_text:
+        logger.warning(f"No text extracted from {xml_filename}")
+        return None
+    logger.info(f"Extracted text from {xml_filename} ({len(text_parts)} articles)")
+    return {
+        'section': section,
+        'filename': xml_filename,
+        'text': full_text,
+        'xml_path': f"/xml/{Path(xml_path).relative_to(Path(extract_dir))}",
+        'artCategory': art_category_text,
+        'fingerprint': simhash(full_text)
+    }
+
+
+def section_from_zip_path(zip_path):
+    """e.g. DO1 from downloads/2025-01-02/2025-01-02-DO1.zip"""
+    return Path(zip_path).stem.split('-')[-1].upper()
+
+
+def iter_zip_articles(zip_path, date_dir, extract_dir="extracted", prefilter=None, zip_stats=None):
+    """
+    Extract the XML files of one ZIP into date_dir and yield their articles.
+
+    Yields articles as soon as each XML is parsed, so callers can start
+    working on a section before the whole ZIP is processed. With a
+    prefilter (prefilter.TermPrefilter), every file is still extracted but
+    only the ones that might contain a term are parsed. Members are inflated
+    in parallel by zipreader; pass zip_stats (zipreader.new_stats()) to
+    collect its counts and timings.
+
+    A ZIP with corrupt members (bad CRC) is rejected once read: it is
+    deleted from the download store, and its extracted files removed, so the
+    next run downloads and extracts the whole section again.
+
+    Raises:
+        zipfile.BadZipFile: The ZIP had corrupt members (after the good ones were yielded).
+    """
+    section = section_from_zip_path(zip_path)
+    logger.info(f"Processing ZIP: {zip_path} (section: {section})")
+
+    stats = new_stats()
+    for xml_filename, content in iter_xml_members(zip_path, stats=stats):
+        try:
+            # Write with the section prefix, replacing a previous copy, then parse
+            temp_path = date_dir / f"{section}_{xml_filename}"
+            temp_path.write_bytes(content)
+
+            if prefilter is not None and not prefilter.might_match(content):
+                continue
+            article = parse_article_xml(temp_path, section, xml_filename, extract_dir)
+            if article:
+                yield article
+        except ET.ParseError as e:
+            logger.error(
+                f"XML parsing error in {xml_filename}: {e}")
+        except Exception as e:
+            logger.error(f"Error processing {xml_filename}: {e}")
+
+    logger.info(f"Found {stats['xml_members']} XML files in {zip_path} "
+                f"({stats['skipped_members']} other members skipped, {stats['bad_members']} corrupt, "
+                f"{stats['compressed_bytes']} -> "
+                f"{stats['uncompressed_bytes']} bytes, {stats['inflate_seconds']:.2f}s inflating)")
+    if stats['bad_members']:
+        get_store(Path(zip_path).parent.parent).discard(zip_path, f"{stats['bad_members']} corrupt member(s)")
+        for xml_path in date_dir.glob(f"{section}_*.xml"):
+            xml_path.unlink()
+        raise zipfile.BadZipFile(f"{stats['bad_members']} corrupt member(s) in {zip_path}")
+    if zip_stats is not None:
+        add_stats(zip_stats, stats)
+
+
+def extract_articles(zip_paths, extract_dir="extracted", prefilter=None):
     """
     Unzip XML ZIPs, parse XML files, extract article texts.
 
     Args:
         zip_paths (list): List of ZIP file paths.
         extract_dir (str): Base directory for extracted files.
+        prefilter (TermPrefilter): Only parse files that might contain one of
+            its terms (for searching). Without it every file is parsed, as
+            archiving and indexing need.
 
     Returns:
-        list: [{'section': str, 'filename': str, 'text': str, 'xml_path': str}, ...]
+        list: [{'section': str, 'filename': str, 'text': str, 'xml_path': str,
+                'artCategory': str, 'fingerprint': int}, ...]
     """
     if not zip_paths:
         logger.warning("No ZIP files provided for extraction.")
@@ -28,123 +129,54 @@ def extract_articles(zip_paths, extract_dir="extracted"):
     date_dir.mkdir(parents=True, exist_ok=True)
     logger.info(f"Extraction directory: {date_dir}")
 
-    # Check if already extracted
-    existing_files = list(date_dir.glob("*.xml"))
-    if existing_files:
-        logger.info(
-            f"Files already extracted in {date_dir}. Parsing existing files.")
-        # Parse existing files instead of extracting
-        for xml_path in existing_files:
-            try:
-                # e.g., DO1 from DO1_filename.xml
-                section = xml_path.stem.split('_')[0]
-                # reconstruct original filename
-                xml_filename = '_'.join(xml_path.stem.split('_')[1:]) + '.xml'
-
-                tree = ET.parse(xml_path)
-                root = tree.getroot()
-
-                # Extract artCategory if available (it's an attribute)
-                art_category_elem = root.find('.//*[@artCategory]')
-                art_category_text = art_category_elem.get(
-                    'artCategory', 'N/A') if art_category_elem is not None else "N/A"
-
-                # Extract text from article tags (actual structure)
-                text_parts = []
-                for article in root.findall('.//article'):
-                    article_text = ET.tostring(
-                        article, encoding='unicode', method='text').strip()
-                    if article_text:
-                        text_parts.append(article_text)
-
-                full_text = ' '.join(text_parts).strip()
-                if full_text:
-                    articles.append({
-                        'section': section,
-                        'filename': xml_filename,
-                        'text': full_text,
-                        'xml_path': f"/xml/{xml_path.relative_to(Path(extract_dir))}",
-                        'artCategory': art_category_text
-                    })
-                    logger.info(
-                        f"Parsed text from {xml_filename} ({len(text_parts)} articles)")
-                else:
-                    logger.warning(
-                        f"No text parsed from {xml_filename}")
-            except ET.ParseError as e:
-                logger.error(
-                    f"XML parsing error in {xml_path.name}: {e}")
-            except Exception as e:
-                logger.error(f"Error processing {xml_path.name}: {e}")
-        logger.info(f"Extraction completed. Total articles: {len(articles)}")
-        return articles
-
     try:
         for zip_path in zip_paths:
-            section = Path(zip_path).stem.split(
-                '-')[-1].upper()  # e.g., DO1 from filename
-            logger.info(f"Processing ZIP: {zip_path} (section: {section})")
-
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                xml_files = [f for f in zip_ref.namelist()
-                             if f.endswith('.xml')]
-                logger.info(f"Found {len(xml_files)} XML files in {zip_path}")
-
-                for xml_filename in xml_files:
-                    try:
-                        # Extract to temp, parse, then move to date_dir
-                        temp_path = date_dir / f"{section}_{xml_filename}"
-                        zip_ref.extract(xml_filename, date_dir)
-                        xml_path = date_dir / xml_filename
-                        # Rename with section prefix, remove if exists to avoid conflict
-                        if temp_path.exists():
-                            temp_path.unlink()
-                        os.rename(xml_path, temp_path)
-                        xml_path = temp_path
-
-                        tree = ET.parse(xml_path)
-                        root = tree.getroot()
-
-                        # Extract artCategory if available (it's an attribute)
-                        art_category_elem = root.find('.//*[@artCategory]')
-                        art_category_text = art_category_elem.get(
-                            'artCategory', 'N/A') if art_category_elem is not None else "N/A"
-
-                        # Extract text from article tags (actual structure)
-                        text_parts = []
-                        for article in root.findall('.//article'):
-                            article_text = ET.tostring(
-                                article, encoding='unicode', method='text').strip()
-                            if article_text:
-                                text_parts.append(article_text)
-
-                        full_text = ' '.join(text_parts).strip()
-                        if full_text:
-                            articles.append({
-                                'section': section,
-                                'filename': xml_filename,
-                                'text': full_text,
-                                'xml_path': f"/xml/{xml_path.relative_to(Path(extract_dir))}",
-                                'artCategory': art_category_text
-                            })
-                            logger.info(
-                                f"Extracted text from {xml_filename} ({len(text_parts)} articles)")
-                        else:
-                            logger.warning(
-                                f"No text extracted from {xml_filename}")
-                    except ET.ParseError as e:
-                        logger.error(
-                            f"XML parsing error in {xml_filename}: {e}")
-                    except Exception as e:
-                        logger.error(f"Error processing {xml_filename}: {e}")
+            section = section_from_zip_path(zip_path)
+            # Check if this section was already extracted (e.g. an earlier run today)
+            existing_files = sorted(date_dir.glob(f"{section}_*.xml"))
+            if existing_files:
+                logger.info(
+                    f"{section} already extracted in {date_dir}. Parsing existing files.")
+                articles.extend(_parse_existing(existing_files, section, extract_dir, prefilter))
+            else:
+                section_start = len(articles)
+                try:
+                    articles.extend(iter_zip_articles(zip_path, date_dir, extract_dir, prefilter))
+                except zipfile.BadZipFile as e:
+                    logger.error(f"Rejected {section}: {e}")
+                    del articles[section_start:]
     except Exception as e:
         logger.error(f"Error in extract_articles: {e}")
         raise
 
+    if prefilter is not None and prefilter.enabled:
+        logger.info(f"Prefilter: parsed {prefilter.stats['passed']} of {prefilter.stats['scanned']} XML files.")
     logger.info(f"Extraction completed. Total articles: {len(articles)}")
     return articles
 
 
+def _parse_existing(xml_paths, section, extract_dir, prefilter=None):
+    """Parse XML files extracted by a previous run instead of extracting again."""
+    articles = []
+    for xml_path in xml_paths:
+        try:
+            # reconstruct original filename from DO1_filename.xml
+            xml_filename = xml_path.name[len(section) + 1:]
+
+            if prefilter is not None and not prefilter.might_match(xml_path.read_bytes()):
+                continue
+
+            article = parse_article_xml(xml_path, section, xml_filename, extract_dir)
+            if article:
+                articles.append(article)
+        except ET.ParseError as e:
+            logger.error(
+                f"XML parsing error in {xml_path.name}: {e}")
+        except Exception as e:
+            logger.error(f"Error processing {xml_path.name}: {e}")
+    return articles
+
+
 if __name__ == "__main__":
     # Example: Assume zip paths from download
     try:
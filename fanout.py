@@ -0,0 +1,377 @@
+"""
+Fan-out of the daily run across worker processes and machines, over Redis Streams.
+
+In distributed mode (PIPELINE_DISTRIBUTED=1 or pipeline.py --distributed)
+the coordinator still downloads and summarizes, but hands the two stages
+that grow with the edition and with the subscriber list to workers:
+
+    dou:fanout:extract   one task per section: extract its ZIP and match the run's terms
+    dou:fanout:notify    one task per shard of FANOUT_SHARD_SIZE recipients: render and send
+
+Workers (python main.py --worker) read both streams through the consumer
+group 'dou-workers' and acknowledge a task only after storing its result
+in dou:fanout:<run>:results:<stage>. A task that raises is queued again
+until it has failed FANOUT_MAX_DELIVERIES times, then moved to
+dou:fanout:dead. A task taken by a worker that died or hangs is reclaimed
+by another worker once it has been idle FANOUT_CLAIM_IDLE_SECONDS.
+
+Tasks are safe to run twice: extraction results are overwritten, and the
+sent ledger (Redis, shared by all nodes) keeps a recipient from getting
+the same article twice.
+
+The coordinator waits for every result of a stage (FANOUT_WAIT_SECONDS at
+most), processing tasks itself meanwhile, so a run also finishes with no
+worker up. Failed tasks fail the pipeline stage; resuming the run
+publishes only the tasks without a result.
+
+Usage:
+    python main.py --worker   # consume tasks until interrupted
+    python fanout.py --stats  # stream lengths, pending and dead-lettered tasks
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from logging_config import setup_logger
+
+logger = setup_logger('fanout')
+
+FANOUT_GROUP = 'dou-workers'
+STREAMS = {'extract': 'dou:fanout:extract', 'notify': 'dou:fanout:notify'}
+DEAD_STREAM = 'dou:fanout:dead'
+# Streams are trimmed to about this many entries (acknowledged ones are not needed)
+STREAM_MAXLEN = 10000
+
+FANOUT_SHARD_SIZE = int(os.getenv('FANOUT_SHARD_SIZE', 50))
+FANOUT_CLAIM_IDLE_SECONDS = float(os.getenv('FANOUT_CLAIM_IDLE_SECONDS', 300))
+FANOUT_MAX_DELIVERIES = int(os.getenv('FANOUT_MAX_DELIVERIES', 3))
+FANOUT_WAIT_SECONDS = float(os.getenv('FANOUT_WAIT_SECONDS', 3600))
+# Whether the coordinator processes tasks while it waits for a stage
+FANOUT_COORDINATOR_WORKS = os.getenv('FANOUT_COORDINATOR_WORKS', '1') == '1'
+# Lifetime of a run's spec, summarized matches and results
+FANOUT_TTL = int(os.getenv('FANOUT_TTL', 2 * 86400))
+
+
+def get_client():
+    """Redis client for the streams; distributed mode needs REDIS_URL."""
+    if not os.getenv('REDIS_URL'):
+        raise RuntimeError("Distributed mode needs REDIS_URL (Redis 6.2+, for the streams).")
+    from redis_client import redis_client
+    return redis_client.client
+
+
+def ensure_groups(client):
+    """Create the streams and their consumer group if they don't exist."""
+    import redis
+
+    for stream in STREAMS.values():
+        try:
+            client.xgroup_create(stream, FANOUT_GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+
+def _key(run_id, name):
+    return f"dou:fanout:{run_id}:{name}"
+
+
+def _local_zip(task) -> str:
+    """Path of the task's ZIP on this node, downloading it if another node fetched it."""
+    from zipstore import get_store
+
+    zip_path = Path(task['zip_path'])
+    if get_store(zip_path.parent.parent).is_valid(zip_path):
+        return str(zip_path)
+    from download import download_dou_xml
+    logger.info(f"{zip_path.name} not on this node, downloading it.")
+    paths = download_dou_xml(sections=task['id'], download_dir=str(zip_path.parent.parent),
+                             test_date=task['date'], max_fallback_days=0)
+    if not paths:
+        raise RuntimeError(f"Could not download {zip_path.name}")
+    return str(paths[0])
+
+
+def handle_extract(client, task) -> Dict:
+    """Extract one section's ZIP and match it against the run's terms (without grouping duplicates)."""
+    from pipeline import _extract_and_index
+    from scopes import applicable_terms
+    from search import match_article
+
+    spec = json.loads(client.get(_key(task['run'], 'spec')))
+    articles = _extract_and_index([_local_zip(task)])
+    matches = []
+    skipped = 0
+    for article in articles:
+        terms = applicable_terms(article, spec['search_terms'], spec['term_scopes'])
+        if not terms:
+            skipped += 1
+            continue
+        match = match_article(article, terms)
+        if match:
+            matches.append(match)
+    return {'matches': matches, 'articles': len(articles), 'articles_skipped': skipped}
+
+
+def handle_notify(client, task) -> Dict:
+    """Send the run's summarized matches to one shard of recipients."""
+    from notify import send_notifications
+
+    matches = json.loads(client.get(_key(task['run'], 'matches')))
+    return send_notifications(matches, emails=task['emails'])
+
+
+HANDLERS = {'extract': handle_extract, 'notify': handle_notify}
+
+
+class FanoutWorker:
+    """
+    Consumer of the task streams (see module docstring).
+
+    stats counts tasks 'done', 'failed' attempts, 'reclaimed' from other
+    consumers and 'dead' (dead-lettered).
+    """
+
+    def __init__(self, client=None, name: str = None, handlers: Dict[str, Callable] = None,
+                 claim_idle: float = FANOUT_CLAIM_IDLE_SECONDS, max_deliveries: int = FANOUT_MAX_DELIVERIES):
+        self.client = client or get_client()
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.handlers = handlers or HANDLERS
+        self.claim_idle = claim_idle
+        self.max_deliveries = max_deliveries
+        self._next_reclaim = 0.0
+        self.stats = {'done': 0, 'failed': 0, 'reclaimed': 0, 'dead': 0}
+        ensure_groups(self.client)
+
+    def step(self, block_ms: int = 5000) -> int:
+        """
+        Process the next task: a stuck one reclaimed from another consumer, or a new one.
+
+        Returns:
+            int: Number of tasks processed (0 if none arrived within block_ms).
+        """
+        entries = self._reclaim()
+        reclaimed = bool(entries)
+        if not entries:
+            response = self.client.xreadgroup(FANOUT_GROUP, self.name, {s: '>' for s in STREAMS.values()},
+                                              count=1, block=block_ms)
+            entries = [(stream, msg_id, fields) for stream, messages in response or []
+                       for msg_id, fields in messages]
+        for stream, msg_id, fields in entries:
+            self._process(stream, msg_id, fields, reclaimed)
+        return len(entries)
+
+    def _reclaim(self):
+        # Checked a few times per idle period rather than before every task
+        if time.monotonic() < self._next_reclaim:
+            return []
+        self._next_reclaim = time.monotonic() + self.claim_idle / 4
+        for stream in STREAMS.values():
+            claimed = self.client.xautoclaim(stream, FANOUT_GROUP, self.name, int(self.claim_idle * 1000),
+                                             start_id='0-0', count=1)[1]
+            # Entries deleted by trimming come back without fields
+            claimed = [(msg_id, fields) for msg_id, fields in claimed if fields]
+            if claimed:
+                self.stats['reclaimed'] += len(claimed)
+                self._next_reclaim = 0.0
+                return [(stream, msg_id, fields) for msg_id, fields in claimed]
+        return []
+
+    def _deliveries(self, stream, msg_id) -> int:
+        pending = self.client.xpending_range(stream, FANOUT_GROUP, min=msg_id, max=msg_id, count=1)
+        return pending[0]['times_delivered'] if pending else 1
+
+    def _process(self, stream, msg_id, fields, reclaimed=False):
+        task = json.loads(fields['task'])
+        label = f"{task['kind']} task {task['id']} of run {task['run']}"
+        attempt = task.get('attempt', 1)
+
+        if reclaimed and self._deliveries(stream, msg_id) > self.max_deliveries:
+            # Every consumer that took it died or hung on it
+            return self._dead_letter(stream, msg_id, fields, task, 'consumers kept dying on it', label)
+        try:
+            result = self.handlers[task['kind']](self.client, task)
+        except Exception as e:
+            self.stats['failed'] += 1
+            if attempt >= self.max_deliveries:
+                return self._dead_letter(stream, msg_id, fields, task, str(e), label)
+            logger.warning(f"{label} failed (attempt {attempt}), queued again: {e}")
+            with self.client.pipeline() as pipe:
+                pipe.xadd(stream, {'task': json.dumps(dict(task, attempt=attempt + 1), ensure_ascii=False)},
+                          maxlen=STREAM_MAXLEN, approximate=True)
+                pipe.xack(stream, FANOUT_GROUP, msg_id)
+                pipe.execute()
+            return
+
+        self.stats['done'] += 1
+        self._finish(stream, msg_id, task, result)
+
+    def _dead_letter(self, stream, msg_id, fields, task, error, label):
+        logger.error(f"{label} dead-lettered: {error}")
+        self.stats['dead'] += 1
+        self.client.xadd(DEAD_STREAM, {'task': fields['task'], 'error': error}, maxlen=STREAM_MAXLEN, approximate=True)
+        self._finish(stream, msg_id, task, {'error': error})
+
+    def _finish(self, stream, msg_id, task, result):
+        # Result and acknowledgment together: a task is never acked without its result
+        results_key = _key(task['run'], f"results:{task['kind']}")
+        with self.client.pipeline() as pipe:
+            pipe.hset(results_key, task['id'], json.dumps(result, ensure_ascii=False))
+            pipe.expire(results_key, FANOUT_TTL)
+            pipe.xack(stream, FANOUT_GROUP, msg_id)
+            pipe.execute()
+
+
+def run_stage(client, run_id, kind, tasks: List[Dict], wait: float = FANOUT_WAIT_SECONDS,
+              work: bool = FANOUT_COORDINATOR_WORKS) -> Dict[str, Dict]:
+    """
+    Publish a stage's tasks and wait until each has a result.
+
+    Args:
+        client: Redis client.
+        run_id (str): Pipeline run the tasks belong to.
+        kind (str): 'extract' or 'notify'.
+        tasks (list): Task dicts, each with an 'id' unique in the stage.
+            Tasks that already have a successful result (a resumed run)
+            are not published again.
+        wait (float): Longest wait for the results, in seconds.
+        work (bool): Process tasks while waiting, as one more consumer.
+
+    Returns:
+        dict: {task id: result}; failed tasks have an 'error'.
+
+    Raises:
+        TimeoutError: Not every result arrived within wait.
+    """
+    ensure_groups(client)
+    results_key = _key(run_id, f"results:{kind}")
+    done = {task_id for task_id, result in client.hgetall(results_key).items() if 'error' not in json.loads(result)}
+    pending = [task for task in tasks if task['id'] not in done]
+    with client.pipeline() as pipe:
+        # Drop failed results of a previous attempt, they are published again
+        if pending:
+            pipe.hdel(results_key, *[task['id'] for task in pending])
+        for task in pending:
+            pipe.xadd(STREAMS[kind], {'task': json.dumps(dict(task, run=run_id, kind=kind), ensure_ascii=False)},
+                      maxlen=STREAM_MAXLEN, approximate=True)
+        pipe.execute()
+    logger.info(f"Published {len(pending)} {kind} task(s) for run {run_id} "
+                f"({len(tasks) - len(pending)} already done).")
+
+    worker = FanoutWorker(client, name=f"coordinator-{socket.gethostname()}-{os.getpid()}") if work else None
+    ids = [task['id'] for task in tasks]
+    give_up_at = time.monotonic() + wait
+    while True:
+        results = dict(zip(ids, client.hmget(results_key, ids)))
+        if all(results.values()):
+            return {task_id: json.loads(result) for task_id, result in results.items()}
+        if time.monotonic() > give_up_at:
+            missing = [task_id for task_id, result in results.items() if not result]
+            raise TimeoutError(f"No result for {kind} task(s) {', '.join(missing)} of run {run_id} after {wait:.0f}s; "
+                               f"are workers running (python main.py --worker)?")
+        if worker is None or not worker.step(block_ms=1000):
+            time.sleep(0.2)
+
+
+def _raise_failures(kind, results):
+    failed = {task_id: result['error'] for task_id, result in results.items() if 'error' in result}
+    if failed:
+        raise RuntimeError(f"{len(failed)} {kind} task(s) failed: "
+                           + '; '.join(f"{task_id}: {error}" for task_id, error in failed.items()))
+
+
+def distributed_matches(run_id, zip_paths: List[str], search_terms: List[str], term_scopes: Dict = None,
+                        stats: Dict = None) -> List[Dict]:
+    """
+    match_articles over the run's ZIPs, one extract task per section.
+
+    Args:
+        stats (dict): If given, 'articles' and 'articles_skipped' are added
+            to it, as match_articles does.
+
+    Returns:
+        list: Matches with near duplicates grouped across sections.
+    """
+    from extract import section_from_zip_path
+    from search import finalize_matches
+
+    client = get_client()
+    client.set(_key(run_id, 'spec'), json.dumps({'search_terms': search_terms, 'term_scopes': term_scopes or {}},
+                                                ensure_ascii=False), ex=FANOUT_TTL)
+    tasks = [{'id': section_from_zip_path(path), 'zip_path': str(path), 'date': Path(path).parent.name}
+             for path in zip_paths]
+    results = run_stage(client, run_id, 'extract', tasks)
+    _raise_failures('extract', results)
+
+    matches = [match for task in tasks for match in results[task['id']]['matches']]
+    if stats is not None:
+        stats.update({'articles': sum(r['articles'] for r in results.values()),
+                      'articles_skipped': sum(r['articles_skipped'] for r in results.values())})
+    return finalize_matches(matches)
+
+
+def distributed_notify(run_id, matches: List[Dict], emails: List[str] = None) -> Dict:
+    """
+    send_notifications with the recipients split in shards of FANOUT_SHARD_SIZE.
+
+    Returns:
+        dict: send_notifications' counts summed over the shards, plus 'shards'.
+    """
+    from notify import get_registered_emails
+
+    stats = {'queued': 0, 'sent': 0, 'retrying': 0, 'dead': 0, 'shards': 0}
+    emails = get_registered_emails() if emails is None else emails
+    if not matches or not emails:
+        logger.info("No matches or no registered emails, nothing to send.")
+        return stats
+
+    client = get_client()
+    client.set(_key(run_id, 'matches'), json.dumps(matches, ensure_ascii=False), ex=FANOUT_TTL)
+    tasks = [{'id': f"shard-{n}", 'emails': emails[i:i + FANOUT_SHARD_SIZE]}
+             for n, i in enumerate(range(0, len(emails), FANOUT_SHARD_SIZE))]
+    results = run_stage(client, run_id, 'notify', tasks)
+    _raise_failures('notify', results)
+
+    for result in results.values():
+        for key in ('queued', 'sent', 'retrying', 'dead'):
+            stats[key] += result.get(key, 0)
+    stats['shards'] = len(tasks)
+    logger.info(f"{len(emails)} recipient(s) in {len(tasks)} shard(s): {stats['sent']} sent, "
+                f"{stats['retrying']} retrying, {stats['dead']} dead-lettered.")
+    return stats
+
+
+def stream_stats(client) -> Dict:
+    """Length and pending (taken, not acknowledged) count of each stream, and the dead letters."""
+    ensure_groups(client)
+    stats = {}
+    for kind, stream in STREAMS.items():
+        stats[kind] = {'length': client.xlen(stream),
+                       'pending': client.xpending(stream, FANOUT_GROUP)['pending']}
+    stats['dead'] = client.xlen(DEAD_STREAM)
+    return stats
+
+
+def run_worker(worker: FanoutWorker = None):
+    """Consume tasks until interrupted."""
+    worker = worker or FanoutWorker()
+    logger.info(f"Worker {worker.name} consuming {', '.join(STREAMS.values())}.")
+    last_report = worker.stats.copy()
+    while True:
+        worker.step()
+        if worker.stats != last_report:
+            logger.info(f"Worker {worker.name}: {worker.stats}")
+            last_report = worker.stats.copy()
+
+
+if __name__ == "__main__":
+    if '--stats' in sys.argv:
+        print(json.dumps(stream_stats(get_client()), indent=2))
+    else:
+        print(__doc__)
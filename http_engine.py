@@ -0,0 +1,189 @@
+"""
+Asyncio HTTP engine for the serverless INLABS downloads (api/index.py).
+
+One httpx.AsyncClient per process lives on a background event loop thread.
+Its connections stay pooled across warm invocations, and the synchronous
+Flask handlers hand coroutines to it with run(). Requests to one host are
+capped by a semaphore (INLABS_MAX_CONNECTIONS_PER_HOST). Every request's
+timeout is bounded by what is left of the invocation's Deadline, and work
+still running when the deadline passes is cancelled.
+
+httpx is optional: without it available() is False and callers keep their
+blocking requests code.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+# Plain logging: imported by the serverless handlers, which can't write logs/
+logger = logging.getLogger('http_engine')
+
+# 'async' uses this engine when httpx is installed; 'sync' keeps the requests code
+HTTP_ENGINE = os.getenv('HTTP_ENGINE', 'async')
+# Function time limit, and the part of it kept for building the response
+FUNCTION_MAX_SECONDS = float(os.getenv('FUNCTION_MAX_SECONDS', 60))
+DEADLINE_MARGIN_SECONDS = float(os.getenv('DEADLINE_MARGIN_SECONDS', 5))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv('INLABS_MAX_CONNECTIONS_PER_HOST', 4))
+
+FetchResult = namedtuple('FetchResult', ['status_code', 'headers', 'content'])
+
+
+class DeadlineExceeded(Exception):
+    """The invocation's time budget ran out before the work finished."""
+
+
+class Deadline:
+    """Time left in one invocation, minus a margin to build the response."""
+
+    def __init__(self, seconds=FUNCTION_MAX_SECONDS, margin=DEADLINE_MARGIN_SECONDS):
+        self.expires_at = time.monotonic() + seconds - margin
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, cap: float = None) -> float:
+        """
+        Timeout for one request: the time left, at most cap seconds.
+
+        Raises:
+            DeadlineExceeded: No time left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("invocation time budget exhausted")
+        return remaining if cap is None else min(cap, remaining)
+
+
+def available() -> bool:
+    """Whether the async engine is enabled and httpx is installed."""
+    return httpx is not None and HTTP_ENGINE == 'async'
+
+
+class AsyncHTTPEngine:
+    """
+    Pooled async client on its own event loop (see module docstring).
+
+    stats counts 'requests', 'timeouts', 'cancelled' runs, 'bytes' read and
+    'max_in_flight', the most requests that were open at once.
+    """
+
+    def __init__(self, per_host: int = MAX_CONNECTIONS_PER_HOST):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._semaphores = {}
+        self._in_flight = 0
+        self.stats = {'requests': 0, 'timeouts': 0, 'cancelled': 0, 'bytes': 0, 'max_in_flight': 0}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='http-engine', daemon=True)
+                self._thread.start()
+                self._client = None
+                self._semaphores = {}
+            return self._loop
+
+    def _get_client(self):
+        # Created on the engine loop, which it stays bound to
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.per_host * 4, max_keepalive_connections=self.per_host * 2)
+            self._client = httpx.AsyncClient(limits=limits, follow_redirects=True, headers={
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            })
+        return self._client
+
+    def _semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self._semaphores[host]
+
+    async def fetch(self, method, url, deadline: Deadline, cap: float = None, max_bytes: int = None,
+                    **kwargs) -> FetchResult:
+        """
+        One request, within the host's connection limit and the deadline.
+
+        Args:
+            method (str): HTTP method.
+            url (str): URL.
+            deadline (Deadline): Invocation budget the request must fit in.
+            cap (float): Longest timeout for this request, even with time left.
+            max_bytes (int): Stop reading the body after this many bytes
+                (e.g. a probe that only needs the ZIP signature).
+            **kwargs: Passed to httpx (headers, cookies, data...).
+
+        Raises:
+            DeadlineExceeded: The deadline passed first.
+            httpx.HTTPError: Network or protocol error.
+        """
+        async with self._semaphore(url):
+            # Measured after waiting for a connection slot
+            timeout = deadline.timeout(cap)
+            self.stats['requests'] += 1
+            self._in_flight += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+            try:
+                return await asyncio.wait_for(self._fetch(method, url, timeout, max_bytes, kwargs), timeout)
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                raise DeadlineExceeded(f"{method} {url} exceeded {timeout:.1f}s") from None
+            finally:
+                self._in_flight -= 1
+
+    async def _fetch(self, method, url, timeout, max_bytes, kwargs):
+        async with self._get_client().stream(method, url, timeout=timeout, **kwargs) as response:
+            if max_bytes is None:
+                content = await response.aread()
+            else:
+                content = b''
+                async for chunk in response.aiter_bytes():
+                    content += chunk
+                    if len(content) >= max_bytes:
+                        content = content[:max_bytes]
+                        break
+            self.stats['bytes'] += len(content)
+            return FetchResult(response.status_code, response.headers, content)
+
+    def run(self, coro, deadline: Deadline):
+        """
+        Run a coroutine on the engine loop and wait for it from synchronous code.
+
+        Raises:
+            DeadlineExceeded: The deadline passed first; the coroutine (and the
+                tasks it awaits) is cancelled.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return future.result(timeout=deadline.remaining())
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.stats['cancelled'] += 1
+            raise DeadlineExceeded("invocation time budget exhausted; pending requests cancelled") from None
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> AsyncHTTPEngine:
+    """The process-wide engine (one pooled client per process)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncHTTPEngine()
+        return _engine
@@ -0,0 +1,148 @@
+"""
+Per-recipient ledger of articles already notified.
+
+Each entry is (recipient, article fingerprint). Pipelines check the ledger
+before summarizing and rendering, so a rerun of the cron or a fallback
+download that lands on an already processed day only emails what is new.
+Entries are written once a message is delivered (see outbox.drain), so an
+undelivered message is built again by the next run.
+Entries expire after SENT_LEDGER_TTL_DAYS.
+
+Backends:
+    - SQLite (table sent_ledger in emails.db), used by the local pipeline.
+    - Redis (one sorted set per recipient, scored by send time), used when
+      REDIS_URL is set so serverless invocations share the same ledger.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger('ledger')
+
+DB_PATH = Path('emails.db')
+SENT_LEDGER_TTL_DAYS = int(os.getenv('SENT_LEDGER_TTL_DAYS', 30))
+
+
+def article_fingerprint(match: Dict) -> str:
+    """
+    Stable identifier for the article of a match.
+
+    An exact hash of section, filename and text (same article, same
+    fingerprint). Not the SimHash from extraction: that one is
+    locality-sensitive, so acts that differ only in a name or number can
+    share it, and it is only used to group near duplicates (see dedup).
+    """
+    article = match['article']
+    key = f"{article.get('section', '')}\n{article.get('filename', '')}\n{article.get('text', '')}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+class SQLiteSentLedger:
+    """Sent ledger stored in a SQLite table."""
+
+    def __init__(self, db_path=None, ttl_days=SENT_LEDGER_TTL_DAYS):
+        self.db_path = db_path or DB_PATH
+        self.ttl = ttl_days * 86400
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sent_ledger (
+                    recipient TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    sent_at REAL NOT NULL,
+                    PRIMARY KEY (recipient, fingerprint)
+                )''')
+            conn.execute('DELETE FROM sent_ledger WHERE sent_at < ?', (time.time() - self.ttl,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def sent_fingerprints(self, recipient: str, fingerprints: Iterable[str]) -> set:
+        """Subset of fingerprints already sent to recipient within the TTL."""
+        fingerprints = list(fingerprints)
+        if not fingerprints:
+            return set()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            placeholders = ','.join('?' * len(fingerprints))
+            rows = conn.execute(f'''
+                SELECT fingerprint FROM sent_ledger
+                WHERE recipient = ? AND sent_at >= ? AND fingerprint IN ({placeholders})
+            ''', [recipient, time.time() - self.ttl] + fingerprints).fetchall()
+        finally:
+            conn.close()
+        return {row[0] for row in rows}
+
+    def record(self, recipient: str, matches: List[Dict]):
+        """Mark the articles of matches as sent to recipient."""
+        self.record_fingerprints(recipient, [article_fingerprint(m) for m in matches])
+
+    def record_fingerprints(self, recipient: str, fingerprints: Iterable[str]):
+        """Mark articles, by article_fingerprint, as sent to recipient."""
+        fingerprints = list(fingerprints)
+        if not fingerprints:
+            return
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO sent_ledger (recipient, fingerprint, sent_at) VALUES (?, ?, ?)',
+                [(recipient, fingerprint, now) for fingerprint in fingerprints])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def filter_unsent(self, recipient: str, matches: List[Dict]) -> List[Dict]:
+        """Matches whose article has not been sent to recipient yet."""
+        sent = self.sent_fingerprints(recipient, {article_fingerprint(m) for m in matches})
+        return [m for m in matches if article_fingerprint(m) not in sent]
+
+
+class RedisSentLedger(SQLiteSentLedger):
+    """Sent ledger stored in Redis: sorted set sent:<recipient> of fingerprints scored by send time."""
+
+    def __init__(self, client, ttl_days=SENT_LEDGER_TTL_DAYS):
+        self.client = client
+        self.ttl = ttl_days * 86400
+
+    def _key(self, recipient):
+        return f"sent:{recipient.lower()}"
+
+    def sent_fingerprints(self, recipient: str, fingerprints: Iterable[str]) -> set:
+        fingerprints = list(fingerprints)
+        if not fingerprints:
+            return set()
+        cutoff = time.time() - self.ttl
+        pipe = self.client.pipeline(transaction=False)
+        for fingerprint in fingerprints:
+            pipe.zscore(self._key(recipient), fingerprint)
+        scores = pipe.execute()
+        return {fp for fp, score in zip(fingerprints, scores) if score is not None and score >= cutoff}
+
+    def record_fingerprints(self, recipient: str, fingerprints: Iterable[str]):
+        fingerprints = list(fingerprints)
+        if not fingerprints:
+            return
+        now = time.time()
+        key = self._key(recipient)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(key, {fingerprint: now for fingerprint in fingerprints})
+        pipe.zremrangebyscore(key, '-inf', now - self.ttl)
+        pipe.expire(key, int(self.ttl))
+        pipe.execute()
+
+
+def get_sent_ledger(db_path=None):
+    """Redis ledger when REDIS_URL is configured, SQLite otherwise."""
+    if os.getenv('REDIS_URL'):
+        try:
+            from redis_client import redis_client
+            return RedisSentLedger(redis_client.client)
+        except Exception as e:
+            logger.warning(f"Redis unavailable for sent ledger, using SQLite: {e}")
+    return SQLiteSentLedger(db_path)
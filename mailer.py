@@ -0,0 +1,215 @@
+"""
+Pooled SMTP sending for batch notifications.
+
+Opening a connection per recipient costs an EHLO, STARTTLS, LOGIN and QUIT
+round trip for every message. SMTPPool keeps a few authenticated
+connections open for the whole batch, sends many messages over each one and
+transparently reconnects when the server drops a connection.
+"""
+
+import logging
+import os
+import queue
+import smtplib
+import socket
+import threading
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# Plain logging (not logging_config) so the serverless api/ handlers, which
+# have a read-only filesystem, can import this module too.
+logger = logging.getLogger('mailer')
+
+# Servers such as Gmail close a session after ~100 messages; recycle before that
+MAX_MESSAGES_PER_CONNECTION = 90
+
+# Off port 465, connections must be upgraded with STARTTLS before LOGIN;
+# set to 1 only for a local relay or test server without TLS
+SMTP_ALLOW_PLAINTEXT = os.getenv('SMTP_ALLOW_PLAINTEXT', '0') == '1'
+
+# Errors after which the connection is discarded and the send retried once.
+# (SMTPException itself subclasses OSError, so OSError can't be listed here.)
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+def build_html_message(sender, recipient, subject, html_body):
+    """Build the multipart HTML message used by all notification senders."""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+class SMTPPool:
+    """
+    Thread-safe pool of authenticated SMTP connections.
+
+    Connections are opened lazily, up to `size`, and reused until
+    MAX_MESSAGES_PER_CONNECTION messages were sent over them. Port 465 uses
+    implicit TLS; any other port requires STARTTLS unless allow_plaintext.
+
+    Usage:
+        with SMTPPool(host, port, user, password) as pool:
+            for recipient, msg in messages:
+                pool.send(user, recipient, msg.as_string())
+    """
+
+    def __init__(self, host, port, user=None, password=None, size=1, timeout=30,
+                 max_messages_per_connection=MAX_MESSAGES_PER_CONNECTION,
+                 allow_plaintext=SMTP_ALLOW_PLAINTEXT):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.allow_plaintext = allow_plaintext
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._closed = False
+        self.stats = {'connections_opened': 0, 'reconnects': 0, 'messages_sent': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _connect(self):
+        """
+        Open and authenticate a new connection.
+
+        Raises:
+            smtplib.SMTPNotSupportedError: The server doesn't offer STARTTLS
+                and plaintext isn't allowed.
+            smtplib.SMTPException: STARTTLS failed (plaintext is never used then).
+        """
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                server.ehlo()
+                if server.has_extn('starttls'):
+                    server.starttls()
+                    server.ehlo()
+                elif self.allow_plaintext:
+                    logger.warning(f"{self.host}:{self.port} doesn't offer STARTTLS; sending in plaintext "
+                                   f"(SMTP_ALLOW_PLAINTEXT=1)")
+                else:
+                    raise smtplib.SMTPNotSupportedError(
+                        f"{self.host}:{self.port} doesn't offer STARTTLS; refusing to send credentials and mail "
+                        f"in plaintext (set SMTP_ALLOW_PLAINTEXT=1 to allow it)")
+            except BaseException:
+                server.close()
+                raise
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        # Per-connection message counter used for recycling
+        server.fiscaldou_sent = 0
+        with self._lock:
+            self.stats['connections_opened'] += 1
+        logger.debug(f"SMTP connection opened to {self.host}:{self.port}")
+        return server
+
+    def _acquire(self):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_open = self._open < self.size
+                if can_open:
+                    self._open += 1
+            if can_open:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            # All connections busy: wait for one to be released (or dropped)
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _release(self, server):
+        if server is None:
+            with self._lock:
+                self._open -= 1
+            return
+        if self._closed or server.fiscaldou_sent >= self.max_messages_per_connection:
+            self._quit(server)
+            with self._lock:
+                self._open -= 1
+            return
+        self._idle.put(server)
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def send(self, from_addr, to_addrs, msg_string):
+        """
+        Send one message over a pooled connection.
+
+        If the server dropped the connection, it is replaced and the message
+        is retried once on the new connection.
+
+        Raises:
+            smtplib.SMTPException: If sending fails after reconnecting.
+        """
+        server = self._acquire()
+        try:
+            try:
+                server.sendmail(from_addr, to_addrs, msg_string)
+            except RECONNECT_ERRORS as e:
+                logger.warning(f"SMTP connection lost ({e}). Reconnecting...")
+                self._quit(server)
+                server = None
+                server = self._connect()
+                with self._lock:
+                    self.stats['reconnects'] += 1
+                server.sendmail(from_addr, to_addrs, msg_string)
+            server.fiscaldou_sent += 1
+            with self._lock:
+                self.stats['messages_sent'] += 1
+        except Exception:
+            if server is not None:
+                # Leave the connection in a clean state for the next message
+                try:
+                    server.rset()
+                except Exception:
+                    self._quit(server)
+                    server = None
+            raise
+        finally:
+            self._release(server)
+
+    def send_message(self, msg):
+        """Send an email.message.Message using its From/To headers."""
+        self.send(msg['From'], msg['To'], msg.as_string())
+
+    def close(self):
+        """Quit all idle connections."""
+        self._closed = True
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(server)
+            with self._lock:
+                self._open -= 1
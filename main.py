@@ -1,9 +1,8 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from search import find_matches
-from summarize import summarize_matches
-from notify import send_notifications
+from poller import AvailabilityPoller
+from pipeline import run_pipeline, format_stats
 from datetime import datetime
 import os
+import sys
 from logging_config import setup_logger
 
 logger = setup_logger('main')
@@ -12,39 +11,53 @@ def daily_dou_check():
     """Job to run daily: search, summarize, notify."""
     try:
         logger.info(f"Starting daily DOU check at {datetime.now()}")
-        matches = find_matches()
-        if matches:
-            summarized = summarize_matches(matches)
-            send_notifications(summarized)
-        else:
-            logger.info("No matches found today.")
+        # Stages are checkpointed under runs/; an unfinished run from today is resumed
+        run = run_pipeline()
+        if run:
+            logger.info(format_stats(run.stats()))
     except Exception as e:
         logger.error(f"Error in daily_dou_check: {e}")
 
+def check_published_sections(date_str, sections, republished=False):
+    """
+    Poller callback: run the pipeline for sections that just appeared on INLABS.
+
+    A republished section is run again even though its run already completed.
+    """
+    logger.info(f"Sections {sections} available for {date_str}, starting pipeline at {datetime.now()}")
+    # Raises on failure so the poller triggers these sections again on its next poll
+    run = run_pipeline(sections=' '.join(sections), target_date=date_str, force=republished)
+    if run and run.manifest.get('note') == 'no DOU files':
+        # Probed as available but the download failed (5xx, HTML instead of a ZIP...)
+        raise RuntimeError(f"Sections {sections} are published for {date_str} but could not be downloaded")
+    if run:
+        logger.info(format_stats(run.stats()))
+
+def run_fanout_worker():
+    """Consume extraction and notification tasks of distributed runs (see fanout.py)."""
+    from fanout import run_worker
+    print("DOU Notifier worker started. Press Ctrl+C to exit.")
+    try:
+        run_worker()
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Shutting down worker.")
+    except Exception as e:
+        logger.error(f"Error in worker: {e}")
+
 if __name__ == '__main__':
+    if '--worker' in sys.argv:
+        run_fanout_worker()
+        sys.exit(0)
+    poller = AvailabilityPoller(on_available=check_published_sections)
     try:
-        # Setup scheduler
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(
-            daily_dou_check,
-            'cron',
-            hour=8,
-            minute=0,
-            id='daily_dou_check',
-            replace_existing=True
-        )
-        
-        scheduler.start()
-        logger.info("DOU Notifier Scheduler started. Daily check at 8:00 AM.")
-        print("DOU Notifier Scheduler started. Daily check at 8:00 AM.")
+        message = (f"DOU Notifier started. Polling INLABS from {poller.start_hour}:00 to {poller.end_hour}:00; "
+                   f"each section is processed as soon as it is published.")
+        logger.info(message)
+        print(message)
         print("Press Ctrl+C to exit.")
-        
-        # Keep running
-        import time
-        while True:
-            time.sleep(1)
+        poller.run_forever()
     except (KeyboardInterrupt, SystemExit):
-        logger.info("Shutting down scheduler.")
-        scheduler.shutdown()
+        logger.info("Shutting down poller.")
+        poller.stop()
     except Exception as e:
         logger.error(f"Error in main: {e}")
\ No newline at end of file
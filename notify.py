@@ -1,10 +1,12 @@
 import sqlite3
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import smtplib
 from pathlib import Path
 from typing import List, Dict
 from logging_config import setup_logger
+from mailer import SMTPPool
+import outbox
+from ledger import get_sent_ledger
+from email_templates import INDEX_SLOT, BlockCache
 import os
 from dotenv import load_dotenv
 
@@ -36,32 +38,47 @@ def get_registered_emails():
         return []
 
 
-def format_email_body(matches: List[Dict]) -> str:
-    """Format HTML email body with summaries."""
-    if not matches:
-        return "Nenhuma ocorrência encontrada hoje no DOU para os termos monitorados."
-
-    body = """
-    <html>
-    <body>
-    <h2>Notificações Diárias DOU - Ocorrências Encontradas</h2>
-    <p>Olá! Foram encontradas as seguintes ocorrências hoje:</p>
-    """
-
-    for i, match in enumerate(matches, 1):
-        article = match['article']
-        terms = ', '.join(match['terms_matched'])
-        summary = match['summary']
-        body += f"""
+def render_match_block(match: Dict) -> str:
+    """HTML block of one match; its position in the email is left as INDEX_SLOT."""
+    article = match['article']
+    terms = ', '.join(match['terms_matched'])
+    summary = match['summary']
+    published = f", {article['pub_date']}" if article.get('pub_date') else ''
+    duplicates_note = ''
+    if match.get('duplicate_count'):
+        duplicates_note = f"<p><em>+ {match['duplicate_count']} publicação(ões) semelhante(s) agrupada(s) com esta.</em></p>"
+    return f"""
         <div style="border: 1px solid #ccc; margin: 10px 0; padding: 10px;">
-            <h3>Artigo {i}: {article['filename']} ({article['section']})</h3>
+            <h3>Artigo {INDEX_SLOT}: {article['filename']} ({article['section']}{published})</h3>
             <p><strong>Termos encontrados:</strong> {terms}</p>
             <p><strong>Resumo:</strong></p>
             <p>{summary}</p>
             <p><strong>Link XML:</strong> {article['xml_path']}</p>
+            {duplicates_note}
         </div>
         """
 
+
+def format_email_body(matches: List[Dict], blocks: BlockCache = None, intro: str = None) -> str:
+    """
+    Format HTML email body with summaries.
+
+    intro replaces the default opening line (used by retro-search digests).
+
+    Pass the same BlockCache for every email of a run so each match block
+    is rendered only once.
+    """
+    if not matches:
+        return "Nenhuma ocorrência encontrada hoje no DOU para os termos monitorados."
+
+    blocks = blocks or BlockCache(render_match_block)
+    body = """
+    <html>
+    <body>
+    <h2>Notificações Diárias DOU - Ocorrências Encontradas</h2>
+    <p>{intro}</p>
+    """.format(intro=intro or "Olá! Foram encontradas as seguintes ocorrências hoje:")
+    body += ''.join(blocks.render(match, i) for i, match in enumerate(matches, 1))
     body += """
     <p>Atenciosamente,<br>DOU Notifier</p>
     </body>
@@ -70,60 +87,98 @@ def format_email_body(matches: List[Dict]) -> str:
     return body
 
 
-def send_notifications(matches: List[Dict]):
+def filter_new_matches(matches: List[Dict], emails: List[str] = None, ledger=None) -> List[Dict]:
+    """
+    Drop matches whose article was already sent to every registered recipient.
+
+    Run before summarizing so reruns and fallback days don't pay for
+    summaries nobody will receive.
+    """
+    if not matches:
+        return []
+    emails = get_registered_emails() if emails is None else emails
+    if not emails:
+        return matches
+    ledger = ledger or get_sent_ledger(DB_PATH)
+
+    pending = set()
+    for email in emails:
+        pending.update(id(m) for m in ledger.filter_unsent(email, matches))
+    new_matches = [m for m in matches if id(m) in pending]
+    skipped = len(matches) - len(new_matches)
+    if skipped:
+        logger.info(f"Skipping {skipped} match(es) already sent to all recipients.")
+    return new_matches
+
+
+def send_notifications(matches: List[Dict], emails: List[str] = None):
     """
     Send email notifications to registered users.
 
+    Each recipient only receives matches not yet in the sent ledger; the
+    body is rendered once per distinct set of new matches. Matches enter the
+    ledger when the outbox delivers their message, so a message that is
+    dead-lettered or never drained is built again by the next run.
+
     Args:
         matches (List[Dict]): Summarized matches from search.
+        emails (List[str]): Recipients (default: every registered email),
+            e.g. one shard of them in distributed mode (see fanout.py).
+
+    Returns:
+        dict: {'queued': int, 'sent': int, 'retrying': int, 'dead': int}
     """
+    stats = {'queued': 0, 'sent': 0, 'retrying': 0, 'dead': 0}
     if not matches:
         logger.info("No matches to notify about.")
-        return
+        return stats
 
-    emails = get_registered_emails()
+    emails = get_registered_emails() if emails is None else emails
     if not emails:
         logger.warning("No registered emails to notify.")
-        return
-
-    logger.info(
-        f"Sending notifications to {len(emails)} emails for {len(matches)} matches.")
-    subject = f"DOU Notificações - {len(matches)} ocorrência(s) encontrada(s) hoje"
-    body = format_email_body(matches)
-
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = SMTP_USER
-    msg.attach(MIMEText(body, 'html'))
+        return stats
+
+    ledger = get_sent_ledger(DB_PATH)
+    recipients_by_matches = {}
+    for email in emails:
+        new_matches = ledger.filter_unsent(email, matches)
+        if not new_matches:
+            logger.info(f"Nothing new for {email}, skipping.")
+            continue
+        key = tuple(id(m) for m in new_matches)
+        recipients_by_matches.setdefault(key, (new_matches, []))[1].append(email)
+
+    if not recipients_by_matches:
+        # Still drain below: a previous attempt may have queued messages and crashed
+        logger.info("All matches were already sent to every recipient.")
+    else:
+        logger.info(
+            f"Queueing notifications to {sum(len(r) for _, r in recipients_by_matches.values())} "
+            f"emails for {len(matches)} matches.")
+
+    # Write every message to the durable outbox before touching SMTP, so a
+    # failure mid-batch leaves the rest queued for the drain worker instead of lost.
+    blocks = BlockCache(render_match_block)
+    for new_matches, recipients in recipients_by_matches.values():
+        subject = f"DOU Notificações - {len(new_matches)} ocorrência(s) encontrada(s) hoje"
+        body = format_email_body(new_matches, blocks)
+        for email in recipients:
+            if outbox.enqueue(email, subject, body, matches=new_matches):
+                stats['queued'] += 1
+    logger.info(f"{stats['queued']} notification(s) queued in outbox.")
 
     try:
-        server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT)
-        server.login(SMTP_USER, SMTP_PASS)
-        logger.info("SMTP connection and login successful.")
-
-        sent_count = 0
-        for email in emails:
-            msg['To'] = email
-            text = msg.as_string()
-            server.sendmail(SMTP_USER, email, text)
-            logger.info(f"Notification sent to {email}")
-            sent_count += 1
-
-        server.quit()
-        logger.info(f"All {sent_count} notifications sent successfully.")
+        with SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS) as pool:
+            stats.update(outbox.drain(pool, SMTP_USER))
+        logger.info(
+            f"{stats['sent']} notifications sent, {stats['retrying']} scheduled for retry, "
+            f"{stats['dead']} dead-lettered.")
     except smtplib.SMTPAuthenticationError as e:
         logger.error(
             f"SMTP authentication error: {e}. Check SMTP_USER and SMTP_PASS.")
-    except smtplib.SMTPServerDisconnected as e:
-        logger.error(f"SMTP server disconnected: {e}")
     except Exception as e:
-        logger.error(f"Email sending error: {e}")
-    finally:
-        if 'server' in locals():
-            try:
-                server.quit()
-            except:
-                pass
+        logger.error(f"Email sending error: {e}. Pending messages stay in the outbox (python outbox.py).")
+    return stats
 
 
 if __name__ == "__main__":
@@ -131,7 +186,7 @@ if __name__ == "__main__":
     try:
         from search import find_matches
         from summarize import summarize_matches
-        matches = find_matches()
+        matches = filter_new_matches(find_matches())
         if matches:
             summarized = summarize_matches(matches)
             send_notifications(summarized)
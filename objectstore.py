@@ -0,0 +1,146 @@
+"""
+Small key/value object store with expiry, shared by the components that
+coordinate several processes or serverless instances (edition_cache,
+runlock): Redis when REDIS_URL is set, otherwise a local directory that
+behaves the same way for local runs and tests.
+
+Values are bytes. put_if_absent and the *_if methods are atomic, so they
+can implement locks and leases.
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# Plain logging: used by the serverless api/ handlers
+logger = logging.getLogger('objectstore')
+
+_EXPIRY = struct.Struct('<d')
+
+
+class LocalObjectStore:
+    """
+    Directory stand-in for Redis: one file per key, prefixed with its expiry
+    time. put_if_absent uses O_EXCL, so it is atomic across processes.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.root / key.replace(':', '_').replace('/', '_')
+
+    def _read(self, path):
+        try:
+            raw = path.read_bytes()
+        except OSError:
+            return None
+        if len(raw) < _EXPIRY.size or _EXPIRY.unpack_from(raw)[0] < time.time():
+            return None
+        return raw[_EXPIRY.size:]
+
+    def get(self, key) -> Optional[bytes]:
+        return self._read(self._path(key))
+
+    def exists(self, key) -> bool:
+        return self.get(key) is not None
+
+    def put(self, key, data: bytes, ttl: int):
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(_EXPIRY.pack(time.time() + ttl) + data)
+        tmp_path.replace(path)
+
+    def put_if_absent(self, key, data: bytes, ttl: int) -> bool:
+        path = self._path(key)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            except FileExistsError:
+                if self._read(path) is not None:
+                    return False
+                # Expired: remove it and try once more
+                path.unlink(missing_ok=True)
+                continue
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_EXPIRY.pack(time.time() + ttl) + data)
+            return True
+        return False
+
+    def delete_if(self, key, data: bytes):
+        """Delete key only if it still holds data (e.g. our own lock token)."""
+        path = self._path(key)
+        if self._read(path) == data:
+            path.unlink(missing_ok=True)
+
+    def renew_if(self, key, data: bytes, ttl: int) -> bool:
+        """Extend key's expiry only if it still holds data; return whether it did."""
+        if self._read(self._path(key)) != data:
+            return False
+        self.put(key, data, ttl)
+        return True
+
+
+class RedisObjectStore:
+    """Same interface as LocalObjectStore, on a binary (non-decoding) Redis client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def exists(self, key) -> bool:
+        return bool(self.client.exists(key))
+
+    def put(self, key, data: bytes, ttl: int):
+        self.client.set(key, data, ex=ttl)
+
+    def put_if_absent(self, key, data: bytes, ttl: int) -> bool:
+        return bool(self.client.set(key, data, ex=ttl, nx=True))
+
+    def delete_if(self, key, data: bytes):
+        import redis
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) == data:
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def renew_if(self, key, data: bytes, ttl: int) -> bool:
+        import redis
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != data:
+                    return False
+                pipe.multi()
+                pipe.expire(key, ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+
+def open_store(local_dir):
+    """RedisObjectStore when REDIS_URL is set and reachable, else LocalObjectStore(local_dir)."""
+    if os.getenv('REDIS_URL'):
+        try:
+            import redis
+            client = redis.from_url(os.getenv('REDIS_URL'), socket_connect_timeout=5, socket_timeout=30)
+            client.ping()
+            return RedisObjectStore(client)
+        except Exception as e:
+            logger.warning(f"Redis unavailable, using local store {local_dir}: {e}")
+    return LocalObjectStore(local_dir)
@@ -0,0 +1,272 @@
+"""
+Durable outbox for notification emails.
+
+Rendered messages are written to SQLite before any SMTP work happens, so a
+failure halfway through a batch loses nothing: the drain worker retries
+each pending message with exponential backoff and dead-letters it after
+OUTBOX_MAX_ATTEMPTS. Every message has an idempotency key, so enqueueing
+the same message again (e.g. a rerun of the pipeline) never sends it twice.
+
+Usage:
+    python outbox.py          # drain due messages once
+    python outbox.py --loop   # keep draining until interrupted
+    python outbox.py --stats  # print message counts per status
+    python outbox.py --retry-dead  # requeue dead-lettered messages
+"""
+
+import hashlib
+import json
+import os
+import random
+import smtplib
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from ledger import article_fingerprint, get_sent_ledger
+from logging_config import setup_logger
+
+logger = setup_logger('outbox')
+
+DB_PATH = Path('emails.db')
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 6))
+OUTBOX_BASE_DELAY = float(os.getenv('OUTBOX_BASE_DELAY', 60))  # seconds
+OUTBOX_MAX_DELAY = float(os.getenv('OUTBOX_MAX_DELAY', 6 * 3600))
+# Messages claimed by a drain worker that died are released after this long
+CLAIM_TIMEOUT = 15 * 60
+
+
+def get_connection(db_path=None):
+    """Open the outbox database, creating the table on first use."""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT UNIQUE NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            claimed_at REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            ledger_fingerprints TEXT
+        )''')
+    cols = {row[1] for row in conn.execute("PRAGMA table_info('outbox')")}
+    if 'ledger_fingerprints' not in cols:
+        conn.execute("ALTER TABLE outbox ADD COLUMN ledger_fingerprints TEXT")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_status_next
+        ON outbox(status, next_attempt_at)
+    ''')
+    return conn
+
+
+def make_idempotency_key(recipient, subject, html):
+    """Key identifying a message by recipient and content."""
+    digest = hashlib.sha256(f"{recipient}\n{subject}\n{html}".encode('utf-8')).hexdigest()
+    return f"{recipient}:{digest[:32]}"
+
+
+def enqueue(recipient, subject, html, idempotency_key=None, db_path=None, matches=None) -> bool:
+    """
+    Store a rendered message for delivery.
+
+    Args:
+        matches (list): Matches the message notifies; their articles are
+            recorded in the sent ledger once the message is delivered.
+
+    Returns:
+        bool: True if queued, False if a message with the same key already exists.
+    """
+    key = idempotency_key or make_idempotency_key(recipient, subject, html)
+    fingerprints = json.dumps([article_fingerprint(m) for m in matches]) if matches else None
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO outbox (idempotency_key, recipient, subject, html, ledger_fingerprints)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (key, recipient, subject, html, fingerprints))
+        conn.commit()
+        queued = cursor.rowcount > 0
+    finally:
+        conn.close()
+    if queued:
+        logger.debug(f"Queued message {key}")
+    else:
+        logger.info(f"Message {key} already in outbox, not queued again.")
+    return queued
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    delay = min(OUTBOX_BASE_DELAY * (2 ** (attempts - 1)), OUTBOX_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _claim_due(conn, limit):
+    """Atomically mark due messages as 'sending' and return them."""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Release messages claimed by a worker that never finished
+        conn.execute('''
+            UPDATE outbox SET status = 'pending'
+            WHERE status = 'sending' AND claimed_at < ?
+        ''', (now - CLAIM_TIMEOUT,))
+        rows = conn.execute('''
+            SELECT id, recipient, subject, html, attempts, ledger_fingerprints FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id LIMIT ?
+        ''', (now, limit)).fetchall()
+        conn.executemany(
+            "UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+            [(now, row[0]) for row in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+
+def drain(pool, sender, batch_size=100, max_attempts=OUTBOX_MAX_ATTEMPTS, db_path=None) -> Dict:
+    """
+    Send every due message in the outbox, recording the articles of each
+    delivered message in the sent ledger.
+
+    Args:
+        pool (mailer.SMTPPool): Connection pool used for sending.
+        sender (str): From address.
+        batch_size (int): Messages claimed per database round trip.
+        max_attempts (int): Failed attempts after which a message is dead-lettered.
+
+    Returns:
+        dict: {'sent': int, 'retrying': int, 'dead': int}
+
+    Raises:
+        smtplib.SMTPAuthenticationError: Credentials rejected; messages stay pending.
+    """
+    from mailer import build_html_message
+
+    stats = {'sent': 0, 'retrying': 0, 'dead': 0}
+    ledger = None
+    conn = get_connection(db_path)
+    conn.isolation_level = None  # explicit transactions in _claim_due
+    try:
+        while True:
+            rows = _claim_due(conn, batch_size)
+            if not rows:
+                break
+            for message_id, recipient, subject, html, attempts, fingerprints in rows:
+                try:
+                    msg = build_html_message(sender, recipient, subject, html)
+                    pool.send(sender, recipient, msg.as_string())
+                    conn.execute('''
+                        UPDATE outbox SET status = 'sent', attempts = ?, sent_at = CURRENT_TIMESTAMP,
+                            claimed_at = NULL, last_error = NULL
+                        WHERE id = ?
+                    ''', (attempts + 1, message_id))
+                    stats['sent'] += 1
+                    logger.info(f"Notification sent to {recipient}")
+                    if fingerprints:
+                        # Caught here: a ledger error must not put a delivered message back for retry
+                        try:
+                            ledger = ledger or get_sent_ledger(db_path)
+                            ledger.record_fingerprints(recipient, json.loads(fingerprints))
+                        except Exception as e:
+                            logger.error(f"Sent to {recipient} but could not record it in the sent ledger: {e}")
+                except smtplib.SMTPAuthenticationError:
+                    # Every message would fail the same way; hand the batch back
+                    # untouched instead of spending retry attempts on it.
+                    placeholders = ','.join('?' * len(rows))
+                    conn.execute(f'''
+                        UPDATE outbox SET status = 'pending', claimed_at = NULL
+                        WHERE status = 'sending' AND id IN ({placeholders})
+                    ''', [row[0] for row in rows])
+                    raise
+                except Exception as e:
+                    attempts += 1
+                    if attempts >= max_attempts:
+                        status, next_attempt_at = 'dead', 0
+                        stats['dead'] += 1
+                        logger.error(f"Giving up on message to {recipient} after {attempts} attempts: {e}")
+                    else:
+                        status, next_attempt_at = 'pending', time.time() + backoff_delay(attempts)
+                        stats['retrying'] += 1
+                        logger.warning(f"Send to {recipient} failed (attempt {attempts}): {e}. Will retry.")
+                    conn.execute('''
+                        UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?,
+                            claimed_at = NULL, last_error = ?
+                        WHERE id = ?
+                    ''', (status, attempts, next_attempt_at, str(e), message_id))
+    finally:
+        conn.close()
+
+    logger.info(f"Outbox drained: {stats}")
+    return stats
+
+
+def get_stats(db_path=None) -> Dict:
+    """Message counts per status."""
+    conn = get_connection(db_path)
+    try:
+        rows = conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+def retry_dead(db_path=None) -> int:
+    """Move dead-lettered messages back to pending (e.g. after fixing SMTP credentials)."""
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.execute('''
+            UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = 0
+            WHERE status = 'dead'
+        ''')
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def next_due_in(db_path=None) -> Optional[float]:
+    """Seconds until the next pending message is due, or None if nothing is pending."""
+    conn = get_connection(db_path)
+    try:
+        row = conn.execute(
+            "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'").fetchone()
+    finally:
+        conn.close()
+    if row[0] is None:
+        return None
+    return max(0.0, row[0] - time.time())
+
+
+if __name__ == "__main__":
+    from mailer import SMTPPool
+    from notify import SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS
+
+    try:
+        if '--stats' in sys.argv:
+            print(get_stats())
+        elif '--retry-dead' in sys.argv:
+            print(f"{retry_dead()} dead message(s) moved back to pending.")
+        else:
+            while True:
+                with SMTPPool(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS) as pool:
+                    drain(pool, SMTP_USER)
+                if '--loop' not in sys.argv:
+                    break
+                wait = next_due_in()
+                time.sleep(min(wait, 300) if wait is not None else 60)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Main execution error: {e}")
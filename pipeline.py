@@ -0,0 +1,440 @@
+"""
+Stage-checkpointed runner for the daily pipeline.
+
+Each stage (download -> extract -> match -> summarize -> notify) writes its
+output under runs/<run_id>/<stage>.json and records timing and size in
+runs/<run_id>/run.json. Rerunning an unfinished run skips every stage that
+already completed, so a crash in notify doesn't throw away a finished
+download or paid summaries.
+
+In streaming mode (--stream or PIPELINE_STREAMING=1) download, extract and
+match overlap in a single 'match' stage (see streaming.py); only its match
+set is checkpointed.
+
+In distributed mode (--distributed or PIPELINE_DISTRIBUTED=1) extraction
+and matching (one task per section) and notification (one task per shard
+of recipients) are fanned out to workers over Redis Streams (see fanout.py).
+
+Only one runner at a time processes a date and scope, across processes and
+machines (see runlock): a runner that finds it running elsewhere, or already
+completed, returns without doing anything. --force runs a completed one again.
+
+Usage:
+    python pipeline.py                  # resume today's unfinished run, or start a new one
+    python pipeline.py --new            # always start a new run
+    python pipeline.py --force          # run even if today's run already completed
+    python pipeline.py --stream         # overlap download, extraction and matching
+    python pipeline.py --distributed    # fan extraction and notification out to workers (main.py --worker)
+    python pipeline.py --resume RUN_ID  # resume a specific run
+    python pipeline.py --stats [RUN_ID] # print stage timings and sizes (latest run by default)
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from logging_config import setup_logger
+
+logger = setup_logger('pipeline')
+
+RUNS_DIR = Path('runs')
+PIPELINE_STREAMING = os.getenv('PIPELINE_STREAMING', '0') == '1'
+PIPELINE_DISTRIBUTED = os.getenv('PIPELINE_DISTRIBUTED', '0') == '1'
+
+STAGES = ['download', 'extract', 'match', 'summarize', 'notify']
+
+
+class PipelineRun:
+    """One pipeline execution and its persisted stage outputs."""
+
+    def __init__(self, run_id: Optional[str] = None, runs_dir: Path = RUNS_DIR, search_terms: List[str] = None,
+                 scope: Dict = None, term_scopes: Dict = None):
+        self.run_id = run_id or datetime.now().strftime('%Y-%m-%d_%H%M%S')
+        self.path = Path(runs_dir) / self.run_id
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.path / 'run.json'
+        if self.manifest_path.exists():
+            self.manifest = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+        else:
+            self.manifest = {
+                'run_id': self.run_id,
+                'status': 'running',
+                'started_at': datetime.now().isoformat(),
+                'search_terms': search_terms,
+                'scope': scope or {},
+                'term_scopes': term_scopes or {},
+                'stages': {},
+            }
+            self._save_manifest()
+
+    @property
+    def search_terms(self):
+        return self.manifest.get('search_terms')
+
+    @property
+    def scope(self):
+        """Sections and date this run covers ({} = all sections, latest available date)."""
+        return self.manifest.get('scope', {})
+
+    @property
+    def term_scopes(self):
+        """Per-term sections/category the run searches with (see scopes.py)."""
+        return self.manifest.get('term_scopes', {})
+
+    @property
+    def completed(self):
+        return self.manifest['status'] == 'completed'
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self.manifest, indent=2, ensure_ascii=False), encoding='utf-8')
+        tmp_path.replace(self.manifest_path)
+
+    def stage(self, name: str, fn: Callable, *args, is_valid: Callable = None):
+        """
+        Run a stage, or load its output if it already completed in this run.
+
+        Args:
+            name (str): Stage name; output goes to <run dir>/<name>.json.
+            fn (callable): Produces the stage output (must be JSON-serializable).
+            is_valid (callable): Optional check on a loaded output; if it
+                returns False the stage is run again (e.g. files deleted).
+        """
+        output_path = self.path / f"{name}.json"
+        info = self.manifest['stages'].get(name, {})
+        if info.get('status') == 'done' and output_path.exists():
+            output = json.loads(output_path.read_text(encoding='utf-8'))
+            if is_valid is None or is_valid(output):
+                logger.info(f"[{self.run_id}] Stage '{name}' already completed, loading checkpoint.")
+                return output
+            logger.warning(f"[{self.run_id}] Checkpoint of stage '{name}' is stale, running it again.")
+
+        logger.info(f"[{self.run_id}] Running stage '{name}'.")
+        self.manifest['stages'][name] = {'status': 'running', 'started_at': datetime.now().isoformat()}
+        self._save_manifest()
+
+        start = time.perf_counter()
+        try:
+            output = fn(*args)
+        except Exception as e:
+            self.manifest['stages'][name].update({'status': 'failed', 'error': str(e),
+                                                  'seconds': round(time.perf_counter() - start, 2)})
+            self._save_manifest()
+            raise
+        seconds = round(time.perf_counter() - start, 2)
+
+        # Write to a temp file first so a crash never leaves a half-written checkpoint
+        tmp_path = output_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(output, ensure_ascii=False), encoding='utf-8')
+        tmp_path.replace(output_path)
+
+        self.manifest['stages'][name] = {
+            'status': 'done',
+            'seconds': seconds,
+            'items': len(output) if isinstance(output, (list, dict)) else None,
+            'output_bytes': output_path.stat().st_size,
+            'finished_at': datetime.now().isoformat(),
+        }
+        self._save_manifest()
+        logger.info(f"[{self.run_id}] Stage '{name}' done in {seconds}s.")
+        return output
+
+    def annotate(self, name: str, **info):
+        """Attach extra information to a stage's entry in run.json."""
+        self.manifest['stages'].setdefault(name, {}).update(info)
+        self._save_manifest()
+
+    def finish(self, note: str = None):
+        self.manifest['status'] = 'completed'
+        self.manifest['finished_at'] = datetime.now().isoformat()
+        if note:
+            self.manifest['note'] = note
+        self._save_manifest()
+
+    def stats(self) -> Dict:
+        """Per-stage timings and sizes."""
+        return {
+            'run_id': self.run_id,
+            'status': self.manifest['status'],
+            'note': self.manifest.get('note'),
+            'stages': self.manifest['stages'],
+            'total_seconds': round(sum(s.get('seconds') or 0 for s in self.manifest['stages'].values()), 2),
+        }
+
+
+def list_runs(runs_dir: Path = RUNS_DIR) -> List[str]:
+    """Run ids, oldest first."""
+    if not Path(runs_dir).exists():
+        return []
+    return sorted(p.name for p in Path(runs_dir).iterdir() if (p / 'run.json').exists())
+
+
+def find_resumable_run(runs_dir: Path = RUNS_DIR, scope: Dict = None) -> Optional[str]:
+    """Latest unfinished run started today with the same scope, if any."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    for run_id in reversed(list_runs(runs_dir)):
+        if not run_id.startswith(today):
+            break
+        run = PipelineRun(run_id, runs_dir)
+        if not run.completed and run.scope == (scope or {}):
+            return run_id
+    return None
+
+
+def _zip_manifest(paths):
+    return [{'path': str(p), 'bytes': Path(p).stat().st_size} for p in paths]
+
+
+def _zips_present(manifest):
+    return all(Path(entry['path']).exists() for entry in manifest)
+
+
+def _edition_date(run: PipelineRun) -> Optional[str]:
+    """Date of the edition the run processed (it may have fallen back from today)."""
+    for name in ('download', 'match'):
+        date_str = run.manifest['stages'].get(name, {}).get('edition_date')
+        if date_str:
+            return date_str
+    return None
+
+
+def run_pipeline(search_terms: List[str] = None, run_id: Optional[str] = None, resume: bool = True,
+                 streaming: bool = PIPELINE_STREAMING, sections: str = None,
+                 target_date: str = None, force: bool = False,
+                 distributed: bool = PIPELINE_DISTRIBUTED) -> Optional[PipelineRun]:
+    """
+    Run (or resume) the daily pipeline, unless another runner has it.
+
+    Takes the run lease for the date and sections (runlock.RunLease) first.
+    If the lease is held elsewhere, or a run for them already completed,
+    logs who has it and returns that run if it is in the local runs/ (None
+    otherwise). The completion is recorded under the date of the edition
+    actually processed, so a run that fell back to yesterday doesn't stop
+    today's edition from being processed later.
+
+    Arguments are those of _run_pipeline; force runs again a date and
+    sections that already completed.
+    """
+    from runlock import RunLease, clear_completed, get_run_store, run_status
+
+    if run_id is not None:
+        scope = PipelineRun(run_id).scope
+        run_date, run_sections = scope.get('date') or run_id[:10], scope.get('sections')
+    else:
+        run_date, run_sections = target_date or datetime.now().strftime('%Y-%m-%d'), sections
+    name = f"{run_date}:{'-'.join((run_sections or 'all').split())}"
+
+    store = get_run_store()
+    status = run_status(store, name)
+    if status and status['state'] == 'completed' and force:
+        clear_completed(store, name)
+        status = None
+    if status:
+        logger.info(f"Run for {name} already {status['state']} (run {status.get('run_id')} on {status.get('host')}, "
+                    f"started {status.get('started_at')}); see python pipeline.py --stats {status.get('run_id')}")
+        local = status.get('run_id') in list_runs() if status.get('run_id') else False
+        return PipelineRun(status['run_id']) if local else None
+
+    lease = RunLease(store, name, run_id=run_id)
+    if not lease.acquire():
+        logger.info(f"Another runner just took the run for {name}; leaving it to them.")
+        return None
+    try:
+        run = _run_pipeline(search_terms, run_id, resume, streaming, sections, target_date, distributed)
+        if run is not None and run.completed and run.manifest.get('note') != 'no DOU files':
+            edition_name = f"{_edition_date(run) or run_date}:{name.split(':', 1)[1]}"
+            lease.info['run_id'] = run.run_id
+            lease.mark_completed({'status': run.manifest.get('note') or 'completed',
+                                  'total_seconds': run.stats()['total_seconds']}, name=edition_name)
+        return run
+    finally:
+        lease.release()
+
+
+def _run_pipeline(search_terms: List[str] = None, run_id: Optional[str] = None, resume: bool = True,
+                  streaming: bool = PIPELINE_STREAMING, sections: str = None,
+                  target_date: str = None, distributed: bool = PIPELINE_DISTRIBUTED) -> PipelineRun:
+    """
+    Run (or resume) the daily pipeline.
+
+    Args:
+        search_terms (list): Terms to search. Defaults to the terms in the DB
+            (a resumed run keeps the terms it started with).
+        run_id (str): Resume this run instead of looking for one.
+        resume (bool): Resume today's unfinished run if there is one.
+        streaming (bool): Overlap download, extraction and matching in one stage.
+        sections (str): Space-separated sections to process (default: all).
+        target_date (str): YYYY-MM-DD edition to process, without falling back
+            to previous days (default: today with fallback).
+        distributed (bool): Fan extraction, matching and notification out to
+            workers (fanout.py); takes precedence over streaming.
+
+    Returns:
+        PipelineRun: The run, with stats() for timings and sizes.
+    """
+    from download import DEFAULT_SECTIONS, download_dou_xml
+    from search import get_search_terms_from_db, match_articles
+    from scopes import load_term_scopes, plan_sections
+    from notify import filter_new_matches
+
+    scope = {}
+    if sections:
+        scope['sections'] = sections
+    if target_date:
+        scope['date'] = target_date
+
+    if run_id is None and resume:
+        run_id = find_resumable_run(scope=scope)
+        if run_id:
+            logger.info(f"Resuming unfinished run {run_id}.")
+
+    term_scopes = None
+    if run_id is None:
+        if search_terms is None:
+            search_terms = get_search_terms_from_db()
+            term_scopes = load_term_scopes()
+        if not search_terms:
+            logger.info("No search terms in database.")
+            return None
+
+    run = PipelineRun(run_id, search_terms=search_terms, scope=scope, term_scopes=term_scopes)
+    if run.completed:
+        logger.info(f"Run {run.run_id} already completed.")
+        return run
+    search_terms = run.search_terms
+    term_scopes = run.term_scopes
+    target_date = run.scope.get('date')
+    max_fallback_days = 0 if target_date else 2
+
+    # Only download the sections some term's scope covers
+    needed, skipped = plan_sections(search_terms, term_scopes, run.scope.get('sections') or DEFAULT_SECTIONS)
+    if not needed:
+        logger.info("No requested section is in the scope of any term.")
+        run.finish('no section needed')
+        return run
+    sections, skip_sections = ' '.join(needed), ' '.join(skipped)
+    download_stats, match_stats = {}, {}
+
+    if streaming and not distributed:
+        from streaming import stream_matches
+        stream_stats = {}
+        from download import iter_dou_xml
+        zip_source = iter_dou_xml(sections=sections, test_date=target_date, max_fallback_days=max_fallback_days,
+                                  skip_sections=skip_sections, stats=download_stats)
+        matches = run.stage('match', lambda: filter_new_matches(
+            stream_matches(search_terms, zip_source=zip_source, stats=stream_stats, term_scopes=term_scopes)))
+        if stream_stats:
+            run.annotate('match', streaming=stream_stats, articles_skipped=stream_stats['articles_skipped'],
+                         **download_stats)
+        return _summarize_and_notify(run, matches)
+
+    zip_manifest = run.stage('download', lambda: _zip_manifest(download_dou_xml(
+        sections=sections, test_date=target_date, max_fallback_days=max_fallback_days,
+        skip_sections=skip_sections, stats=download_stats)), is_valid=_zips_present)
+    if download_stats:
+        run.annotate('download', **download_stats)
+    if not zip_manifest:
+        logger.warning("No valid DOU files found after trying current and previous days.")
+        run.finish('no DOU files')
+        return run
+
+    if distributed:
+        from fanout import distributed_matches
+        matches = run.stage('match', lambda: filter_new_matches(distributed_matches(
+            run.run_id, [entry['path'] for entry in zip_manifest], search_terms, term_scopes, stats=match_stats)))
+        if match_stats:
+            run.annotate('match', articles_skipped=match_stats['articles_skipped'])
+        return _summarize_and_notify(run, matches, distributed=True)
+
+    articles = run.stage('extract', _extract_and_index, [entry['path'] for entry in zip_manifest])
+    if not articles:
+        logger.warning("No articles extracted.")
+        run.finish('no articles')
+        return run
+
+    matches = run.stage('match', lambda: filter_new_matches(
+        match_articles(articles, search_terms, term_scopes, stats=match_stats)))
+    if match_stats:
+        run.annotate('match', articles_skipped=match_stats['articles_skipped'])
+    return _summarize_and_notify(run, matches)
+
+
+def _extract_and_index(zip_paths):
+    """Extract articles and add them to the local index (see article_index)."""
+    from extract import extract_articles
+    from article_index import index_articles
+
+    articles = extract_articles(zip_paths)
+    if articles:
+        try:
+            index_articles(Path(zip_paths[0]).parent.name, articles)
+        except Exception as e:
+            logger.warning(f"Could not index articles: {e}")
+    return articles
+
+
+def _summarize_and_notify(run, matches, distributed=False):
+    from summarize import summarize_matches
+    from notify import send_notifications
+
+    if not matches:
+        logger.info("No new matches found.")
+        run.finish('no new matches')
+        return run
+
+    summarized = run.stage('summarize', summarize_matches, matches)
+    if distributed:
+        from fanout import distributed_notify
+        run.stage('notify', distributed_notify, run.run_id, summarized)
+    else:
+        run.stage('notify', send_notifications, summarized)
+    run.finish()
+    logger.info(f"Run {run.run_id} completed in {run.stats()['total_seconds']}s.")
+    return run
+
+
+def format_stats(stats: Dict) -> str:
+    lines = [f"Run {stats['run_id']} ({stats['status']}{', ' + stats['note'] if stats.get('note') else ''})"]
+    for name in STAGES:
+        info = stats['stages'].get(name)
+        if not info:
+            continue
+        lines.append(f"  {name:<10} {info['status']:<8} {info.get('seconds', 0) or 0:>8.2f}s "
+                     f"{info.get('items') if info.get('items') is not None else '-':>6} items "
+                     f"{(info.get('output_bytes') or 0) / 1024:>10.1f} KiB")
+        if info.get('sections_skipped'):
+            lines.append(f"{'':13}skipped {' '.join(info['sections_skipped'])} "
+                         f"({(info.get('bytes_avoided') or 0) / 1024:.1f} KiB not downloaded)")
+        if info.get('articles_skipped'):
+            lines.append(f"{'':13}{info['articles_skipped']} article(s) outside every term's scope not scanned")
+    lines.append(f"  total      {stats['total_seconds']:.2f}s")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    try:
+        if '--stats' in sys.argv:
+            args = sys.argv[sys.argv.index('--stats') + 1:]
+            runs = list_runs()
+            run_id = args[0] if args else (runs[-1] if runs else None)
+            if run_id not in runs:
+                print("No such run." if run_id else "No runs yet.")
+            else:
+                print(format_stats(PipelineRun(run_id).stats()))
+        elif '--resume' in sys.argv:
+            run = run_pipeline(run_id=sys.argv[sys.argv.index('--resume') + 1], force='--force' in sys.argv)
+            if run:
+                print(format_stats(run.stats()))
+        else:
+            run = run_pipeline(resume='--new' not in sys.argv,
+                               streaming=PIPELINE_STREAMING or '--stream' in sys.argv,
+                               force='--force' in sys.argv,
+                               distributed=PIPELINE_DISTRIBUTED or '--distributed' in sys.argv)
+            if run:
+                print(format_stats(run.stats()))
+    except Exception as e:
+        logger.error(f"Main execution error: {e}")
@@ -0,0 +1,176 @@
+"""
+Publication-aware trigger for the daily pipeline.
+
+Instead of running at a fixed time, poll INLABS from early morning with
+cheap availability probes (download.probe_section reads 4 bytes per
+section) and trigger the pipeline for each section as soon as it appears.
+Polling is adaptive: it tightens right after a section shows up (the
+others usually follow), backs off while nothing changes, and slows to
+POLL_MAX_INTERVAL once the main sections are in, checking only for extra
+editions (and for republished ZIPs that grew) until POLL_END_HOUR.
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from download import DEFAULT_SECTIONS, create_session, probe_section
+from logging_config import setup_logger
+
+logger = setup_logger('poller')
+
+POLL_START_HOUR = int(os.getenv('POLL_START_HOUR', 5))
+POLL_END_HOUR = int(os.getenv('POLL_END_HOUR', 23))
+POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', 60))  # seconds
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', 900))
+
+# Sections published every business day; the E sections are extra editions
+MAIN_SECTIONS = ('DO1', 'DO2', 'DO3')
+SESSION_MAX_AGE = 3600
+
+
+def invalidate_section(date_str, section, download_dir="downloads", extract_dir="extracted"):
+    """Drop the cached ZIP and extracted XML of a section so the next run fetches it again."""
+    zip_path = Path(download_dir) / date_str / f"{date_str}-{section}.zip"
+    if zip_path.exists():
+        zip_path.unlink()
+    for xml_path in (Path(extract_dir) / date_str).glob(f"{section}_*.xml"):
+        xml_path.unlink()
+
+
+class AvailabilityPoller:
+    """
+    Poll today's sections and call on_available(date_str, sections, republished)
+    for new ones. republished is True when any of them was published again
+    after being processed, so the callback must run them again even if a
+    run for them already completed.
+
+    If on_available raises, the sections are probed and triggered again on
+    the next poll.
+    """
+
+    def __init__(self, on_available: Callable[[str, List[str], bool], None], sections=DEFAULT_SECTIONS,
+                 start_hour=POLL_START_HOUR, end_hour=POLL_END_HOUR,
+                 min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+        self.on_available = on_available
+        self.sections = sections.split()
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._day = None
+        self._seen: Dict[str, int] = {}
+        self._session = None
+        self._session_created = 0
+        self._stop = threading.Event()
+        self.stats = {'probes': 0, 'triggers': 0}
+
+    def _get_session(self):
+        if self._session is None or time.time() - self._session_created > SESSION_MAX_AGE:
+            if self._session is not None:
+                self._session.close()
+            self._session = create_session()
+            self._session_created = time.time()
+        return self._session
+
+    def _drop_session(self):
+        if self._session is not None:
+            self._session.close()
+        self._session = None
+
+    def _main_sections_seen(self):
+        return all(s in self._seen for s in MAIN_SECTIONS if s in self.sections)
+
+    def poll_once(self, today: date = None) -> List[str]:
+        """
+        Probe sections once and trigger the pipeline for new or republished ones.
+
+        Returns:
+            list: Sections triggered by this poll.
+        """
+        today = today or date.today()
+        if today != self._day:
+            self._day = today
+            self._seen = {}
+            self.interval = self.min_interval
+        date_str = today.strftime('%Y-%m-%d')
+
+        try:
+            session = self._get_session()
+            cookie = session.cookies.get('inlabs_session_cookie')
+        except Exception as e:
+            logger.error(f"INLABS login failed, will retry: {e}")
+            self.interval = min(self.interval * 2, self.max_interval)
+            return []
+
+        ready = []
+        republished = False
+        for section in self.sections:
+            # Regular sections don't change once published; extras are rechecked for growth
+            if section in self._seen and section in MAIN_SECTIONS:
+                continue
+            try:
+                self.stats['probes'] += 1
+                probe = probe_section(session, cookie, date_str, section)
+            except Exception as e:
+                logger.warning(f"Probe failed for {section}: {e}")
+                self._drop_session()
+                continue
+            if not probe['available']:
+                continue
+            previous = self._seen.get(section)
+            if section not in self._seen:
+                logger.info(f"{section} published for {date_str}.")
+            elif probe['size'] and previous and probe['size'] != previous:
+                logger.info(f"{section} republished for {date_str} ({previous} -> {probe['size']} bytes).")
+                invalidate_section(date_str, section)
+                republished = True
+            else:
+                continue
+            self._seen[section] = probe['size']
+            ready.append(section)
+
+        if ready:
+            self.stats['triggers'] += 1
+            try:
+                self.on_available(date_str, ready, republished)
+            except Exception as e:
+                logger.error(f"Pipeline failed for {ready}, will retry on next poll: {e}")
+                for section in ready:
+                    self._seen.pop(section, None)
+            self.interval = self.min_interval
+        elif self._main_sections_seen():
+            self.interval = self.max_interval
+        else:
+            self.interval = min(self.interval * 1.5, self.max_interval)
+        return ready
+
+    def next_delay(self, now: datetime = None) -> float:
+        """Seconds until the next poll, sleeping through the night outside the window."""
+        now = now or datetime.now()
+        if now.hour < self.start_hour:
+            start = now.replace(hour=self.start_hour, minute=0, second=0, microsecond=0)
+            return (start - now).total_seconds()
+        if now.hour >= self.end_hour:
+            start = (now + timedelta(days=1)).replace(hour=self.start_hour, minute=0, second=0, microsecond=0)
+            return (start - now).total_seconds()
+        return self.interval
+
+    def run_forever(self):
+        logger.info(f"Polling INLABS for {', '.join(self.sections)} between "
+                    f"{self.start_hour}:00 and {self.end_hour}:00.")
+        while not self._stop.is_set():
+            now = datetime.now()
+            if self.start_hour <= now.hour < self.end_hour:
+                self.poll_once(now.date())
+            delay = self.next_delay()
+            logger.debug(f"Next poll in {delay:.0f}s.")
+            self._stop.wait(delay)
+        self._drop_session()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,431 @@
+"""
+Rate limiting primitives shared by the notification and download paths,
+and the polite-client policy every INLABS request goes through
+(get_inlabs_policy: rate limit, bounded jittered retries, circuit breaker).
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+from http_engine import DeadlineExceeded
+
+# Plain logging: also used by the serverless api/ handlers
+logger = logging.getLogger('ratelimit')
+
+# INLABS request policy (get_inlabs_policy)
+INLABS_MAX_PER_SECOND = float(os.getenv('INLABS_MAX_PER_SECOND', 3))
+INLABS_BURST = int(os.getenv('INLABS_BURST', 6))
+INLABS_MAX_ATTEMPTS = int(os.getenv('INLABS_MAX_ATTEMPTS', 4))
+INLABS_RETRY_BUDGET_PER_MINUTE = int(os.getenv('INLABS_RETRY_BUDGET_PER_MINUTE', 20))
+INLABS_BACKOFF_BASE = float(os.getenv('INLABS_BACKOFF_BASE', 1.0))
+INLABS_BACKOFF_MAX = float(os.getenv('INLABS_BACKOFF_MAX', 30.0))
+INLABS_BREAKER_THRESHOLD = int(os.getenv('INLABS_BREAKER_THRESHOLD', 5))
+INLABS_BREAKER_RESET_SECONDS = float(os.getenv('INLABS_BREAKER_RESET_SECONDS', 60))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Allows `rate` acquisitions per second on average, with bursts of up to
+    `burst` tokens. A rate of 0/None disables the limit.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate or 0)
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now; return False otherwise."""
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Block until tokens are available.
+
+        Returns:
+            bool: False if timeout (seconds) expired first.
+        """
+        if not self.rate:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class RedisTokenBucket:
+    """
+    Token bucket shared through Redis, so several nodes (cron invocations,
+    backfill workers) stay under one rate together.
+
+    Same interface as TokenBucket. The bucket is a hash (tokens, updated)
+    updated in a WATCH/MULTI transaction. If Redis fails, the node falls back
+    to a local TokenBucket with the same rate.
+    """
+
+    def __init__(self, client, key, rate, burst=None):
+        self.client = client
+        self.key = key
+        self.rate = float(rate or 0)
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate))
+        self._fallback = TokenBucket(rate, burst)
+        self._ttl = int(self.capacity / self.rate) + 60 if self.rate else 60
+
+    def _take(self, tokens):
+        """Take tokens if available; return 0, or the seconds until they will be."""
+        import redis
+
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key)
+                    level, updated = pipe.hmget(self.key, 'tokens', 'updated')
+                    now = time.time()
+                    level = float(level) if level is not None else self.capacity
+                    updated = float(updated) if updated is not None else now
+                    level = min(self.capacity, level + max(0.0, now - updated) * self.rate)
+                    wait = 0.0 if level >= tokens else (tokens - level) / self.rate
+                    if not wait:
+                        level -= tokens
+                    pipe.multi()
+                    pipe.hset(self.key, mapping={'tokens': level, 'updated': now})
+                    pipe.expire(self.key, self._ttl)
+                    pipe.execute()
+                    return wait
+                except redis.WatchError:
+                    continue
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now; return False otherwise."""
+        if not self.rate:
+            return True
+        try:
+            return self._take(tokens) == 0
+        except Exception as e:
+            logger.warning(f"Redis rate limiter unavailable, limiting locally: {e}")
+            return self._fallback.try_acquire(tokens)
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Block until tokens are available.
+
+        Returns:
+            bool: False if timeout (seconds) expired first.
+        """
+        if not self.rate:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                wait = self._take(tokens)
+            except Exception as e:
+                logger.warning(f"Redis rate limiter unavailable, limiting locally: {e}")
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                return self._fallback.acquire(tokens, timeout=remaining)
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is open: the service failed repeatedly and is left alone for a while."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service.
+
+    After `threshold` consecutive failures the circuit opens and calls fail
+    fast with CircuitOpenError for `reset_timeout` seconds. Then one trial
+    call is let through (half-open): success closes the circuit, failure
+    opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=60.0, name='service'):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: The circuit is open, or half-open with its trial call running.
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(f"{self.name} circuit open after {self.failures} failures; "
+                                   f"retrying in {retry_in:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """Let another trial through after one ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(f"{self.name} failed {self.failures} times in a row; opening circuit "
+                                   f"for {self.reset_timeout:.0f}s.")
+                self.opened_at = time.monotonic()
+
+
+class RequestPolicy:
+    """
+    Polite-client policy around calls to one service: every attempt waits
+    for the rate limiter and passes the circuit breaker. Failed attempts
+    (exceptions in retry_on, or a response status in RETRY_STATUSES) are
+    retried with full-jitter exponential backoff, honouring Retry-After.
+    Retries are bounded twice: max_attempts per call, and a retry budget
+    (a token bucket) shared by all calls, so a struggling service doesn't
+    get a retry storm.
+
+    stats counts 'calls', 'attempts', 'retries', 'budget_exhausted',
+    'circuit_rejections' and 'failures'.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, limiter, breaker, retry_on=(ConnectionError, TimeoutError), max_attempts=4,
+                 retry_budget=None, backoff_base=1.0, backoff_max=30.0):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.retry_on = retry_on
+        self.max_attempts = max(1, max_attempts)
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'budget_exhausted': 0,
+                      'circuit_rejections': 0, 'failures': 0}
+
+    def _before_attempt(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats['circuit_rejections'] += 1
+            raise
+        self.stats['attempts'] += 1
+
+    def _outcome(self, result=None, error=None):
+        """Record an attempt; return True if it failed in a retryable way."""
+        failed = error is not None or getattr(result, 'status_code', None) in self.RETRY_STATUSES
+        if failed:
+            self.stats['failures'] += 1
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return failed
+
+    def _abort(self, error):
+        """
+        Record an attempt that raised outside retry_on, so a half-open trial
+        never stays marked as running. Cancellation (asyncio.CancelledError,
+        KeyboardInterrupt) and DeadlineExceeded (the caller's own time budget
+        ran out) say nothing about the service and only free the trial.
+        """
+        if isinstance(error, Exception) and not isinstance(error, DeadlineExceeded):
+            self.stats['failures'] += 1
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_trial()
+
+    def _backoff(self, attempt, result=None):
+        """Seconds to wait before the next attempt, or None if no retry is allowed."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if self.retry_budget is not None and not self.retry_budget.try_acquire():
+            self.stats['budget_exhausted'] += 1
+            logger.warning("Retry budget exhausted; not retrying.")
+            return None
+        self.stats['retries'] += 1
+        retry_after = getattr(result, 'headers', {}).get('Retry-After', '') if result is not None else ''
+        if str(retry_after).isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call fn(*args, **kwargs) under the policy.
+
+        Returns:
+            The last result; a retryable status is returned as-is once retries run out.
+
+        Raises:
+            CircuitOpenError: The service is being left alone.
+            Exception: The last error in retry_on once retries run out, or
+                any other error right away (counted as a failed attempt,
+                except DeadlineExceeded).
+        """
+        self.stats['calls'] += 1
+        attempt = 0
+        while True:
+            self._before_attempt()
+            result = error = None
+            try:
+                self.limiter.acquire()
+                result = fn(*args, **kwargs)
+            except self.retry_on as e:
+                error = e
+            except BaseException as e:
+                self._abort(e)
+                raise
+            if not self._outcome(result, error):
+                return result
+            wait = self._backoff(attempt, result)
+            if wait is None:
+                if error is not None:
+                    raise error
+                return result
+            logger.debug(f"Attempt {attempt + 1} failed ({error or result.status_code}); retrying in {wait:.1f}s")
+            if result is not None and hasattr(result, 'close'):
+                result.close()
+            time.sleep(wait)
+            attempt += 1
+
+    async def call_async(self, fn, *args, **kwargs):
+        """
+        Like call(), for a coroutine function; waits with asyncio.sleep.
+
+        The limiter is polled on a worker thread: RedisTokenBucket.try_acquire
+        is a blocking Redis transaction that would stall the event loop.
+        """
+        import asyncio
+
+        self.stats['calls'] += 1
+        attempt = 0
+        while True:
+            self._before_attempt()
+            result = error = None
+            try:
+                while not await asyncio.to_thread(self.limiter.try_acquire):
+                    await asyncio.sleep(min(0.05, 1.0 / self.limiter.rate))
+                result = await fn(*args, **kwargs)
+            except self.retry_on as e:
+                error = e
+            except BaseException as e:
+                self._abort(e)
+                raise
+            if not self._outcome(result, error):
+                return result
+            wait = self._backoff(attempt, result)
+            if wait is None:
+                if error is not None:
+                    raise error
+                return result
+            logger.debug(f"Attempt {attempt + 1} failed ({error or result.status_code}); retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            attempt += 1
+
+
+_inlabs_policy = None
+_inlabs_policy_lock = threading.Lock()
+
+
+def get_inlabs_policy():
+    """
+    The process-wide RequestPolicy for INLABS.
+
+    The rate limit is shared through Redis when REDIS_URL is set, so every
+    node together stays under INLABS_MAX_PER_SECOND; otherwise it is per
+    process. The circuit breaker and retry budget are per process.
+    """
+    global _inlabs_policy
+    with _inlabs_policy_lock:
+        if _inlabs_policy is not None:
+            return _inlabs_policy
+
+        limiter = None
+        if os.getenv('REDIS_URL'):
+            try:
+                from redis_client import redis_client
+                limiter = RedisTokenBucket(redis_client.client, 'ratelimit:inlabs',
+                                           INLABS_MAX_PER_SECOND, INLABS_BURST)
+            except Exception as e:
+                logger.warning(f"Redis unavailable for the INLABS rate limit, limiting per process: {e}")
+        if limiter is None:
+            limiter = TokenBucket(INLABS_MAX_PER_SECOND, INLABS_BURST)
+
+        retry_on = [ConnectionError, TimeoutError]
+        try:
+            import requests
+            retry_on += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+        except ImportError:
+            pass
+        try:
+            import httpx
+            retry_on.append(httpx.TransportError)
+        except ImportError:
+            pass
+
+        _inlabs_policy = RequestPolicy(
+            limiter,
+            CircuitBreaker(INLABS_BREAKER_THRESHOLD, INLABS_BREAKER_RESET_SECONDS, name='INLABS'),
+            retry_on=tuple(retry_on),
+            max_attempts=INLABS_MAX_ATTEMPTS,
+            retry_budget=TokenBucket(INLABS_RETRY_BUDGET_PER_MINUTE / 60.0, burst=INLABS_RETRY_BUDGET_PER_MINUTE)
+            if INLABS_RETRY_BUDGET_PER_MINUTE else None,
+            backoff_base=INLABS_BACKOFF_BASE,
+            backoff_max=INLABS_BACKOFF_MAX,
+        )
+        return _inlabs_policy
@@ -0,0 +1,190 @@
+"""
+Retroactive search for newly registered terms.
+
+When a subscriber adds a term, search the local article index
+(article_index.py, filled by the daily pipeline and backfill.py) over the
+last RETRO_SEARCH_DAYS days and send them one digest with what was found.
+Only the pre-built index is searched; nothing is downloaded from INLABS.
+
+Searches run on a background thread. Terms a subscriber adds within
+RETRO_SEARCH_DELAY seconds of each other are searched together, so adding
+several terms in a row still produces a single email.
+
+Usage:
+    python retrosearch.py EMAIL TERM [TERM ...]
+"""
+
+import os
+import smtplib
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+from logging_config import setup_logger
+
+logger = setup_logger('retrosearch')
+
+RETRO_SEARCH_DAYS = int(os.getenv('RETRO_SEARCH_DAYS', 30))
+RETRO_SEARCH_DELAY = float(os.getenv('RETRO_SEARCH_DELAY', 30))  # seconds
+
+
+def run_retro_search(email: str, terms: List[str], days: int = RETRO_SEARCH_DAYS,
+                     index_db=None, ledger=None, send: bool = True) -> Dict:
+    """
+    Search the local index for a subscriber's new terms and send one digest.
+
+    Args:
+        email (str): Subscriber.
+        terms (list): Terms just registered.
+        days (int): How many past days to search.
+        index_db: Index database path (default article_index.INDEX_DB_PATH).
+        ledger: Sent ledger (default ledger.get_sent_ledger); articles already
+            sent to the subscriber are left out. New ones are recorded when
+            the outbox delivers the digest.
+        send (bool): Drain the outbox right away (otherwise the message
+            stays queued for the outbox worker).
+
+    Returns:
+        dict: {'matches': int, 'new': int, 'queued': bool, 'status': str}
+    """
+    from article_index import INDEX_DB_PATH, search_index
+    from dedup import group_near_duplicates
+
+    stats = {'matches': 0, 'new': 0, 'queued': False, 'status': 'ok'}
+    if not Path(index_db or INDEX_DB_PATH).exists():
+        logger.info(f"No local index, skipping retro-search for {email}.")
+        stats['status'] = 'no index'
+        return stats
+
+    import notify
+    import outbox
+    from scopes import applicable_terms, load_term_scopes
+    from summarize import summarize_matches
+
+    since = (date.today() - timedelta(days=days)).strftime('%Y-%m-%d')
+    term_scopes = load_term_scopes(notify.DB_PATH)
+    matches = [m for m in search_index(terms, since=since, db_path=index_db)
+               if applicable_terms(m['article'], m['terms_matched'], term_scopes)]
+    matches = group_near_duplicates(matches)
+    stats['matches'] = len(matches)
+
+    ledger = ledger or notify.get_sent_ledger(notify.DB_PATH)
+    new_matches = ledger.filter_unsent(email, matches)
+    stats['new'] = len(new_matches)
+    if not new_matches:
+        logger.info(f"Retro-search for {email} {terms}: nothing new in the last {days} days.")
+        stats['status'] = 'nothing new'
+        return stats
+
+    summarized = summarize_matches(new_matches)
+    subject = (f"DOU Notificações - {len(summarized)} ocorrência(s) nos últimos {days} dias "
+               f"para {', '.join(terms)}")
+    intro = (f"Você cadastrou novos termos ({', '.join(terms)}). "
+             f"Estas são as ocorrências dos últimos {days} dias:")
+    body = notify.format_email_body(summarized, intro=intro)
+    # Recorded in the sent ledger by outbox.drain once delivered
+    stats['queued'] = outbox.enqueue(email, subject, body, matches=summarized)
+    logger.info(f"Retro-search for {email}: {len(summarized)} match(es) queued.")
+
+    if send:
+        try:
+            with notify.SMTPPool(notify.SMTP_SERVER, notify.SMTP_PORT, notify.SMTP_USER, notify.SMTP_PASS) as pool:
+                outbox.drain(pool, notify.SMTP_USER)
+        except smtplib.SMTPAuthenticationError as e:
+            logger.error(f"SMTP authentication error: {e}. Check SMTP_USER and SMTP_PASS.")
+        except Exception as e:
+            logger.error(f"Email sending error: {e}. The digest stays in the outbox (python outbox.py).")
+    return stats
+
+
+class RetroSearchQueue:
+    """
+    Background worker for retro-searches.
+
+    submit() returns immediately; each subscriber's terms are collected for
+    `delay` seconds after the first one and then searched in one go.
+    """
+
+    def __init__(self, run_search=run_retro_search, delay: float = RETRO_SEARCH_DELAY):
+        self.run_search = run_search
+        self.delay = delay
+        self._pending: Dict[str, Dict] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'submitted': 0, 'searches': 0, 'errors': 0}
+
+    def submit(self, email: str, term: str):
+        email = email.strip().lower()
+        with self._cond:
+            batch = self._pending.setdefault(email, {'terms': [], 'due': time.monotonic() + self.delay})
+            if term not in batch['terms']:
+                batch['terms'].append(term)
+            self.stats['submitted'] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name='retro-search', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _take_due(self, force=False):
+        now = time.monotonic()
+        due = [email for email, batch in self._pending.items() if force or batch['due'] <= now]
+        return [(email, self._pending.pop(email)['terms']) for email in due]
+
+    def _run(self, batches):
+        for email, terms in batches:
+            try:
+                self.run_search(email, terms)
+                self.stats['searches'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Retro-search failed for {email} {terms}: {e}")
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                batches = self._take_due()
+                if not batches:
+                    if not self._pending:
+                        self._thread = None
+                        return
+                    wait = min(batch['due'] for batch in self._pending.values()) - time.monotonic()
+                    self._cond.wait(max(wait, 0.01))
+                    continue
+            self._run(batches)
+
+    def flush(self):
+        """Run every pending search now, on the calling thread."""
+        with self._cond:
+            batches = self._take_due(force=True)
+        self._run(batches)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def submit_retro_search(email: str, term: str):
+    """Queue a retro-search for a term the subscriber just added (skipped without a local index)."""
+    from article_index import INDEX_DB_PATH
+
+    global _queue
+    if not Path(INDEX_DB_PATH).exists():
+        logger.info(f"No local index, skipping retro-search for {email}.")
+        return
+    with _queue_lock:
+        if _queue is None:
+            _queue = RetroSearchQueue()
+    _queue.submit(email, term)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    try:
+        print(run_retro_search(sys.argv[1], sys.argv[2:]))
+    except Exception as e:
+        logger.error(f"Main execution error: {e}")
@@ -1,6 +1,4 @@
-from search import find_matches
-from summarize import summarize_matches
-from notify import send_notifications
+from pipeline import run_pipeline, format_stats
 from datetime import datetime
 import os
 from logging_config import setup_logger
@@ -12,13 +10,10 @@ def main():
     """Run the daily DOU check once and exit."""
     try:
         logger.info(f"Starting one-time DOU check at {datetime.now()}")
-        matches = find_matches()
-        if matches:
-            summarized = summarize_matches(matches)
-            send_notifications(summarized)
-            logger.info(f"Processed {len(matches)} matches.")
-        else:
-            logger.info("No matches found.")
+        # Stages are checkpointed under runs/; an unfinished run from today is resumed
+        run = run_pipeline()
+        if run:
+            logger.info(format_stats(run.stats()))
     except Exception as e:
         logger.error(f"Error in one-time check: {e}")
 
@@ -0,0 +1,173 @@
+"""
+Distributed run lease: one runner per edition date does the work.
+
+Vercel cron can fire twice or be retried, and main.py, run_once.py or
+pipeline.py may be started for the same day by hand. Each runner takes a
+lease on the run's name (date and scope) before doing anything:
+
+    dou:run:<name>             lease: JSON with the holder's token, run id, host, start time
+    dou:run:<name>:done        record of the completed run (stats, or where to find them)
+    dou:run:<name>:progress    what the earlier steps of a run split across invocations did
+
+The lease expires after RUN_LEASE_TTL seconds unless its holder renews it;
+a heartbeat thread renews it every third of that while the run is alive,
+so a crashed runner frees the date quickly while a slow one keeps it.
+Runners that arrive while the lease is held, or after the run completed,
+get its status back right away instead of repeating downloads and emails.
+
+The lease lives in Redis when REDIS_URL is set, otherwise in a local
+directory stand-in (see objectstore).
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+
+from objectstore import open_store
+
+# Plain logging: used by the serverless api/ handlers
+logger = logging.getLogger('runlock')
+
+RUN_LEASE_TTL = int(os.getenv('RUN_LEASE_TTL', 120))
+# How long a completed run keeps later runners for the same name away
+RUN_DONE_TTL = int(os.getenv('RUN_DONE_TTL', 2 * 86400))
+RUN_LOCK_DIR = os.getenv('RUN_LOCK_DIR', os.path.join('runs', 'locks'))
+
+
+class RunLease:
+    """
+    Lease on one run name, renewed by a heartbeat thread while held.
+
+    Usage:
+        lease = RunLease(store, '2025-01-02:all', run_id='...')
+        if lease.acquire():
+            try:
+                ...
+            finally:
+                lease.release()
+
+    lost is set if a renewal finds the lease taken over (it expired, e.g.
+    after a long pause); the holder should stop before side effects.
+    """
+
+    def __init__(self, store, name, ttl: int = RUN_LEASE_TTL, **info):
+        self.store = store
+        self.name = name
+        self.key = f"dou:run:{name}"
+        self.ttl = ttl
+        self.info = dict(info, token=uuid.uuid4().hex, host=socket.gethostname(), pid=os.getpid(),
+                         started_at=datetime.now().isoformat(timespec='seconds'))
+        self._value = json.dumps(self.info, sort_keys=True).encode('utf-8')
+        self._stop = threading.Event()
+        self._thread = None
+        self.held = False
+        self.lost = False
+
+    def acquire(self) -> bool:
+        """Take the lease if nobody holds it; start the heartbeat."""
+        if not self.store.put_if_absent(self.key, self._value, self.ttl):
+            return False
+        self.held = True
+        self._thread = threading.Thread(target=self._heartbeat, name=f'lease-{self.name}', daemon=True)
+        self._thread.start()
+        return True
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.store.renew_if(self.key, self._value, self.ttl):
+                    self.lost = True
+                    logger.error(f"Lost the run lease for {self.name}; another runner may take over.")
+                    return
+            except Exception as e:
+                # Keep trying: the lease only lapses after a full TTL without renewal
+                logger.warning(f"Could not renew run lease for {self.name}: {e}")
+
+    def release(self):
+        """Stop the heartbeat and give the lease back (if still ours)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self.held:
+            try:
+                self.store.delete_if(self.key, self._value)
+            except Exception as e:
+                logger.warning(f"Could not release run lease for {self.name} (it expires on its own): {e}")
+            self.held = False
+
+    def mark_completed(self, record: Dict, ttl: int = RUN_DONE_TTL, name: str = None):
+        """
+        Record that the run finished, so later runners for this name stop early.
+
+        Args:
+            record (dict): Stats or pointers to them, returned by run_status().
+            ttl (int): Seconds the record is kept.
+            name (str): Record it under another run name (e.g. the date of the
+                edition actually processed); defaults to the lease's.
+        """
+        record = dict(record, run_id=self.info.get('run_id'), host=self.info['host'],
+                      started_at=self.info['started_at'], finished_at=datetime.now().isoformat(timespec='seconds'))
+        key = f"dou:run:{name}" if name else self.key
+        self.store.put(f"{key}:done", json.dumps(record).encode('utf-8'), ttl)
+
+
+def run_status(store, name) -> Optional[Dict]:
+    """
+    State of a run name.
+
+    Returns:
+        dict: {'state': 'completed', ...completion record},
+            {'state': 'running', ...lease holder info}, {'state': 'paused',
+            ...progress} between the steps of a run split across invocations,
+            or None if nobody ran it.
+    """
+    done = store.get(f"dou:run:{name}:done")
+    if done:
+        return dict(json.loads(done), state='completed')
+    lease = store.get(f"dou:run:{name}")
+    if lease:
+        info = json.loads(lease)
+        info.pop('token', None)
+        return dict(info, state='running')
+    progress = load_progress(store, name)
+    if progress:
+        return dict(progress, done=len(progress.get('done', [])),
+                    summaries=len(progress.get('summaries', {})), state='paused')
+    return None
+
+
+def load_progress(store, name) -> Optional[Dict]:
+    """Progress saved by earlier steps of the run ('done' lists what they finished), or None."""
+    value = store.get(f"dou:run:{name}:progress")
+    return json.loads(value) if value else None
+
+
+def save_progress(store, name, progress: Dict, ttl: int = RUN_DONE_TTL):
+    """Save a run's progress, for the invocation that continues it."""
+    store.put(f"dou:run:{name}:progress", json.dumps(progress).encode('utf-8'), ttl)
+
+
+def clear_completed(store, name):
+    """Forget a completed run and its progress, so the name can run again (e.g. a forced rerun)."""
+    for key in (f"dou:run:{name}:done", f"dou:run:{name}:progress"):
+        value = store.get(key)
+        if value:
+            store.delete_if(key, value)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_run_store(local_dir=RUN_LOCK_DIR):
+    """Process-wide store for run leases: Redis (REDIS_URL) or the local directory."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = open_store(local_dir)
+        return _store
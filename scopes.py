@@ -0,0 +1,95 @@
+"""
+Optional per-term scope: DOU sections and/or organ (artCategory).
+
+A term registered with sections "DO1" only matches DO1 articles, including
+the DO1 extra editions (DO1E). With a category it only matches articles
+whose artCategory contains it, so "Ministério da Educação" also covers
+"Ministério da Educação/Gabinete do Ministro". When several subscribers
+register the same term with different scopes, the term matches wherever
+any of them applies; an unscoped registration makes it match everywhere.
+
+Scopes are plain JSON-serializable dicts so pipeline runs can checkpoint
+them: {term: [{'sections': ['DO1'] or None, 'category': str or None}, ...]}.
+Terms missing from the mapping are unscoped.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from download import DEFAULT_SECTIONS
+
+TermScopes = Dict[str, List[Dict]]
+
+
+def parse_sections(value) -> Optional[List[str]]:
+    """'do1, DO2' -> ['DO1', 'DO2']; empty -> None (all sections)."""
+    if not value:
+        return None
+    sections = [s.strip().upper() for s in value.replace(',', ' ').split() if s.strip()]
+    return sections or None
+
+
+def load_term_scopes(db_path=Path('emails.db')) -> TermScopes:
+    """Scopes of every registered term, from the search_terms table."""
+    conn = sqlite3.connect(db_path)
+    try:
+        cols = {row[1] for row in conn.execute("PRAGMA table_info('search_terms')")}
+        if not {'sections', 'category'} <= cols:
+            return {}
+        rows = conn.execute('SELECT term, sections, category FROM search_terms').fetchall()
+    finally:
+        conn.close()
+
+    term_scopes: TermScopes = {}
+    for term, sections, category in rows:
+        term_scopes.setdefault(term, []).append({
+            'sections': parse_sections(sections),
+            'category': (category or '').strip() or None,
+        })
+    # Drop terms with an unscoped registration: they apply everywhere anyway
+    return {term: scopes for term, scopes in term_scopes.items()
+            if not any(s['sections'] is None and s['category'] is None for s in scopes)}
+
+
+def section_in(section: str, sections: Optional[List[str]]) -> bool:
+    """Whether a section (e.g. DO1E) is covered by a scope's sections (e.g. ['DO1'])."""
+    if sections is None:
+        return True
+    section = section.upper()
+    return section in sections or (section.endswith('E') and section[:-1] in sections)
+
+
+def scope_applies(article: Dict, scope: Dict) -> bool:
+    if not section_in(article['section'], scope['sections']):
+        return False
+    if scope['category']:
+        return scope['category'].lower() in (article.get('artCategory') or '').lower()
+    return True
+
+
+def applicable_terms(article: Dict, search_terms: List[str], term_scopes: TermScopes = None) -> List[str]:
+    """The terms whose scope covers this article."""
+    if not term_scopes:
+        return search_terms
+    return [term for term in search_terms
+            if term not in term_scopes or any(scope_applies(article, s) for s in term_scopes[term])]
+
+
+def plan_sections(search_terms: List[str], term_scopes: TermScopes = None,
+                  sections: str = DEFAULT_SECTIONS) -> Tuple[List[str], List[str]]:
+    """
+    Split sections into those some term needs and those nobody does.
+
+    Returns:
+        tuple: (needed sections, skipped sections), in the given order.
+    """
+    needed, skipped = [], []
+    for section in sections.split():
+        if any(term not in (term_scopes or {})
+               or any(section_in(section, s['sections']) for s in term_scopes[term])
+               for term in search_terms):
+            needed.append(section)
+        else:
+            skipped.append(section)
+    return needed, skipped
@@ -1,5 +1,8 @@
 from download import download_dou_xml
 from extract import extract_articles
+from dedup import group_near_duplicates
+from scopes import applicable_terms, load_term_scopes, plan_sections
+from prefilter import TermPrefilter
 from pathlib import Path
 import re
 from logging_config import setup_logger
@@ -7,34 +10,139 @@ from logging_config import setup_logger
 logger = setup_logger('search')
 
 
-def find_matches(search_terms=None):
+def get_search_terms_from_db():
+    """Return all unique terms registered in the database."""
+    import sqlite3
+    DB_PATH = Path('emails.db')
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT term FROM search_terms ORDER BY term')
+    search_terms = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return search_terms
+
+
+def match_article(article, search_terms):
+    """
+    Search one article for terms.
+
+    Returns:
+        dict: {'article': dict, 'terms_matched': list[str], 'snippets': list[str]},
+            or None if no term matched.
+    """
+    text_lower = article['text'].lower()
+    matched_terms = []
+    snippets = []
+
+    for term in search_terms:
+        if term.lower() in text_lower:
+            matched_terms.append(term)
+
+            # Find match positions and extract snippets (100 chars context)
+            positions = [m.start() for m in re.finditer(
+                re.escape(term.lower()), text_lower)]
+            for pos in positions:
+                start = max(0, pos - 100)
+                end = min(len(article['text']), pos + len(term) + 100)
+                snippet = article['text'][start:end].strip()
+                snippets.append(snippet)
+
+    if not matched_terms:
+        return None
+    logger.info(
+        f"Match found in {article['filename']} ({article['section']}): {matched_terms}")
+    return {
+        'article': article,
+        'terms_matched': matched_terms,
+        'snippets': snippets
+    }
+
+
+def match_articles(articles, search_terms, term_scopes=None, stats=None):
+    """
+    Search extracted articles for terms.
+
+    Near-duplicate articles (retificações, republications in extra editions)
+    are collapsed into one representative match per cluster.
+
+    Args:
+        term_scopes (dict): Per-term sections/category (see scopes.py); an
+            article is only searched for the terms whose scope covers it.
+        stats (dict): If given, 'articles' and 'articles_skipped' (outside
+            every term's scope, not scanned) are added to it.
+
+    Returns:
+        list: [{'article': dict, 'terms_matched': list[str], 'snippets': list[str],
+                'duplicate_count': int, 'duplicates': list[dict]}, ...]
+    """
+    print(f"Pesquisando termos em {len(articles)} artigos...")
+    logger.info(f"Searching {len(articles)} articles for terms.")
+    matches = []
+    skipped = 0
+    for article in articles:
+        terms = applicable_terms(article, search_terms, term_scopes)
+        if not terms:
+            skipped += 1
+            continue
+        match = match_article(article, terms)
+        if match:
+            matches.append(match)
+    if skipped:
+        logger.info(f"Skipped {skipped} article(s) outside the scope of every term.")
+    if stats is not None:
+        stats.update({'articles': len(articles), 'articles_skipped': skipped})
+    return finalize_matches(matches)
+
+
+def finalize_matches(matches):
+    """Group near-duplicate matches and report the result."""
+    total_matches = len(matches)
+    matches = group_near_duplicates(matches)
+    if len(matches) < total_matches:
+        logger.info(
+            f"Grouped {total_matches} matches into {len(matches)} near-duplicate clusters.")
+
+    if matches:
+        print(f"SUCCESS: Busca concluída! Encontradas {len(matches)} correspondências.")
+    else:
+        print("INFO: Busca concluída. Nenhuma correspondência encontrada.")
+    logger.info(f"Search completed. Found {len(matches)} matching articles.")
+    return matches
+
+
+def find_matches(search_terms=None, streaming=False):
     """
     Orchestrate download, extraction, and search for terms.
 
     Args:
         search_terms (list): List of terms to search for. If None, uses terms from DB.
+        streaming (bool): Overlap download, extraction and matching (see streaming.py).
 
     Returns:
-        list: [{'article': dict, 'terms_matched': list[str], 'snippets': list[str]}, ...]
+        list: Matches as returned by match_articles.
     """
+    term_scopes = None
     if search_terms is None:
         # Get all unique terms from database
-        import sqlite3
-        from pathlib import Path
-        DB_PATH = Path('emails.db')
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT term FROM search_terms ORDER BY term')
-        search_terms = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        search_terms = get_search_terms_from_db()
         if not search_terms:
             logger.info("No search terms in database.")
             return []
+        term_scopes = load_term_scopes()
+    sections, _ = plan_sections(search_terms, term_scopes)
+    if not sections:
+        logger.info("No section is in the scope of any term.")
+        return []
+    if streaming:
+        from streaming import stream_matches
+        from download import iter_dou_xml
+        return stream_matches(search_terms, zip_source=iter_dou_xml(sections=' '.join(sections), max_fallback_days=2),
+                              term_scopes=term_scopes)
     try:
         # Download today's XML ZIPs with fallback to previous days
         print("Iniciando busca por DOU (com fallback automático se necessário)...")
         logger.info("Starting download for DOU XMLs with fallback to previous days if needed.")
-        zip_files = download_dou_xml(max_fallback_days=2)
+        zip_files = download_dou_xml(sections=' '.join(sections), max_fallback_days=2)
         if not zip_files:
             print("ERRO: Nenhum DOU encontrado nos últimos dias.")
             logger.warning("No valid DOU files found after trying current and previous days.")
@@ -43,48 +151,14 @@ def find_matches(search_terms=None):
         # Extract articles
         print("Extraindo artigos dos arquivos DOU...")
         logger.info("Starting extraction of articles.")
-        articles = extract_articles(zip_files)
+        # Only parse XML files that might contain a term
+        articles = extract_articles(zip_files, prefilter=TermPrefilter(search_terms))
         if not articles:
             print("ERRO: Nenhum artigo extraído dos arquivos.")
             logger.warning("No articles extracted.")
             return []
 
-        print(f"Pesquisando termos em {len(articles)} artigos...")
-        logger.info(f"Searching {len(articles)} articles for terms.")
-        matches = []
-        for article in articles:
-            text_lower = article['text'].lower()
-            matched_terms = []
-            snippets = []
-
-            for term in search_terms:
-                if term.lower() in text_lower:
-                    matched_terms.append(term)
-
-                    # Find match positions and extract snippets (100 chars context)
-                    positions = [m.start() for m in re.finditer(
-                        re.escape(term.lower()), text_lower)]
-                    for pos in positions:
-                        start = max(0, pos - 100)
-                        end = min(len(article['text']), pos + len(term) + 100)
-                        snippet = article['text'][start:end].strip()
-                        snippets.append(snippet)
-
-            if matched_terms:
-                matches.append({
-                    'article': article,
-                    'terms_matched': matched_terms,
-                    'snippets': snippets
-                })
-                logger.info(
-                    f"Match found in {article['filename']} ({article['section']}): {matched_terms}")
-
-        if matches:
-            print(f"SUCCESS: Busca concluída! Encontradas {len(matches)} correspondências.")
-        else:
-            print("INFO: Busca concluída. Nenhuma correspondência encontrada.")
-        logger.info(f"Search completed. Found {len(matches)} matching articles.")
-        return matches
+        return match_articles(articles, search_terms, term_scopes)
     except Exception as e:
         logger.error(f"Error in find_matches: {e}")
         raise
@@ -0,0 +1,159 @@
+"""
+Streaming mode for the search pipeline.
+
+Download, extraction and matching run concurrently, connected by bounded
+queues: matching starts on DO1 articles while later sections are still
+downloading, and a full queue blocks the stage feeding it (backpressure)
+so memory stays bounded. Total time approaches the slowest stage instead
+of the sum of all stages.
+
+    downloader --zip_queue--> extract workers --article_queue--> match workers
+"""
+
+import itertools
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from logging_config import setup_logger
+
+logger = setup_logger('streaming')
+
+STREAM_EXTRACT_WORKERS = int(os.getenv('STREAM_EXTRACT_WORKERS', 2))
+STREAM_MATCH_WORKERS = int(os.getenv('STREAM_MATCH_WORKERS', 2))
+ZIP_QUEUE_SIZE = 2
+ARTICLE_QUEUE_SIZE = 500
+
+_DONE = object()
+
+
+def stream_matches(search_terms: List[str], zip_source: Iterable[str] = None,
+                   extract_dir="extracted", stats: Dict = None, term_scopes: Dict = None) -> List[Dict]:
+    """
+    Find matches with download, extraction and matching overlapped.
+
+    Args:
+        search_terms (list): Terms to search for.
+        zip_source (iterable): ZIP paths in download order. Defaults to
+            download.iter_dou_xml(), which yields each section as it lands.
+        extract_dir (str): Base directory for extracted XML files.
+        stats (dict): If given, filled with timings (seconds since start):
+            first_match, download_done, extract_done, total, plus counts.
+        term_scopes (dict): Per-term sections/category (see scopes.py).
+
+    Returns:
+        list: Matches as returned by search.match_articles, in arrival order.
+    """
+    from extract import iter_zip_articles
+    from search import match_article, finalize_matches
+    from scopes import applicable_terms
+    from prefilter import TermPrefilter
+
+    if zip_source is None:
+        from download import iter_dou_xml
+        zip_source = iter_dou_xml(max_fallback_days=2)
+
+    stats = stats if stats is not None else {}
+    prefilter = TermPrefilter(search_terms)
+    stats.update({'zip_files': 0, 'articles': 0, 'articles_skipped': 0, 'matches': 0, 'first_match': None})
+    zip_queue = queue.Queue(maxsize=ZIP_QUEUE_SIZE)
+    article_queue = queue.Queue(maxsize=ARTICLE_QUEUE_SIZE)
+    sequence = itertools.count()
+    matches = []
+    errors = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def elapsed():
+        return round(time.perf_counter() - started, 3)
+
+    def download():
+        try:
+            for zip_path in zip_source:
+                stats['zip_files'] += 1
+                logger.info(f"Section ready at {elapsed()}s: {zip_path}")
+                zip_queue.put(zip_path)
+        except Exception as e:
+            logger.error(f"Streaming download failed: {e}")
+            errors.append(e)
+        finally:
+            stats['download_done'] = elapsed()
+            for _ in range(STREAM_EXTRACT_WORKERS):
+                zip_queue.put(_DONE)
+
+    def extract():
+        while True:
+            zip_path = zip_queue.get()
+            if zip_path is _DONE:
+                return
+            date_dir = Path(extract_dir) / Path(zip_path).parent.name
+            date_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                for article in iter_zip_articles(zip_path, date_dir, extract_dir, prefilter):
+                    article_queue.put((next(sequence), article))
+            except Exception as e:
+                logger.error(f"Error extracting {zip_path}: {e}")
+
+    def match():
+        while True:
+            item = article_queue.get()
+            if item is _DONE:
+                return
+            seq, article = item
+            terms = applicable_terms(article, search_terms, term_scopes)
+            try:
+                result = match_article(article, terms) if terms else None
+            except Exception as e:
+                logger.error(f"Error matching {article.get('filename')}: {e}")
+                continue
+            with lock:
+                stats['articles'] += 1
+                if not terms:
+                    stats['articles_skipped'] += 1
+                if result:
+                    if stats['first_match'] is None:
+                        stats['first_match'] = elapsed()
+                    matches.append((seq, result))
+
+    downloader = threading.Thread(target=download, name='stream-download', daemon=True)
+    extractors = [threading.Thread(target=extract, name=f'stream-extract-{i}', daemon=True)
+                  for i in range(STREAM_EXTRACT_WORKERS)]
+    matchers = [threading.Thread(target=match, name=f'stream-match-{i}', daemon=True)
+                for i in range(STREAM_MATCH_WORKERS)]
+    for thread in [downloader] + extractors + matchers:
+        thread.start()
+
+    downloader.join()
+    for thread in extractors:
+        thread.join()
+    stats['extract_done'] = elapsed()
+    for _ in matchers:
+        article_queue.put(_DONE)
+    for thread in matchers:
+        thread.join()
+
+    if errors and not stats['zip_files']:
+        raise errors[0]
+
+    matches.sort(key=lambda item: item[0])
+    result = finalize_matches([m for _, m in matches])
+    stats['matches'] = len(result)
+    stats['xml_prefiltered'] = prefilter.stats['skipped']
+    stats['total'] = elapsed()
+    logger.info(f"Streaming run finished: {stats}")
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+    try:
+        from search import get_search_terms_from_db
+        terms = sys.argv[1:] or get_search_terms_from_db()
+        run_stats = {}
+        found = stream_matches(terms, stats=run_stats)
+        print(f"{len(found)} matches. Stats: {run_stats}")
+    except Exception as e:
+        logger.error(f"Main execution error: {e}")
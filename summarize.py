@@ -1,12 +1,31 @@
 import os
+import time
 from dotenv import load_dotenv
 from openai import OpenAI
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 load_dotenv()
 
 client = None
 
+# Per-run summarization budget (0 disables the corresponding limit)
+SUMMARY_MAX_SECONDS = float(os.getenv('SUMMARY_MAX_SECONDS', 120))
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', 60000))
+
+# Prompt truncation and completion cap used by generate_summary
+PROMPT_CHARS = 4000
+MAX_COMPLETION_TOKENS = 300
+
+# Relative weight of each DOU section when ranking matches
+SECTION_WEIGHTS = {
+    'DO1': 1.0,
+    'DO1E': 0.9,
+    'DO2': 0.6,
+    'DO2E': 0.5,
+    'DO3': 0.4,
+    'DO3E': 0.3,
+}
+
 
 def get_client():
     global client
@@ -39,30 +58,126 @@ def get_client():
     return client
 
 
-def generate_summary(match: Dict, use_ai: bool = True) -> str:
+class SummaryBudget:
+    """
+    Time and token allowance shared by all AI summaries of a single run.
+
+    Matches that do not fit in the remaining budget get the snippet fallback
+    instead of an OpenAI call. A run split across invocations saves
+    as_dict() with its progress and continues with from_dict().
+    """
+
+    def __init__(self, max_seconds: float = SUMMARY_MAX_SECONDS, max_tokens: int = SUMMARY_MAX_TOKENS):
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.tokens_used = 0
+        self.ai_summaries = 0
+        self.fallback_summaries = 0
+        self.started_at = None
+        # Seconds spent by earlier invocations of the same run
+        self.seconds_before = 0.0
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'SummaryBudget':
+        """Continue a budget saved with as_dict()."""
+        budget = cls(state['max_seconds'], state['max_tokens'])
+        budget.seconds_before = state['seconds_used']
+        budget.tokens_used = state['tokens_used']
+        budget.ai_summaries = state['ai_summaries']
+        budget.fallback_summaries = state['fallback_summaries']
+        return budget
+
+    def start(self):
+        """Start the clock on first use; later calls keep the original start."""
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return self.seconds_before
+        return self.seconds_before + time.monotonic() - self.started_at
+
+    def allows(self, estimated_tokens: int) -> bool:
+        """Check whether another AI summary of estimated_tokens still fits."""
+        if self.max_seconds and self.elapsed() >= self.max_seconds:
+            return False
+        if self.max_tokens and self.tokens_used + estimated_tokens > self.max_tokens:
+            return False
+        return True
+
+    def charge(self, tokens: int):
+        self.tokens_used += tokens
+        self.ai_summaries += 1
+
+    def as_dict(self) -> Dict:
+        return {
+            'max_seconds': self.max_seconds,
+            'max_tokens': self.max_tokens,
+            'seconds_used': round(self.elapsed(), 2),
+            'tokens_used': self.tokens_used,
+            'ai_summaries': self.ai_summaries,
+            'fallback_summaries': self.fallback_summaries,
+        }
+
+
+def estimate_tokens(match: Dict) -> int:
+    """Rough token cost of summarizing a match (~4 chars per token plus completion)."""
+    prompt_chars = min(len(match['article']['text']), PROMPT_CHARS) + 300
+    return prompt_chars // 4 + MAX_COMPLETION_TOKENS
+
+
+def relevance_score(match: Dict) -> float:
+    """
+    Rank a match by number of distinct terms, hit density and DOU section.
+
+    Returns:
+        float: Higher means more relevant.
+    """
+    text_lower = match['article']['text'].lower()
+    terms = {term.lower() for term in match['terms_matched']}
+    hits = sum(text_lower.count(term) for term in terms)
+    # Hits per 1000 characters, capped so long lists of hits don't dominate
+    density = min(hits * 1000 / max(len(text_lower), 1), 10.0)
+    section_weight = SECTION_WEIGHTS.get(match['article'].get('section', ''), 0.2)
+    return len(terms) * 10 + density + section_weight * 5
+
+
+def snippet_summary(match: Dict) -> str:
+    """Simple summary built from the match snippets, used when AI is unavailable."""
+    terms = ', '.join(match['terms_matched'])
+    return f"Resumo simples: Encontrado em {match['article']['filename']} ({match['article']['section']}):\nTermos: {terms}\nTrechos: {'. '.join(match['snippets'][:3])}"
+
+
+def generate_summary(match: Dict, use_ai: bool = True, budget: Optional[SummaryBudget] = None) -> str:
     """
     Generate an elaborated summary for a matching article using OpenAI.
 
     Args:
         match (Dict): Match dict with 'article', 'terms_matched', 'snippets'.
         use_ai (bool): Whether to use AI for summary. Defaults to True.
+        budget (SummaryBudget): Run budget to check and charge. None means unlimited.
 
     Returns:
-        str: Summary text (or fallback if API fails or disabled).
+        str: Summary text (or fallback if API fails, disabled or over budget).
     """
     article_text = match['article']['text']
     terms = ', '.join(match['terms_matched'])
 
     if not use_ai:
         # Simple fallback summary
-        fallback = f"Resumo simples: Encontrado em {match['article']['filename']} ({match['article']['section']}):\nTermos: {terms}\nTrechos: {'. '.join(match['snippets'][:3])}"
-        return fallback
+        return snippet_summary(match)
 
     client = get_client()
     if not client:
         # Fallback to simple summary using snippets
-        fallback = f"Resumo simples: Encontrado em {match['article']['filename']} ({match['article']['section']}):\nTermos: {terms}\nTrechos: {'. '.join(match['snippets'][:3])}"
-        return fallback
+        return snippet_summary(match)
+
+    estimated_tokens = estimate_tokens(match)
+    if budget is not None:
+        budget.start()
+        if not budget.allows(estimated_tokens):
+            budget.fallback_summaries += 1
+            return snippet_summary(match)
 
     try:
         response = client.chat.completions.create(
@@ -75,34 +190,51 @@ def generate_summary(match: Dict, use_ai: bool = True) -> str:
                 {
                     "role": "user",
                     # Truncate to fit token limit
-                    "content": f"Resuma o seguinte artigo do DOU, enfatizando menções aos termos '{terms}':\n\n{article_text[:4000]}"
+                    "content": f"Resuma o seguinte artigo do DOU, enfatizando menções aos termos '{terms}':\n\n{article_text[:PROMPT_CHARS]}"
                 }
             ],
-            max_tokens=300,
+            max_tokens=MAX_COMPLETION_TOKENS,
             temperature=0.3
         )
         summary = response.choices[0].message.content.strip()
+        if budget is not None:
+            usage = getattr(response, 'usage', None)
+            budget.charge(getattr(usage, 'total_tokens', None) or estimated_tokens)
         return summary
     except Exception as e:
         print(f"OpenAI API error: {e}")
+        if budget is not None:
+            budget.fallback_summaries += 1
         # Fallback
         fallback = f"Resumo indisponível (erro API): Encontrado em {match['article']['filename']}.\nTermos: {terms}\nTrechos: {'. '.join(match['snippets'][:3])}"
         return fallback
 
 
-def summarize_matches(matches: List[Dict], use_ai: bool = True) -> List[Dict]:
+def summarize_matches(matches: List[Dict], use_ai: bool = True,
+                      budget: Optional[SummaryBudget] = None) -> List[Dict]:
     """
     Generate summaries for all matches.
 
+    Matches are summarized in order of relevance, so when the run budget
+    runs out it is the least relevant ones that fall back to snippets.
+
     Args:
         matches (List[Dict]): List of match dicts from search.
         use_ai (bool): Whether to use AI for summaries. Defaults to True.
+        budget (SummaryBudget): Run budget. Defaults to a new one built from
+            SUMMARY_MAX_SECONDS / SUMMARY_MAX_TOKENS.
 
     Returns:
-        List[Dict]: Matches with added 'summary' key.
+        List[Dict]: Matches (original order) with added 'summary' and 'relevance' keys.
     """
+    if budget is None:
+        budget = SummaryBudget()
+
     for match in matches:
-        match['summary'] = generate_summary(match, use_ai=use_ai)
+        match['relevance'] = round(relevance_score(match), 2)
+
+    for match in sorted(matches, key=lambda m: m['relevance'], reverse=True):
+        match['summary'] = generate_summary(match, use_ai=use_ai, budget=budget)
     return matches
 
 
@@ -0,0 +1,175 @@
+"""
+Single-pass reader for DOU ZIPs.
+
+The central directory is read once. Non-XML members (images attached to
+some editions) are skipped without reading their bytes. The compressed
+bytes of each XML member are read sequentially, and inflated on a thread
+pool: zlib releases the GIL, so members of one ZIP decompress in parallel.
+CRCs are checked as zipfile.ZipFile.read would.
+
+Members come out in archive order with at most 2 x workers of them in flight,
+so memory stays bounded on large editions. Counts, compressed and
+uncompressed bytes, and inflate timings are collected in the same pass.
+
+A corrupt member (bad CRC or local header) is logged and skipped; the
+rest of the ZIP is still read.
+"""
+
+import io
+import logging
+import os
+import struct
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+# Plain logging: imported by the serverless api/ handlers
+logger = logging.getLogger('zipreader')
+
+ZIP_INFLATE_WORKERS = int(os.getenv('ZIP_INFLATE_WORKERS', 4))
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')  # zipfile.structFileHeader
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+def new_stats() -> Dict:
+    return {
+        'zip_files': 0,
+        'members': 0,
+        'xml_members': 0,
+        'skipped_members': 0,
+        'skipped_bytes': 0,
+        'bad_members': 0,
+        'compressed_bytes': 0,
+        'uncompressed_bytes': 0,
+        'inflate_seconds': 0.0,
+        'slowest_member': None,
+        'slowest_member_seconds': 0.0,
+    }
+
+
+def add_stats(total: Dict, stats: Dict) -> Dict:
+    """Add one ZIP's stats to a running total (both from new_stats())."""
+    for key, value in stats.items():
+        if key == 'slowest_member':
+            continue
+        if key == 'slowest_member_seconds':
+            if value > total[key]:
+                total['slowest_member'], total[key] = stats['slowest_member'], value
+            continue
+        total[key] += value
+    return total
+
+
+def _read_compressed(fp, info: zipfile.ZipInfo) -> bytes:
+    """Compressed bytes of a member, located through its local header."""
+    fp.seek(info.header_offset)
+    header = fp.read(_LOCAL_HEADER.size)
+    fields = _LOCAL_HEADER.unpack(header)
+    if fields[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    name_length, extra_length = fields[-2], fields[-1]
+    fp.seek(info.header_offset + _LOCAL_HEADER.size + name_length + extra_length)
+    return fp.read(info.compress_size)
+
+
+def _inflate(info: zipfile.ZipInfo, data: bytes) -> Tuple[bytes, float]:
+    start = time.perf_counter()
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        content = zlib.decompress(data, -15)
+    else:
+        content = data
+    if zlib.crc32(content) != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+    return content, time.perf_counter() - start
+
+
+def iter_xml_members(source, workers: int = ZIP_INFLATE_WORKERS, stats: Dict = None,
+                     timings: List = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yield (name, content) for every XML member of a ZIP, in archive order.
+
+    Args:
+        source: ZIP path, or the ZIP's bytes.
+        workers (int): Inflate threads (1 = inflate on the calling thread).
+        stats (dict): If given (see new_stats()), counts and timings are added
+            to it, so one dict can total several ZIPs.
+        timings (list): If given, (name, compressed, uncompressed, seconds) is
+            appended for each XML member.
+
+    Corrupt members are logged, counted in stats['bad_members'] and skipped.
+
+    Raises:
+        zipfile.BadZipFile: Unreadable archive (e.g. no central directory).
+    """
+    stats = stats if stats is not None else new_stats()
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, 'rb')
+    try:
+        with zipfile.ZipFile(fp) as zf:
+            infos = zf.infolist()
+            stats['zip_files'] += 1
+            stats['members'] += len(infos)
+
+            xml_infos = []
+            for info in infos:
+                if info.filename.endswith('.xml'):
+                    xml_infos.append(info)
+                else:
+                    stats['skipped_members'] += 1
+                    stats['skipped_bytes'] += info.compress_size
+            stats['xml_members'] += len(xml_infos)
+
+            def start(info, executor):
+                try:
+                    # Encrypted members or unusual methods go through zipfile
+                    if info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                        begin = time.perf_counter()
+                        content = zf.read(info)
+                        return content, time.perf_counter() - begin
+                    data = _read_compressed(fp, info)
+                    return executor.submit(_inflate, info, data) if executor else _inflate(info, data)
+                except Exception as e:
+                    return e
+
+            def finish(info, result):
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    content, seconds = result if isinstance(result, tuple) else result.result()
+                except Exception as e:
+                    stats['bad_members'] += 1
+                    logger.error(f"Skipping corrupt member {info.filename}: {e}")
+                    return None
+                stats['compressed_bytes'] += info.compress_size
+                stats['uncompressed_bytes'] += len(content)
+                stats['inflate_seconds'] += seconds
+                if seconds > stats['slowest_member_seconds']:
+                    stats['slowest_member'], stats['slowest_member_seconds'] = info.filename, seconds
+                if timings is not None:
+                    timings.append((info.filename, info.compress_size, len(content), seconds))
+                return info.filename, content
+
+            if workers <= 1:
+                for info in xml_infos:
+                    member = finish(info, start(info, None))
+                    if member:
+                        yield member
+                return
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zip-inflate') as executor:
+                pending = deque()
+                for info in xml_infos:
+                    pending.append((info, start(info, executor)))
+                    if len(pending) >= workers * 2:
+                        member = finish(*pending.popleft())
+                        if member:
+                            yield member
+                while pending:
+                    member = finish(*pending.popleft())
+                    if member:
+                        yield member
+    finally:
+        fp.close()
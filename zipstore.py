@@ -0,0 +1,245 @@
+"""
+Verified, content-addressed store for downloaded DOU ZIPs.
+
+A ZIP only counts as valid once it has the PK signature and its central
+directory opens, so truncated downloads and HTML error pages saved as .zip
+are rejected instead of failing later inside zipfile. Member CRCs are not
+checked here, which would inflate every ZIP twice: zipreader checks them
+while extracting, and extraction discards a ZIP with corrupt members
+(ZipStore.discard) so it is downloaded again.
+
+Verified files are recorded in downloads/zip_manifest.json with their
+SHA-256, size and modification time. Later runs trust a manifest entry as
+long as size and mtime still match, without reading the file again.
+
+Content lives once under downloads/.store/<sha256>.zip; the dated paths the
+pipeline uses (downloads/<date>/<date>-<section>.zip) are hard links to it,
+so identical editions (e.g. an extra edition republished unchanged, or the
+same date fetched by backfill and the daily run) take the space of one.
+Where hard links aren't supported the file is copied instead.
+
+The manifest is a cache: if it is lost or out of date, files are simply
+verified again.
+
+Usage:
+    python zipstore.py --verify   # re-verify every ZIP under downloads/, CRCs included
+    python zipstore.py --prune    # delete stored content no dated path uses
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import zipfile
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# Plain logging (not logging_config): api/ handlers import verify_zip_bytes
+# and can't create logs/ on a read-only filesystem
+logger = logging.getLogger('zipstore')
+
+MANIFEST_NAME = 'zip_manifest.json'
+STORE_DIR_NAME = '.store'
+
+
+def verify_zip_bytes(data: bytes, full: bool = False) -> Tuple[bool, Optional[str]]:
+    """
+    Check a ZIP's signature and central directory, without inflating it.
+
+    Args:
+        full (bool): Also inflate every member and check its CRC.
+
+    Returns:
+        tuple: (True, None) if valid, else (False, reason).
+    """
+    if not data.startswith(b'PK'):
+        return False, 'not a ZIP (no PK signature)'
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            bad_member = zf.testzip() if full else None
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError, OSError, ValueError) as e:
+        return False, f'unreadable ZIP: {e}'
+    if bad_member is not None:
+        return False, f'bad CRC in {bad_member}'
+    return True, None
+
+
+class ZipStore:
+    """Verified ZIPs under one download directory (see module docstring)."""
+
+    def __init__(self, download_dir="downloads"):
+        self.root = Path(download_dir)
+        self.manifest_path = self.root / MANIFEST_NAME
+        self.store_dir = self.root / STORE_DIR_NAME
+        self._lock = threading.Lock()
+        try:
+            self.manifest: Dict[str, Dict] = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.manifest = {}
+        self.stats = {'trusted': 0, 'verified': 0, 'rejected': 0, 'stored': 0, 'deduplicated': 0}
+
+    def _key(self, path: Path) -> str:
+        try:
+            return Path(path).resolve().relative_to(self.root.resolve()).as_posix()
+        except ValueError:
+            return Path(path).resolve().as_posix()
+
+    def _save_manifest(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps(self.manifest, indent=1, sort_keys=True), encoding='utf-8')
+        tmp_path.replace(self.manifest_path)
+
+    def _record(self, path: Path, sha256: str, validators: Dict = None):
+        stat = path.stat()
+        entry = {
+            'sha256': sha256,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'verified_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        entry.update({k: v for k, v in (validators or {}).items() if v})
+        with self._lock:
+            self.manifest[self._key(path)] = entry
+            self._save_manifest()
+
+    def validators(self, path) -> Dict:
+        """HTTP validators ('etag', 'last_modified') recorded when path was downloaded."""
+        entry = self.manifest.get(self._key(Path(path)), {})
+        return {k: entry[k] for k in ('etag', 'last_modified') if k in entry}
+
+    def _forget(self, path: Path):
+        with self._lock:
+            if self.manifest.pop(self._key(path), None) is not None:
+                self._save_manifest()
+
+    def _link(self, path: Path, data: bytes, sha256: str):
+        """Place data at path, sharing the stored copy when the content is already known."""
+        blob = self.store_dir / f"{sha256}.zip"
+        if blob.exists():
+            self.stats['deduplicated'] += 1
+        else:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            tmp_blob = blob.with_suffix(f'.{threading.get_ident()}.tmp')
+            tmp_blob.write_bytes(data)
+            tmp_blob.replace(blob)
+            self.stats['stored'] += 1
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            shutil.copyfile(blob, tmp_path)
+        tmp_path.replace(path)
+
+    def put(self, path, data: bytes, validators: Dict = None) -> Tuple[bool, Optional[str]]:
+        """
+        Verify downloaded bytes and, if valid, store them at path.
+
+        Args:
+            path: Dated path of the ZIP.
+            data (bytes): Downloaded content.
+            validators (dict): 'etag' / 'last_modified' response headers, kept
+                in the manifest to revalidate the file later.
+
+        Returns:
+            tuple: (True, None) if stored, else (False, reason); invalid data
+                is not written.
+        """
+        path = Path(path)
+        ok, reason = verify_zip_bytes(data)
+        if not ok:
+            self.stats['rejected'] += 1
+            logger.warning(f"Rejected download for {path.name}: {reason}")
+            return False, reason
+        sha256 = hashlib.sha256(data).hexdigest()
+        self._link(path, data, sha256)
+        self._record(path, sha256, validators)
+        return True, None
+
+    def is_valid(self, path, full: bool = False) -> bool:
+        """
+        Whether path holds a verified ZIP.
+
+        Trusts the manifest while size and mtime match; otherwise reads and
+        verifies the file (see verify_zip_bytes), adopting it into the store
+        if valid. Invalid files are deleted so the next download fetches them again.
+        """
+        path = Path(path)
+        try:
+            stat = path.stat()
+        except OSError:
+            self._forget(path)
+            return False
+
+        entry = self.manifest.get(self._key(path))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            self.stats['trusted'] += 1
+            return True
+
+        data = path.read_bytes()
+        ok, reason = verify_zip_bytes(data, full=full)
+        if not ok:
+            self.discard(path, reason)
+            return False
+
+        self.stats['verified'] += 1
+        sha256 = hashlib.sha256(data).hexdigest()
+        self._link(path, data, sha256)
+        self._record(path, sha256)
+        return True
+
+    def discard(self, path, reason: str):
+        """Forget and delete a corrupt ZIP so the next download fetches it again."""
+        path = Path(path)
+        self.stats['rejected'] += 1
+        logger.warning(f"Corrupt ZIP {path} ({reason}); deleting so it is downloaded again.")
+        self._forget(path)
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def prune(self) -> int:
+        """Delete stored content no dated path links to any more. Returns the count."""
+        in_use = {entry['sha256'] for key, entry in self.manifest.items() if (self.root / key).exists()}
+        removed = 0
+        for blob in self.store_dir.glob('*.zip'):
+            if blob.stem not in in_use:
+                blob.unlink()
+                removed += 1
+        logger.info(f"Pruned {removed} unused stored ZIP(s).")
+        return removed
+
+
+_stores: Dict[str, ZipStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(download_dir="downloads") -> ZipStore:
+    """Shared ZipStore for a download directory."""
+    key = str(Path(download_dir).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ZipStore(download_dir)
+        return _stores[key]
+
+
+if __name__ == "__main__":
+    store = get_store()
+    if '--verify' in sys.argv:
+        store.manifest = {}
+        paths = [p for p in store.root.glob('*/*.zip') if p.parent.name != STORE_DIR_NAME]
+        valid = sum(store.is_valid(p, full=True) for p in paths)
+        print(f"{valid} of {len(paths)} ZIP(s) valid. {store.stats}")
+    elif '--prune' in sys.argv:
+        print(f"{store.prune()} stored ZIP(s) removed.")
+    else:
+        print(__doc__)